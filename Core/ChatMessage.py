@@ -34,6 +34,8 @@ _rawmsg: 原始消息对象
 
 
 class ChatMessage(object):
+    __slots__ = ()  # 字段由子类以__slots__声明，消息对象不带__dict__
+
     msg_id = None
     create_time = None
 
@@ -1,272 +1,379 @@
 import base64
 import re
-import uuid
+import threading
+import time
 import xml.etree.ElementTree as ET
 
 import requests
 from gewechat.client import GewechatClient
 
 from Core.ChatMessage import ChatMessage
+from Core.contact_cache import ContactCache
 from Core.Logger import Logger
 from Core.bridge.context import ContextType
+from Core.bridge.message_filter import is_at_user, is_non_user_message, parse_msg_source
 from Core.bridge.temp_dir import TmpDir
-# 暂时注释掉这个导入，避免循环导入
-# from config import Config
+from Core.bridge.temp_files import TempFileManager
 
-# 不在模块级别创建Config实例
-# conf = Config(file_path='./config.json')
 logger = logging = Logger()
 
+_UNSET = object()  # 惰性字段尚未解析
+
+NOTES_JOIN_GROUP = ["加入群聊", "加入了群聊", "invited", "joined"]  # 可通过添加对应语言的加入群聊通知中的关键词适配更多
+NOTES_BOT_JOIN_GROUP = ["邀请你", "invited you", "You've joined", "你通过扫描"]
+
 
 class GeWeChatMessage(ChatMessage):
-    def __init__(self, msg, client: GewechatClient):
+    """
+    gewechat回调消息
+    构造时只读取原始JSON中的字段（消息ID、收发者、消息类型等），不做任何I/O；
+    昵称、群成员名称、是否被@、引用/分享消息的XML解析、语音数据等在首次访问时才解析并缓存。
+    构造耗时与各惰性字段的解析次数可以通过 GeWeChatMessage.stats() 查看。
+    """
+
+    __slots__ = (
+        "_rawmsg", "_prepare_fn", "_prepared",
+        "msg", "client", "msg_id", "create_time", "is_group", "my_msg",
+        "from_user_id", "from_user_nickname", "to_user_id", "to_user_nickname",
+        "other_user_id", "self_display_name", "at_list",
+        "_msg_type", "_app_id", "_download_url", "_ctype", "_content", "_other_user_nickname",
+        "_actual_user_id", "_actual_user_nickname", "_is_at", "_voice_data",
+        "_content_root", "_msg_source_root",
+    )
+
+    _stats_lock = threading.Lock()
+    _constructed = 0
+    _construct_ns = 0
+    _resolved = {}  # 惰性字段名 -> 解析次数
+
+    def __init__(self, msg, client: GewechatClient, app_id=None, download_url=None):
+        """
+        Args:
+            msg: 回调的JSON字典
+            client: gewechat客户端
+            app_id: 当前登录的appId（由Query从通道配置传入）
+            download_url: gewechat文件下载服务地址（配置项gewechat_download_url），下载语音和图片时使用
+        """
+        started_at = time.perf_counter_ns()
         super().__init__(msg)
         self.msg = msg
+        self.client = client
+        self._app_id = app_id
+        self._download_url = download_url
+        self._prepare_fn = None
+        self._prepared = False
+
+        self.msg_id = None
         self.create_time = msg.get('Data', {}).get('CreateTime', 0)
-        if not msg.get('Data'):
+        self.is_group = False
+        self.my_msg = False
+        self.from_user_id = self.from_user_nickname = None
+        self.to_user_id = self.to_user_nickname = None
+        self.other_user_id = None
+        self.self_display_name = None
+        self.at_list = None
+        self._msg_type = None
+
+        self._ctype = self._content = _UNSET
+        self._other_user_nickname = self._actual_user_id = self._actual_user_nickname = _UNSET
+        self._is_at = self._voice_data = _UNSET
+        self._content_root = self._msg_source_root = _UNSET
+
+        try:
+            self._parse(msg)
+        finally:
+            elapsed = time.perf_counter_ns() - started_at
+            with GeWeChatMessage._stats_lock:
+                GeWeChatMessage._constructed += 1
+                GeWeChatMessage._construct_ns += elapsed
+
+    def _parse(self, msg):
+        """只解析原始字段，消息内容等在访问时再处理"""
+        data = msg.get('Data')
+        if not data:
             logger.warning(f"[gewechat] Missing 'Data' in message")
+            self._ctype = self._content = None
             return
-        if 'NewMsgId' not in msg['Data']:
+        if 'NewMsgId' not in data:
             logger.warning(f"[gewechat] Missing 'NewMsgId' in message data")
+            self._ctype = self._content = None
             return
-        self.msg_id = msg['Data']['NewMsgId']
-        self.is_group = True if "@chatroom" in msg['Data']['FromUserName']['string'] else False
-
-        notes_join_group = ["加入群聊", "加入了群聊", "invited", "joined"]  # 可通过添加对应语言的加入群聊通知中的关键词适配更多
-        notes_bot_join_group = ["邀请你", "invited you", "You've joined", "你通过扫描"]
-
-        self.client = client
-        msg_type = msg['Data']['MsgType']
-        
-        # 在需要时导入Config并创建实例
-        from config import Config
-        conf = Config(file_path='./config.json', is_init=True)
-        self.app_id = conf.get("gewechat_app_id")
-
-        self.from_user_id = msg['Data']['FromUserName']['string']
-        self.to_user_id = msg['Data']['ToUserName']['string']
+        self.msg_id = data['NewMsgId']
+        self.from_user_id = data['FromUserName']['string']
+        self.to_user_id = data['ToUserName']['string']
         self.other_user_id = self.from_user_id
+        self.is_group = "@chatroom" in self.from_user_id
+        self.my_msg = msg.get('Wxid') == self.from_user_id  # 消息是否来自自己
+        msg_type = self._msg_type = data['MsgType']
 
         # 检查是否是公众号等非用户账号的消息
-        if self._is_non_user_message(msg['Data'].get('MsgSource', ''), self.from_user_id):
-            self.ctype = ContextType.NON_USER_MSG
-            self.content = msg['Data']['Content']['string']
-            logger.debug(f"[gewechat] detected non-user message from {self.from_user_id}: {self.content}")
+        if self._is_non_user_message(data.get('MsgSource', ''), self.from_user_id):
+            self._ctype = ContextType.NON_USER_MSG
+            self._content = data['Content']['string']
             return
 
         if msg_type == 1:  # Text message
-            self.ctype = ContextType.TEXT
-            self.content = msg['Data']['Content']['string']
+            self._ctype = ContextType.TEXT
         elif msg_type == 34:  # Voice message
-            self.ctype = ContextType.VOICE
-            if 'ImgBuf' in msg['Data'] and 'buffer' in msg['Data']['ImgBuf'] and msg['Data']['ImgBuf']['buffer']:
-                silk_data = base64.b64decode(msg['Data']['ImgBuf']['buffer'])
-                silk_file_name = f"voice_{str(uuid.uuid4())}.silk"
-                silk_file_path = TmpDir().path() + silk_file_name
-                with open(silk_file_path, "wb") as f:
-                    f.write(silk_data)
-                # TODO: silk2mp3
-                self.content = silk_file_path
+            # content为语音消息的XML，SILK数据在访问voice_data时才解码
+            self._ctype = ContextType.VOICE
+            if not data.get('ImgBuf', {}).get('buffer'):
+                # 回调中没有附带语音数据时，需要通过接口下载
+                self._voice_data = None
+                self._prepare_fn = self.download_voice
         elif msg_type == 3:  # Image message
-            self.ctype = ContextType.IMAGE
-            self.content = TmpDir().path() + str(self.msg_id) + ".png"
+            self._ctype = ContextType.IMAGE
             self._prepare_fn = self.download_image
-        elif msg_type == 49:  # 引用消息，小程序，公众号等
-            # After getting content_xml
-            content_xml = msg['Data']['Content']['string']
-            # Find the position of '<?xml' declaration and remove any prefix
-            xml_start = content_xml.find('<?xml version=')
-            if xml_start != -1:
-                content_xml = content_xml[xml_start:]
-            # Now parse the cleaned XML
-            root = ET.fromstring(content_xml)
-            appmsg = root.find('appmsg')
-
-            if appmsg is not None:
-                msg_type = appmsg.find('type')
-                if msg_type is not None and msg_type.text == '57':  # 引用消息
-                    self.ctype = ContextType.TEXT
-                    refermsg = appmsg.find('refermsg')
-                    if refermsg is not None:
-                        displayname = refermsg.find('displayname').text
-                        quoted_content = refermsg.find('content').text
-                        title = appmsg.find('title').text
-                        self.content = f"「{displayname}: {quoted_content}」----------\n{title}"
-                    else:
-                        self.content = content_xml
-                elif msg_type is not None and msg_type.text == '5':  # 可能是公众号文章
-                    title = appmsg.find('title').text if appmsg.find('title') is not None else "无标题"
-                    if "加入群聊" in title:
-                        # 群聊邀请消息
-                        self.ctype = ContextType.TEXT
-                        self.content = content_xml
-                    else:
-                        # 公众号文章
-                        self.ctype = ContextType.SHARING
-                        url = appmsg.find('url').text if appmsg.find('url') is not None else ""
-                        self.content = url
-
-                else:  # 其他消息类型，暂时不解析，直接返回XML
-                    self.ctype = ContextType.TEXT
-                    self.content = content_xml
-            else:
-                self.ctype = ContextType.TEXT
-                self.content = content_xml
         elif msg_type == 51:
             # msg_type = 51 表示状态同步消息，目前测试出来的情况有:
             # 1. 打开/退出某个聊天窗口
             # 是微信客户端的状态同步消息，可以忽略
-            self.ctype = ContextType.STATUS_SYNC
-            self.content = msg['Data']['Content']['string']
-            return
+            self._ctype = ContextType.STATUS_SYNC
+            self._content = data['Content']['string']
+        elif msg_type == 47:
+            self._ctype = ContextType.EMOJI
+        elif msg_type == 49:  # 引用消息，小程序，公众号等，类型需要解析XML，在访问ctype时处理
+            pass
         elif msg_type == 10002:  # Group System Message
             if self.is_group:
-                content = msg['Data']['Content']['string']
-                if any(note_bot_join_group in content for note_bot_join_group in notes_bot_join_group):  # 邀请机器人加入群聊
-                    logger.warning("机器人加入群聊消息，不处理~")
-                    pass
-                elif any(note_join_group in content for note_join_group in
-                         notes_join_group):  # 若有任何在notes_join_group列表中的字符串出现在NOTE中
-                    try:
-                        # Extract the XML part after the chatroom ID
-                        xml_content = content.split(':\n', 1)[1] if ':\n' in content else content
-                        root = ET.fromstring(xml_content)
-
-                        # Navigate through the XML structure
-                        sysmsgtemplate = root.find('.//sysmsgtemplate')
-                        if sysmsgtemplate is not None:
-                            content_template = sysmsgtemplate.find('.//content_template')
-                            if content_template is not None and content_template.get('type') == 'tmpl_type_profile':
-                                template = content_template.find('.//template')
-                                if template is not None and '加入了群聊' in template.text:
-                                    self.ctype = ContextType.JOIN_GROUP
-
-                                    # Extract inviter info
-                                    inviter_link = root.find(".//link[@name='username']//nickname")
-                                    inviter_nickname = inviter_link.text if inviter_link is not None else "未知用户"
-
-                                    # Extract invited member info
-                                    invited_link = root.find(".//link[@name='names']//nickname")
-                                    invited_nickname = invited_link.text if invited_link is not None else "未知用户"
-
-                                    self.content = f'"{inviter_nickname}"邀请"{invited_nickname}"加入了群聊'
-                                    self.actual_user_nickname = invited_nickname
-                                    return
-
-                    except ET.ParseError as e:
-                        logger.error(f"[gewechat] Failed to parse group join XML: {e}")
-                        # Fall back to regular content handling
-                        pass
-        elif msg_type == 47:
-            self.ctype = ContextType.EMOJI
-            self.content = msg['Data']['Content']['string']
+                # 群成员可能发生变化，使群成员缓存失效
+                ContactCache.get_instance(self.client).invalidate_chatroom(self.from_user_id)
         else:
             raise NotImplementedError("Unsupported message type: Type:{}".format(msg_type))
 
-        # 获取群聊或好友的名称
-        brief_info_response = self.client.get_brief_info(self.app_id, [self.other_user_id])
-        if brief_info_response['ret'] == 200 and brief_info_response['data']:
-            brief_info = brief_info_response['data'][0]
-            self.other_user_nickname = brief_info.get('nickName', '')
-            if not self.other_user_nickname:
-                self.other_user_nickname = self.other_user_id
-
-        if self.is_group:
-            # 如果是群聊消息，获取实际发送者信息
-            # 群聊信息结构
-            """
-            {
-                "Data": {
-                    "Content": {
-                        "string": "wxid_xxx:\n@name msg_content" // 发送消息人的wxid和消息内容(包含@name)
-                    }
-                }
-            }
-            """
-            # 获取实际发送者wxid
-            self.actual_user_id = self.msg.get('Data', {}).get('Content', {}).get('string', '').split(':', 1)[
-                0]  # 实际发送者ID
-            # 从群成员列表中获取实际发送者信息
-            """
-            {
-                "ret": 200,
-                "msg": "操作成功",
-                "data": {
-                    "memberList": [
-                        {
-                            "wxid": "",
-                            "nickName": "朝夕。",
-                            "displayName": null,
-                        },
-                        {
-                            "wxid": "",
-                            "nickName": "G",
-                            "displayName": "G1",
-                        },
-                    ]
-                }
+    @classmethod
+    def stats(cls):
+        """构造次数、平均构造耗时和各惰性字段的解析次数"""
+        with cls._stats_lock:
+            return {
+                "constructed": cls._constructed,
+                "avg_construct_us": round(cls._construct_ns / cls._constructed / 1000, 2) if cls._constructed else 0,
+                "resolved": dict(cls._resolved),
             }
-            """
-            chatroom_member_list_response = self.client.get_chatroom_member_list(self.app_id, self.from_user_id)
-            if chatroom_member_list_response.get('ret', 0) == 200 and chatroom_member_list_response.get('data', {}).get(
-                    'memberList', []):
-                # 从群成员列表中匹配acual_user_id
-                for member_info in chatroom_member_list_response['data']['memberList']:
-                    if member_info['wxid'] == self.actual_user_id:
-                        # 先获取displayName，如果displayName为空，再获取nickName
-                        self.actual_user_nickname = member_info.get('displayName', '')
-                        if not self.actual_user_nickname:
-                            self.actual_user_nickname = member_info.get('nickName', '')
-                        break
-            # 如果actual_user_nickname为空，使用actual_user_id作为nickname
-            if not self.actual_user_nickname:
-                self.actual_user_nickname = self.actual_user_id
-
-            # 检查是否被at
-            # 群聊at结构
-            """
-            {
-                'Data': {
-                    'MsgSource': '<msgsource>\n\t<atuserlist><![CDATA[,wxid_xxx,wxid_xxx]]></atuserlist>\n\t<pua>1</pua>\n\t<silence>0</silence>\n\t<membercount>3</membercount>\n\t<signature>V1_cqxXBat9|v1_cqxXBat9</signature>\n\t<tmp_node>\n\t\t<publisher-id></publisher-id>\n\t</tmp_node>\n</msgsource>\n',
-                },
-            }
-            """
-            # 优先从MsgSource的XML中解析是否被at
-            msg_source = self.msg.get('Data', {}).get('MsgSource', '')
-            self.is_at = False
-            xml_parsed = False
-            if msg_source:
-                try:
-                    root = ET.fromstring(msg_source)
-                    atuserlist_elem = root.find('atuserlist')
-                    if atuserlist_elem is not None:
-                        atuserlist = atuserlist_elem.text
-                        self.is_at = self.to_user_id in atuserlist
-                        xml_parsed = True
-                        logger.debug(f"[gewechat] is_at: {self.is_at}. atuserlist: {atuserlist}")
-                except ET.ParseError:
-                    pass
-
-            # 只有在XML解析失败时才从PushContent中判断
-            if not xml_parsed:
-                self.is_at = '在群聊中@了你' in self.msg.get('Data', {}).get('PushContent', '')
-                logger.debug(f"[gewechat] Parse is_at from PushContent. self.is_at: {self.is_at}")
 
+    @classmethod
+    def _count_resolve(cls, field):
+        with cls._stats_lock:
+            cls._resolved[field] = cls._resolved.get(field, 0) + 1
+
+    # ---------------- 惰性字段 ----------------
+
+    @property
+    def app_id(self):
+        return self._app_id
+
+    @property
+    def ctype(self):
+        if self._ctype is _UNSET:
+            self._count_resolve("ctype")
+            if self._msg_type == 49:
+                self._resolve_appmsg()
+            elif self._msg_type == 10002:
+                self._resolve_group_system()
+        return self._ctype
+
+    @property
+    def content(self):
+        if self._content is _UNSET:
+            # 引用/分享消息和群系统消息的内容在解析类型时一并得到
+            self.ctype
+            if self._content is not _UNSET:
+                return self._content
+            self._count_resolve("content")
+            if self._msg_type == 3:
+                content = TmpDir().path() + str(self.msg_id) + ".png"
+            elif self._msg_type == 10002:
+                content = None
+            else:
+                content = self.msg['Data']['Content']['string']
+            self._content = self._strip_group_prefix(content)
+        return self._content
+
+    def _strip_group_prefix(self, content):
+        if self.is_group and content:
             # 如果是群消息，使用正则表达式去掉wxid前缀和@信息
-            self.content = re.sub(f'{self.actual_user_id}:\n', '', self.content)  # 去掉wxid前缀
-            self.content = re.sub(r'@[^\u2005]+\u2005', '', self.content)  # 去掉@信息
-        else:
-            # 如果不是群聊消息，保持结构统一，也要设置actual_user_id和actual_user_nickname
-            self.actual_user_id = self.other_user_id
-            self.actual_user_nickname = self.other_user_nickname
+            content = re.sub(f'{self.actual_user_id}:\n', '', content)  # 去掉wxid前缀
+            content = re.sub(r'@[^\u2005]+\u2005', '', content)  # 去掉@信息
+        return content
+
+    @property
+    def other_user_nickname(self):
+        if self._other_user_nickname is _UNSET:
+            self._count_resolve("other_user_nickname")
+            # 获取群聊或好友的名称（优先从缓存读取）
+            nickname = None
+            if self.other_user_id:
+                nickname = ContactCache.get_instance(self.client).get_nickname(self.app_id, self.other_user_id)
+            self._other_user_nickname = (nickname or self.other_user_id) if nickname is not None else None
+        return self._other_user_nickname
+
+    @property
+    def actual_user_id(self):
+        if self._actual_user_id is _UNSET:
+            if self.is_group:
+                # 群聊信息结构
+                """
+                {
+                    "Data": {
+                        "Content": {
+                            "string": "wxid_xxx:\n@name msg_content" // 发送消息人的wxid和消息内容(包含@name)
+                        }
+                    }
+                }
+                """
+                self._actual_user_id = self.msg.get('Data', {}).get('Content', {}).get('string', '').split(':', 1)[0]
+            else:
+                self._actual_user_id = self.other_user_id
+        return self._actual_user_id
+
+    @property
+    def actual_user_nickname(self):
+        if self._actual_user_nickname is _UNSET and self._msg_type == 10002:
+            # 成员加入群聊的通知中，实际发送者是被邀请的成员
+            self.ctype
+        if self._actual_user_nickname is _UNSET:
+            self._count_resolve("actual_user_nickname")
+            if not self.is_group:
+                self._actual_user_nickname = self.other_user_nickname
+            else:
+                # 群成员列表以 {wxid: 展示名} 索引缓存，展示名优先displayName，其次nickName
+                name = ContactCache.get_instance(self.client).get_member_name(self.app_id, self.from_user_id,
+                                                                              self.actual_user_id)
+                # 如果actual_user_nickname为空，使用actual_user_id作为nickname
+                self._actual_user_nickname = name or self.actual_user_id
+        return self._actual_user_nickname
+
+    @property
+    def is_at(self):
+        if self._is_at is _UNSET:
+            self._count_resolve("is_at")
+            self._is_at = self._resolve_is_at() if self.is_group else False
+        return self._is_at
+
+    @property
+    def voice_data(self):
+        if self._voice_data is _UNSET:
+            self._count_resolve("voice_data")
+            buffer = self.msg.get('Data', {}).get('ImgBuf', {}).get('buffer')
+            self._voice_data = base64.b64decode(buffer) if buffer else None
+        return self._voice_data
+
+    # ---------------- 解析 ----------------
+
+    def _content_xml(self):
+        """解析（并缓存）引用、分享等消息的XML，返回(根节点, 去掉前缀的XML文本)"""
+        content_xml = self.msg['Data']['Content']['string']
+        # Find the position of '<?xml' declaration and remove any prefix
+        xml_start = content_xml.find('<?xml version=')
+        if xml_start != -1:
+            content_xml = content_xml[xml_start:]
+        if self._content_root is _UNSET:
+            self._count_resolve("content_xml")
+            self._content_root = ET.fromstring(content_xml)
+        return self._content_root, content_xml
+
+    def _resolve_appmsg(self):
+        root, content_xml = self._content_xml()
+        appmsg = root.find('appmsg')
+        self._ctype = ContextType.TEXT
+        self._content = self._strip_group_prefix(content_xml)
+
+        if appmsg is None:
+            return
+        msg_type = appmsg.find('type')
+        if msg_type is not None and msg_type.text == '57':  # 引用消息
+            refermsg = appmsg.find('refermsg')
+            if refermsg is not None:
+                displayname = refermsg.find('displayname').text
+                quoted_content = refermsg.find('content').text
+                title = appmsg.find('title').text
+                self._content = self._strip_group_prefix(f"「{displayname}: {quoted_content}」----------\n{title}")
+        elif msg_type is not None and msg_type.text == '5':  # 可能是公众号文章
+            title = appmsg.find('title').text if appmsg.find('title') is not None else "无标题"
+            if "加入群聊" not in title:
+                # 公众号文章
+                self._ctype = ContextType.SHARING
+                self._content = self._strip_group_prefix(appmsg.find('url').text if appmsg.find('url') is not None else "")
+        # 群聊邀请消息和其他消息类型，暂时不解析，直接返回XML
+
+    def _resolve_group_system(self):
+        """群系统消息：识别成员加入群聊的通知"""
+        self._ctype = None
+        if not self.is_group:
+            return
+        content = self.msg['Data']['Content']['string']
+        if any(note_bot_join_group in content for note_bot_join_group in NOTES_BOT_JOIN_GROUP):  # 邀请机器人加入群聊
+            logger.warning("机器人加入群聊消息，不处理~")
+            return
+        if not any(note_join_group in content for note_join_group in NOTES_JOIN_GROUP):
+            return
+        try:
+            # Extract the XML part after the chatroom ID
+            xml_content = content.split(':\n', 1)[1] if ':\n' in content else content
+            root = ET.fromstring(xml_content)
+
+            # Navigate through the XML structure
+            sysmsgtemplate = root.find('.//sysmsgtemplate')
+            if sysmsgtemplate is None:
+                return
+            content_template = sysmsgtemplate.find('.//content_template')
+            if content_template is None or content_template.get('type') != 'tmpl_type_profile':
+                return
+            template = content_template.find('.//template')
+            if template is not None and '加入了群聊' in template.text:
+                self._ctype = ContextType.JOIN_GROUP
+
+                # Extract inviter info
+                inviter_link = root.find(".//link[@name='username']//nickname")
+                inviter_nickname = inviter_link.text if inviter_link is not None else "未知用户"
+
+                # Extract invited member info
+                invited_link = root.find(".//link[@name='names']//nickname")
+                invited_nickname = invited_link.text if invited_link is not None else "未知用户"
+
+                self._content = f'"{inviter_nickname}"邀请"{invited_nickname}"加入了群聊'
+                self._actual_user_nickname = invited_nickname
+        except ET.ParseError as e:
+            logger.error(f"[gewechat] Failed to parse group join XML: {e}")
+
+    def _resolve_is_at(self):
+        # 群聊at结构
+        """
+        {
+            'Data': {
+                'MsgSource': '<msgsource>\n\t<atuserlist><![CDATA[,wxid_xxx,wxid_xxx]]></atuserlist>\n\t<pua>1</pua>\n\t<silence>0</silence>\n\t<membercount>3</membercount>\n\t<signature>V1_cqxXBat9|v1_cqxXBat9</signature>\n\t<tmp_node>\n\t\t<publisher-id></publisher-id>\n\t</tmp_node>\n</msgsource>\n',
+            },
+        }
+        """
+        # 优先从MsgSource的atuserlist中解析是否被at，XML解析失败时才从PushContent中判断（与预分类共用同一判断）
+        if self._msg_source_root is _UNSET:
+            self._msg_source_root = parse_msg_source(self.msg.get('Data', {}).get('MsgSource', ''))
+        return is_at_user(self._msg_source_root, self.msg.get('Data', {}).get('PushContent', ''), self.to_user_id)
 
-        self.my_msg = self.msg['Wxid'] == self.from_user_id  # 消息是否来自自己
+    # ---------------- 媒体下载 ----------------
+
+    def _file_url(self, file_url):
+        """拼接gewechat下载服务中文件的完整地址，未配置下载服务地址时返回None"""
+        if not self._download_url:
+            logger.error("[gewechat] 未配置gewechat_download_url，无法下载媒体文件")
+            return None
+        return self._download_url.rstrip('/') + '/' + file_url
 
     def download_voice(self):
         try:
-            voice_data = self.client.download_voice(self.msg['Wxid'], self.msg_id)
-            with open(self.content, "wb") as f:
-                f.write(voice_data)
+            content_xml = self.msg['Data']['Content']['string']
+            xml_start = content_xml.find('<msg>')
+            if xml_start != -1:
+                content_xml = content_xml[xml_start:]
+            voice_info = self.client.download_voice(self.app_id, content_xml, self.msg_id)
+            if voice_info['ret'] == 200 and voice_info['data']:
+                file_url = voice_info['data']['fileUrl']
+                logger.info(f"[gewechat] Download voice file from {file_url}")
+                full_url = self._file_url(file_url)
+                if full_url:
+                    self._voice_data = requests.get(full_url).content
+            else:
+                logger.error(f"[gewechat] Failed to download voice file: {voice_info}")
         except Exception as e:
             logger.error(f"[gewechat] Failed to download voice file: {e}")
 
@@ -287,24 +394,26 @@ class GeWeChatMessage(ChatMessage):
             if image_info['ret'] == 200 and image_info['data']:
                 file_url = image_info['data']['fileUrl']
                 logger.info(f"[gewechat] Download image file from {file_url}")
-                # 在需要时导入Config并创建实例
-                from config import Config
-                config = Config(file_path='./config.json', is_init=True)
-                download_url = config.get("gewechat_download_url").rstrip('/')
-                full_url = download_url + '/' + file_url
+                full_url = self._file_url(file_url)
+                if not full_url:
+                    return
                 try:
                     file_data = requests.get(full_url).content
                 except Exception as e:
                     logger.error(f"[gewechat] Failed to download image file: {e}")
+                    return
                 with open(self.content, "wb") as f:
                     f.write(file_data)
+                # 下载的图片不被引用，到期后由临时文件管理器删除
+                TempFileManager.get_instance().register(self.content, job=str(self.msg_id))
             else:
                 logger.error(f"[gewechat] Failed to download image file: {image_info}")
         except Exception as e:
             logger.error(f"[gewechat] Failed to download image file: {e}")
 
     def prepare(self):
-        if self._prepare_fn:
+        if self._prepare_fn and not self._prepared:
+            self._prepared = True
             self._prepare_fn()
 
     def _is_non_user_message(self, msg_source: str, from_user_id: str) -> bool:
@@ -316,29 +425,38 @@ class GeWeChatMessage(ChatMessage):
 
         Returns:
             bool: 如果是非用户消息返回True，否则返回False
-
-        Note:
-            通过以下方式判断是否为非用户消息：
-            1. 检查MsgSource中是否包含特定标签
-            2. 检查发送者ID是否为特殊账号或以特定前缀开头
         """
-        # 检查发送者ID
-        special_accounts = ["Tencent-Games", "weixin"]
-        if from_user_id in special_accounts or from_user_id.startswith("gh_"):
-            logger.debug(f"[gewechat] non-user message detected by sender id: {from_user_id}")
-            return True
-
-        # 检查消息源中的标签
-        # 示例:<msgsource>\n\t<tips>3</tips>\n\t<bizmsg>\n\t\t<bizmsgshowtype>0</bizmsgshowtype>\n\t\t<bizmsgfromuser><![CDATA[weixin]]></bizmsgfromuser>\n\t</bizmsg>
-        non_user_indicators = [
-            "<tips>3</tips>",
-            "<bizmsgshowtype>",
-            "</bizmsgshowtype>",
-            "<bizmsgfromuser>",
-            "</bizmsgfromuser>"
-        ]
-        if any(indicator in msg_source for indicator in non_user_indicators):
-            logger.debug(f"[gewechat] non-user message detected by msg_source indicators")
-            return True
-
-        return False
+        if not is_non_user_message(msg_source, from_user_id):
+            return False
+        logger.debug(f"[gewechat] non-user message detected: {from_user_id}")
+        return True
+
+
+if __name__ == "__main__":
+    # 测量构造耗时与内存分配：python -m Core.GewechatMessage
+    import timeit
+    import tracemalloc
+
+    now = int(time.time())
+    samples = {
+        "private_text": {"Wxid": "wxid_bot", "Data": {
+            "NewMsgId": 1, "MsgType": 1, "CreateTime": now, "MsgSource": "<msgsource></msgsource>",
+            "FromUserName": {"string": "wxid_user"}, "ToUserName": {"string": "wxid_bot"},
+            "Content": {"string": "你好"}}},
+        "group_text": {"Wxid": "wxid_bot", "Data": {
+            "NewMsgId": 2, "MsgType": 1, "CreateTime": now,
+            "MsgSource": "<msgsource><atuserlist><![CDATA[,wxid_bot]]></atuserlist></msgsource>",
+            "FromUserName": {"string": "123@chatroom"}, "ToUserName": {"string": "wxid_bot"},
+            "Content": {"string": "wxid_user:\n@机器人 你好"}}},
+    }
+    for name, sample in samples.items():
+        number = 20000
+        cost = timeit.timeit(lambda: GeWeChatMessage(sample, None, app_id="app"), number=number) / number
+        tracemalloc.start()
+        snapshot = tracemalloc.take_snapshot()
+        messages = [GeWeChatMessage(sample, None, app_id="app") for _ in range(1000)]
+        allocated = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(snapshot, "filename"))
+        tracemalloc.stop()
+        print(f"{name}: 构造 {cost * 1e6:.2f}us, 每条消息分配 {allocated / len(messages):.0f} 字节, "
+              f"content={messages[0].content!r}, is_at={messages[0].is_at}")
+    print(GeWeChatMessage.stats())
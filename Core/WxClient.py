@@ -9,11 +9,26 @@ from Core.GewechatMessage import GeWeChatMessage
 from Core.Logger import Logger
 from Core.bridge.context import ContextType
 from Core.bridge.channel import Channel
+from Core.bridge.media_server import MediaServer
+from Core.bridge.message_dedup import MessageDeduplicator
+from Core.bridge.message_filter import MessageFilter
+from Core.bridge.sharded_executor import QueueFullError, ShardedExecutor
+from Core.bridge.temp_files import TempFileManager
+from Core.emoji_registry import EmojiRegistry
 from Core.factory.client_factory import ClientFactory
+from Core.voice.silk_cache import SilkCache
 from config import Config
 from Core.api import serverapi
 logger = logging = Logger()
 is_callback_success = False
+# tmp目录文件服务（语音、表情等），按块流式返回
+media_server = MediaServer()
+
+
+def _ack_served(body, path):
+    yield from body
+    if not TempFileManager.get_instance().mark_served(path):
+        SilkCache.mark_served(path)
 
 
 class WxChatClient:
@@ -86,12 +101,40 @@ class Query:
             self.client = ClientFactory.get_client(self.config)
             # 创建通道对象
             self.channel = Channel(self.client, self.config)
+            # 创建按会话排队的执行器，回调线程只负责入队，由共享的工作线程调用LLM并回复
+            # 同一会话串行回复，不同会话并行处理；queue_size限制排队总数，queue_key_size限制单个会话
+            self.executor = ShardedExecutor(
+                workers=self.config.get('queue_workers', 4),
+                key_maxsize=self.config.get('queue_key_size', 20),
+                max_pending=self.config.get('queue_size', 100),
+                policy=self.config.get('queue_policy', ShardedExecutor.POLICY_DROP_OLDEST)
+            )
+            # 回调消息预分类器
+            self.message_filter = MessageFilter()
+            # 按NewMsgId去重，丢弃gewechat重复投递的回调
+            self.deduplicator = MessageDeduplicator.from_config(self.config)
+            # 临时文件被删除后关闭媒体服务缓存的文件描述符
+            TempFileManager.get_instance(self.config).add_delete_listener(media_server.forget)
             self._initialized = True
             print("Query类初始化完成")
 
     def GET(self):
         # 搭建简单的文件服务器，用于向gewechat服务传输语音等文件，但只允许访问tmp目录下的文件
-        params = web.input(file="")
+        params = web.input(file="", emoji="")
+        if params.emoji:
+            # 表情包直接从表情包索引（内存缓存）返回
+            asset, data = EmojiRegistry.get_instance().read(params.emoji)
+            if asset is None:
+                raise web.notfound()
+            response = media_server.serve_bytes(
+                data, asset.mime, asset.md5,
+                range_header=web.ctx.env.get('HTTP_RANGE'),
+                if_none_match=web.ctx.env.get('HTTP_IF_NONE_MATCH')
+            )
+            web.ctx.status = response.status
+            for name, value in response.headers:
+                web.header(name, value)
+            return response.body
         file_path = params.file
         if file_path:
             # 使用os.path.abspath清理路径
@@ -104,12 +147,21 @@ class Query:
                     f"[gewechat] Forbidden access to file outside tmp directory: file_path={file_path}, clean_path={clean_path}, tmp_dir={tmp_dir}")
                 raise web.forbidden()
 
-            if os.path.exists(clean_path):
-                with open(clean_path, 'rb') as f:
-                    return f.read()
-            else:
+            response = media_server.serve(
+                clean_path,
+                range_header=web.ctx.env.get('HTTP_RANGE'),
+                if_none_match=web.ctx.env.get('HTTP_IF_NONE_MATCH')
+            )
+            if response is None:
                 logger.error(f"[gewechat] File not found: {clean_path}")
                 raise web.notfound()
+            web.ctx.status = response.status
+            for name, value in response.headers:
+                web.header(name, value)
+            if response.complete:
+                # 文件返回完毕后通知临时文件管理器（或SILK缓存），已被取走的临时文件稍后删除
+                return _ack_served(response.body, clean_path)
+            return response.body
         return "gewechat callback server is running"
 
     def POST(self):
@@ -125,9 +177,36 @@ class Query:
         if isinstance(data, dict) and 'testMsg' in data and 'token' in data:
             logger.debug(f"收到回调测试消息: {data}")
             return "success"
-            
+
+        # 构造消息对象前先根据原始字段预分类，丢弃无需处理的消息，不产生任何I/O
+        drop_reason = self.message_filter.classify(data)
+        if drop_reason is not None:
+            logger.debug(f"预分类丢弃消息: {drop_reason}")
+            if drop_reason in (MessageFilter.STATUS_SYNC, MessageFilter.SELF):
+                is_callback_success = True
+            return "success"
+
+        # gewechat重复投递的消息
+        if self.deduplicator.check(data):
+            logger.info(f"忽略重复投递的消息: {data['Data']['NewMsgId']}, 去重统计: {self.deduplicator.stats()}")
+            return "success"
+
+        # 消息入队或确认无需处理后才记为已处理；解析或入队出错时撤销，gewechat重试时仍会处理
+        try:
+            result = self._handle_message(data)
+        except Exception:
+            self.deduplicator.release(data)
+            raise
+        self.deduplicator.commit(data)
+        return result
+
+    def _handle_message(self, data):
+        """解析并分发一条回调消息"""
+        global is_callback_success
+
         # 解析消息
-        gewechat_msg = GeWeChatMessage(data, self.client)
+        gewechat_msg = GeWeChatMessage(data, self.client, app_id=self.channel.gewechat_app_id,
+                                       download_url=self.channel.config.get("gewechat_download_url"))
         
         # 过滤不需要处理的消息
         
@@ -158,11 +237,8 @@ class Query:
             wxid = gewechat_msg.other_user_id
             if gewechat_msg.is_at:
                 # 处理有效消息
-                try:
-                    self.channel.compose_context(gewechat_msg.content, wxid)
-                    return "success"
-                except Exception as e:
-                    logger.error(f"消息处理过程中出现错误: {str(e)}")
+                self._dispatch(gewechat_msg.content, wxid)
+                return "success"
 
         # 私信消息处理
         if not gewechat_msg.my_msg:
@@ -171,10 +247,27 @@ class Query:
                 if gewechat_msg.ctype is ContextType.TEXT:
                     wxid = gewechat_msg.other_user_id
                     # 处理有效消息
-                    try:
-                        self.channel.compose_context(gewechat_msg.content, wxid)
-                        return "success"
-                    except Exception as e:
-                        logger.error(f"消息处理过程中出现错误: {str(e)}")           
+                    self._dispatch(gewechat_msg.content, wxid)
+                    return "success"
+                # 语音消息在工作线程中识别为文字后再回复，与同一会话的文本消息保持顺序
+                if gewechat_msg.ctype is ContextType.VOICE:
+                    wxid = gewechat_msg.other_user_id
+                    self._dispatch(gewechat_msg, wxid, handler=self.channel.compose_voice_context)
+                    return "success"
             
         return "success"
+
+    def _dispatch(self, content, wxid, handler=None):
+        """
+        将有效消息放入会话队列，由工作线程异步处理
+
+        Args:
+            content: 消息内容
+            wxid: 会话ID，作为排队键，同一会话的消息按顺序回复
+            handler: 消息处理函数，默认为 channel.compose_context
+        """
+        try:
+            self.executor.submit(wxid, handler or self.channel.compose_context, content, wxid)
+            logger.debug(f"消息已入队，会话队列深度: {self.executor.depth(wxid)}")
+        except QueueFullError:
+            logger.warning(f"会话 {wxid} 的队列已满，拒绝消息: {content}")
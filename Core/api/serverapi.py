@@ -2,10 +2,10 @@ from http.server import BaseHTTPRequestHandler, HTTPServer
 from gewechat.client import LoginApi
 import urllib.parse
 import json
-from config import Config
+from config import Config, ConfigWatcher
+from Core.emoji_registry import EmojiRegistry
 import os
 import sys
-import traceback
 import time
 def print_green(text):
     print(f"\033[32m{text}\033[0m")
@@ -23,16 +23,10 @@ current_file_path = os.path.abspath(__file__)
 root_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_file_path)))
 sys.path.append(root_dir)
 
-# 导入Channel实例
-def get_channel_instance():
-    """获取全局Channel实例"""
-    try:
-        from Core.initializer import channel
-        return channel
-    except Exception as e:
-        print(f"获取Channel实例失败: {e}")
-        traceback.print_exc()
-        return None
+def notify_config_changed():
+    """通知所有订阅者（Channel）配置已变更，无需等待文件轮询"""
+    ConfigWatcher.get(config.file_path).invalidate()
+    print_green("已通知Channel刷新配置")
 
 loginAPI = LoginApi(base_url=f"http://{config.get('gewe_server_ip')}:2531/v2/api", token=config.get("gewechat_token"))
 
@@ -183,10 +177,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
 
         if updated:
             # 通知Channel刷新配置
-            channel = get_channel_instance()
-            if channel:
-                channel.refresh_config()
-                print_green("已通知Channel刷新配置")
+            notify_config_changed()
             self._send_json_response(200, {"success": True, "message": "Dify配置已更新"})
             print_green("Dify配置已更新")
         else:
@@ -213,10 +204,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
 
         if updated:
             # 通知Channel刷新配置
-            channel = get_channel_instance()
-            if channel:
-                channel.refresh_config()
-                print_green("已通知Channel刷新配置")
+            notify_config_changed()
             self._send_json_response(200, {"success": True, "message": "Coze配置已更新"})
             print_green("Coze配置已更新")
         else:
@@ -234,10 +222,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         if platform in ["dify", "coze"]:
             config.set("agent_platform", platform)
             # 通知Channel刷新配置
-            channel = get_channel_instance()
-            if channel:
-                channel.refresh_config()
-                print_green("已通知Channel刷新配置")
+            notify_config_changed()
             self._send_json_response(200, {"success": True, "message": f"AI平台已切换为{platform}"})
         else:
             self._send_json_response(400, {"success": False, "message": "无效的平台参数，请使用'dify'或'coze'"})
@@ -253,6 +238,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
 
         if server_ip:
             config.set("gewe_server_ip", server_ip)
+            notify_config_changed()
             self._send_json_response(200, {"success": True, "message": "GEWE服务器配置已更新"})
             print_green("GEWE服务器配置已更新")
         else:
@@ -291,20 +277,9 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             return
 
         try:
-            # 获取项目根目录
-            current_file_path = os.path.abspath(__file__)
-            root_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_file_path)))
-            emojis_dir = os.path.join(root_dir, "emojis")
-            
-            # 检查文件是否存在
-            for ext in ['.jpg', '.png']:
-                emoji_path = os.path.join(emojis_dir, f"{emoji_name}{ext}")
-                if os.path.exists(emoji_path):
-                    self._send_json_response(200, {"path": emoji_path})
-                    return
-            
-            # 如果没找到文件
-            self._send_json_response(200, {"path": ""})
+            # 从表情包索引中查找，不再逐个扩展名探测文件
+            asset = EmojiRegistry.get_instance().get(emoji_name)
+            self._send_json_response(200, {"path": asset.path if asset else ""})
             
         except Exception as e:
             print_red(f"获取表情包失败: {e}")
@@ -1,42 +1,33 @@
+import threading
+
 from Core.Logger import Logger
-from Core.voice.audio_convert import audio_to_silk
+from Core.voice.audio_convert import audio_to_silk_bytes
+from Core.voice.silk_cache import SilkCache
+from Core.emoji_registry import EmojiRegistry
+from Core.media_registry import MediaRegistry, build_image_xml
+from Core.bridge.temp_files import TempFileManager
+from Core.bridge.response_cache import ResponseCache
+from Core.voice.transcoder import TranscodeService
+from Core.voice.speech_to_text import create_speech_to_text
+from Core.voice.voice_transcriber import VoiceTranscriber
 from Core.cozeAI.coze_manager import CozeChatManager
-import os
+from Core.difyAI.dify_pool import DifyBackendPool
 from Core.difyAI.new_dify_manager import NewDifyManager
-from config import Config
-
+from config import ConfigWatcher
 
-# 获取当前脚本文件的绝对路径
-current_file_path = os.path.abspath(__file__)
-
-# 获取tmp路径
-tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(current_file_path))), "tmp")
 
 logging = logger = Logger()
 
-def cleanup_tmp_folder():
-    """清理tmp文件夹中的所有文件"""
-    logger.info("正在清理tmp文件夹...")
-    tmp_path = tmp_dir
-    
-    try:
-        # 获取tmp文件夹中的所有文件
-        files = [f for f in os.listdir(tmp_path) if os.path.isfile(os.path.join(tmp_path, f))]
-        
-        # 删除每个文件
-        for file in files:
-            file_path = os.path.join(tmp_path, file)
-            try:
-                os.remove(file_path)
-                logger.debug(f"已删除临时文件: {file}")
-            except Exception as e:
-                logger.error(f"删除文件 {file} 时出错: {str(e)}")
-        
-        logger.success(f"已清理 {len(files)} 个临时文件")
-    except Exception as e:
-        logger.error(f"清理tmp文件夹时出错: {str(e)}")
 
 class Channel:
+    # 各管理器依赖的配置项，只有这些配置项变化时才重建对应管理器
+    DIFY_MANAGER_KEYS = ("dify_server_ip", "dify_api_key", "dify_backends", "dify_balance", "dify_health_interval",
+                         "dify_backend_max_failures")
+    COZE_MANAGER_KEYS = ("coze_api_token",)
+    SESSION_STORE_KEYS = ("session_store", "session_db_path", "session_ttl", "session_idle_ttl")
+    SPEECH_TO_TEXT_KEYS = ("stt_backend", "stt_api_base", "stt_api_key", "stt_model", "stt_placeholder_text",
+                           "dify_verify_ssl")
+
     def __init__(self, client, config):
         """
         初始化通信通道
@@ -48,66 +39,91 @@ class Channel:
         self.client = client
         self.config = config
         self.gewechat_app_id = config.get('gewechat_app_id')
-
+        self._refresh_lock = threading.Lock()
+        # 按配置创建转码服务（进程池在首个任务提交时才启动）
+        self.transcoder = TranscodeService.get_instance(self.config)
+        # 按配置创建临时文件管理器，tmp目录中的文件由其按引用、取走确认和过期时间回收
+        self.temp_files = TempFileManager.get_instance(self.config)
 
         # 初始化coze和dify管理器
         self.init_managers()
 
+        # 配置文件变更时才刷新，不再在每条消息中重新读取config.json
+        ConfigWatcher.get(self.config.file_path).subscribe(self.refresh_config)
+
     def init_managers(self):
         """初始化AI平台管理器"""
-        # 初始化coze
+        self._init_coze_manager()
+        self._init_dify_manager()
+        self._init_voice_transcriber()
+        self._init_response_cache()
+
+    def _init_coze_manager(self):
+        """初始化coze管理器"""
         if self.config.get("coze_api_token"):
-            self.coze_manager = CozeChatManager(api_token=self.config.get("coze_api_token"))
-        # 初始化dify
+            self.coze_manager = CozeChatManager(api_token=self.config.get("coze_api_token"), project_config=self.config)
+
+    def _init_dify_manager(self):
+        """初始化dify管理器"""
         self.new_dify_manager = NewDifyManager(project_config=self.config)
+
+    def _init_voice_transcriber(self):
+        """初始化语音识别，未配置识别后端时不处理语音消息"""
+        backend = create_speech_to_text(self.config)
+        self.voice_transcriber = VoiceTranscriber(backend, self.transcoder) if backend else None
+
+    def _init_response_cache(self):
+        """初始化回复缓存，未开启时为None"""
+        self.response_cache = ResponseCache.get_instance(self.config)
     
     def refresh_config(self):
-        """刷新配置和管理器实例"""
-        logging.info("正在刷新配置...")
-        # 保存旧配置
-        old_config = self.config
-        
-        # 重新加载配置
-        self.config = Config()
-        # 更新appId
-        self.gewechat_app_id = self.config.get('gewechat_app_id')
-        
-        # 检查关键配置是否变更
-        dify_config_changed = (
-            old_config.get("dify_server_ip") != self.config.get("dify_server_ip") or
-            old_config.get("dify_api_key") != self.config.get("dify_api_key")
-        )
-        
-        coze_config_changed = (
-            old_config.get("coze_agent_id") != self.config.get("coze_agent_id") or
-            old_config.get("coze_api_token") != self.config.get("coze_api_token")
-        )
-        
-        platform_changed = old_config.get("agent_platform") != self.config.get("agent_platform")
-        
-        # 重新初始化管理器
-        self.init_managers()
-        
-        # 如果关键配置变更，清除对话记录
-        if dify_config_changed or platform_changed:
-            logging.warning("Dify配置或平台已变更，正在清除对话记录...")
-            try:
-                # 清空new_dify_config.json
-                if hasattr(self, 'new_dify_manager'):
-                    self.new_dify_manager.clear_all_conversations()
-            except Exception as e:
-                logging.error(f"清除Dify对话记录失败: {str(e)}")
-        
-        if coze_config_changed or platform_changed:
-            logging.warning("Coze配置或平台已变更，正在清除对话记录...")
-            try:
-                # 清空coze_config.json
-                if hasattr(self, 'coze_manager'):
-                    self.coze_manager.clear_all_conversations()
-            except Exception as e:
-                logging.error(f"清除Coze对话记录失败: {str(e)}")
-        
-        logging.success("配置已刷新")
+        """从配置文件同步配置，只重建依赖项发生变化的管理器"""
+        with self._refresh_lock:
+            logging.info("正在刷新配置...")
+            old_data = dict(self.config.data)
+            # 原地重新加载配置，获取变更的配置项
+            changed_keys = set(self.config.refresh_config())
+            # 更新appId
+            self.gewechat_app_id = self.config.get('gewechat_app_id')
+            if not changed_keys:
+                return
+            
+            # 检查关键配置是否变更
+            # 只有被移除或凭证变化的后端需要清除对话记录，调整权重、负载均衡参数或增加后端不影响已有对话
+            removed_dify_agents = DifyBackendPool.agents(old_data) - DifyBackendPool.agents(self.config)
+            coze_config_changed = bool(changed_keys.intersection(("coze_agent_id",) + self.COZE_MANAGER_KEYS))
+            platform_changed = "agent_platform" in changed_keys
+            session_store_changed = bool(changed_keys.intersection(self.SESSION_STORE_KEYS))
+            
+            # 如果关键配置变更，先用旧的管理器清除旧智能体的对话记录，其他智能体的会话不受影响
+            if removed_dify_agents or platform_changed:
+                logging.warning("Dify配置或平台已变更，正在清除对话记录...")
+                try:
+                    if hasattr(self, 'new_dify_manager'):
+                        self.new_dify_manager.clear_all_conversations(
+                            agents=None if platform_changed else removed_dify_agents)
+                except Exception as e:
+                    logging.error(f"清除Dify对话记录失败: {str(e)}")
+            
+            if coze_config_changed or platform_changed:
+                logging.warning("Coze配置或平台已变更，正在清除对话记录...")
+                try:
+                    if hasattr(self, 'coze_manager'):
+                        self.coze_manager.clear_all_conversations(bot_id=old_data.get("coze_agent_id"))
+                except Exception as e:
+                    logging.error(f"清除Coze对话记录失败: {str(e)}")
+            
+            # 只重新初始化受影响的管理器
+            if changed_keys.intersection(self.DIFY_MANAGER_KEYS) or session_store_changed:
+                self._init_dify_manager()
+            if changed_keys.intersection(self.COZE_MANAGER_KEYS) or session_store_changed:
+                self._init_coze_manager()
+            if changed_keys.intersection(self.SPEECH_TO_TEXT_KEYS + self.DIFY_MANAGER_KEYS):
+                self._init_voice_transcriber()
+            if any(key.startswith("response_cache_") for key in changed_keys):
+                self._init_response_cache()
+            
+            logging.success("配置已刷新")
 
     def compose_context(self, message, _wxid):
         """
@@ -120,7 +136,6 @@ class Channel:
             处理结果
         """
         logging.info(f"收到消息: {message}")
-        self.refresh_config()
         # 判断平台
         if self.config.get("agent_platform") == "dify":
             self._handle_new_dify(message, _wxid)
@@ -128,8 +143,107 @@ class Channel:
             self._handle_coze(message, _wxid)
 
         return "success"
-    
+
+    def compose_voice_context(self, voice_msg, _wxid):
+        """
+        处理接收到的语音消息：识别为文字后按文本消息处理
+
+        Args:
+            voice_msg: 语音消息（GeWeChatMessage）
+            _wxid: 发送者微信ID
+
+        Returns:
+            处理结果
+        """
+        if self.voice_transcriber is None:
+            logging.debug("未配置语音识别，忽略语音消息")
+            return "ignored"
+        if voice_msg.voice_data is None:
+            voice_msg.prepare()
+        if not voice_msg.voice_data:
+            logging.error(f"没有获取到语音数据: {voice_msg.msg_id}")
+            return "error"
+
+        try:
+            text = self.voice_transcriber.transcribe(voice_msg.msg_id, voice_msg.voice_data, wxid=_wxid)
+        except Exception as e:
+            logging.error(f"语音识别失败: {str(e)}")
+            return "error"
+        if not text:
+            logging.warning(f"语音识别结果为空: {voice_msg.msg_id}")
+            return "empty"
+        return self.compose_context(text, _wxid)
+
+    def _dispatch_segment(self, r, _wxid):
+        """
+        发送单个回复片段
+
+        Args:
+            r: 回复片段，格式为 {'type': 'text'|'voice'|'emoji', 'content': ...}
+            _wxid: 接收者微信ID
+        """
+        if r['type'] == 'text':
+            self.handle_text(r['content'], _wxid)
+        elif r['type'] == 'voice':
+            self.handle_voice(r['content'], _wxid)
+        elif r['type'] == 'emoji':
+            self.handle_emoji(r['content'], _wxid)
+
+    def _lookup_cached_reply(self, namespace, message, _wxid, conversation_id):
+        """
+        查询回复缓存，命中时直接发送缓存的回复片段
+
+        Args:
+            namespace: 智能体命名空间
+            message: 用户消息
+            _wxid: 接收者微信ID
+            conversation_id: 用户当前的对话ID
+
+        Returns:
+            (是否已回复, 用于写入缓存的(缓存, CacheLookup))，未开启或绕过缓存时后者为None
+        """
+        cache = self.response_cache
+        if cache is None:
+            return False, None
+        # 已有对话时回复依赖上下文，默认不使用缓存
+        if conversation_id and self.config.get("response_cache_bypass_stateful", True):
+            return False, None
+        lookup = cache.lookup(namespace, message)
+        if lookup is None:
+            return False, None
+        if lookup.hit:
+            logging.info(f"命中回复缓存({lookup.tier}): {message}")
+            for r in lookup.segments:
+                self._dispatch_segment(r, _wxid)
+            return True, None
+        return False, (cache, lookup)
+
     def _handle_new_dify(self, message, _wxid):
+        replied, pending = self._lookup_cached_reply(f"dify:{self.new_dify_manager.agent}", message, _wxid,
+                                                     self.new_dify_manager.get_conversation_id(_wxid))
+        if replied:
+            return
+
+        # 流式模式（dify_response_mode为streaming）下每个片段生成完毕即发送，缩短首条回复的等待时间；默认仍为阻塞模式
+        if self.config.get("dify_response_mode", "blocking") == "streaming":
+            segments = []
+
+            def on_segment(r):
+                segments.append(r)
+                self._dispatch_segment(r, _wxid)
+
+            response = self.new_dify_manager.chat_with_bot_stream(
+                wxid=_wxid,
+                user_message=message,
+                on_segment=on_segment
+            )
+            if not response.get('segments'):
+                print(f"没有获取到回复: {response.get('answer')}")
+            elif pending and response.get("completed"):
+                # 只缓存完整生成的回复
+                pending[0].store(pending[1], segments)
+            return
+
         response = self.new_dify_manager.chat_with_bot(
             wxid=_wxid,
             user_message=message
@@ -139,39 +253,40 @@ class Channel:
         if res:
             # 处理回复内容
             for r in res:
-                if r['type'] == 'text':
-                    self.handle_text(r['content'], _wxid)
-                elif r['type'] == 'voice':
-                    self.handle_voice(r['content'], _wxid)
-                    cleanup_tmp_folder()
-                elif r['type'] == 'emoji':
-                    self.handle_emoji(r['content'], _wxid)
+                self._dispatch_segment(r, _wxid)
+            if pending and response.get("completed"):
+                pending[0].store(pending[1], res)
         else:
             print(f"没有获取到回复: {res}")
     
     def _handle_coze(self, meseage, _wxid):
-        if self.config.get("coze_api_token"):
-            response = self.coze_manager.chat_with_bot(
-                bot_id=self.config.get("coze_agent_id"), 
-                wxid=_wxid,
-                user_message=meseage
-            )
-            res = self.coze_manager.handle_response(response)
-        else:
+        if not self.config.get("coze_api_token"):
             print("没有配置coze")
-        
-        if res:
-            # 继续已有对话
-            for r in res:
-                if r['type'] == 'text':
-                    self.handle_text(r['content'], _wxid)
-                elif r['type'] == 'voice':
-                    self.handle_voice(r['content'], _wxid)
-                    cleanup_tmp_folder()
-                elif r['type'] == 'emoji':
-                    self.handle_emoji(r['content'], _wxid)
-        else:
-            print(f"maybe no res:{res}")
+            return
+
+        bot_id = self.config.get("coze_agent_id")
+        replied, pending = self._lookup_cached_reply(f"coze:{bot_id}", meseage, _wxid,
+                                                     self.coze_manager.get_conversation_id(_wxid, bot_id))
+        if replied:
+            return
+
+        segments = []
+
+        def on_segment(r):
+            segments.append(r)
+            self._dispatch_segment(r, _wxid)
+
+        # 每个片段闭合即发送，智能体仍在生成时第一条消息已经发出
+        response = self.coze_manager.chat_with_bot(
+            bot_id=bot_id,
+            wxid=_wxid,
+            user_message=meseage,
+            on_segment=on_segment
+        )
+        if not response.get('segments'):
+            print(f"maybe no res:{response.get('response')}")
+        elif pending and response.get('completed'):
+            pending[0].store(pending[1], segments)
 
     def handle_text(self, text, _wxid):
         try:
@@ -196,36 +311,32 @@ class Channel:
             处理结果
         """
         try:
-            import os
             import requests
-            import uuid
-            from Core.bridge.temp_dir import TmpDir
-            
-            # 创建临时目录
-            tmp_dir = TmpDir().path()
-
-            logging.debug(f"tmp_dir路径: {tmp_dir}")
-            # 生成唯一的文件名
-            file_name = f"{uuid.uuid4()}"
-            relative_voice_file = f"voice_{file_name}.wav"
-            audio_path = os.path.join(tmp_dir, relative_voice_file)
-            # 下载语音文件
-            logging.info(f"正在下载语音文件: {voice_url}")
-            response = requests.get(voice_url)
-            if response.status_code != 200:
-                logging.error(f"下载语音文件失败: {response.status_code}")
-                return "error"
-            # 保存为WAV文件
-            with open(audio_path, "wb") as f:
-                f.write(response.content)
-            audio_path = os.path.abspath(audio_path)
-            logging.info(f"语音文件已保存至: {audio_path}")
 
-            silk_path = audio_path + '.silk'
-            
-            # 转换为silk格式
-            duration = audio_to_silk(audio_path, silk_path)
-            
+            silk_cache = SilkCache.get_instance(max_bytes=self.config.get("silk_cache_max_mb", 200) * 1024 * 1024)
+            # 同一URL的语音已转换过时，跳过下载和编码
+            cached = silk_cache.get_by_url(voice_url)
+            if cached:
+                logging.info(f"命中SILK缓存(URL): {voice_url}")
+            else:
+                # 下载语音文件
+                logging.info(f"正在下载语音文件: {voice_url}")
+                response = requests.get(voice_url)
+                if response.status_code != 200:
+                    logging.error(f"下载语音文件失败: {response.status_code}")
+                    return "error"
+                digest = SilkCache.digest(response.content)
+                # 内容相同的语音（如URL不同的重复回复）跳过编码
+                cached = silk_cache.get(digest)
+                if cached:
+                    logging.info(f"命中SILK缓存(内容): {digest}")
+                    silk_cache.remember_url(voice_url, digest)
+                else:
+                    # 在转码进程池中解码、重采样并编码，不再落盘wav/pcm文件
+                    silk_data, duration = self.transcoder.run(audio_to_silk_bytes, response.content)
+                    cached = silk_cache.put(digest, silk_data, duration, url=voice_url)
+            silk_path, duration = cached
+
             # 发送语音消息
             callback_url = f"http://{self.config.get('gewe_server_ip')}:1145/v2/api/callback/collect"
             print(f"callback_url: {callback_url}")
@@ -323,72 +434,52 @@ class Channel:
     def handle_emoji(self, emoji_name, _wxid):
         """
         处理表情包消息，改为发送图片形式
-        
+        已确认被gewechat登记为表情的md5以post_emoji（md5+大小）发送，其余以图片发送
+
         Args:
             emoji_name: 表情包名称
             _wxid: 接收者微信ID
-            
+
         Returns:
             处理结果
         """
         try:
-            import requests
-            import os
-            import shutil
-            import uuid
-            from Core.bridge.temp_dir import TmpDir
-            
-            # 获取表情包文件路径
-            response = requests.get(f"http://{self.config.get('gewe_server_ip')}:8002/get_emoji?name={emoji_name}")
-            if response.status_code != 200:
-                logging.error(f"获取表情包失败: {response.status_code}")
-                return "error"
-                
-            data = response.json()
-            emoji_path = data.get('path', '')
-            
-            print(f"emoji_path: {emoji_path}")
-            
-            if not emoji_path:
+            import urllib.parse
+
+            registry = EmojiRegistry.get_instance()
+            asset = registry.get(emoji_name)
+            if asset is None:
                 logging.warning(f"未找到表情包: {emoji_name}")
                 return "not_found"
-            
-            # 创建临时目录并复制表情包到tmp目录
-            tmp_dir = TmpDir().path()
-            file_ext = os.path.splitext(emoji_path)[1]  # 获取文件扩展名
-            tmp_emoji_file = f"emoji_{uuid.uuid4()}{file_ext}"
-            tmp_emoji_path = os.path.join(tmp_dir, tmp_emoji_file)
-            
-            # 复制文件
-            shutil.copy2(emoji_path, tmp_emoji_path)
-            logging.info(f"表情包已复制到临时目录: {tmp_emoji_path}")
-            
-            # 构建本地图片URL (使用tmp目录中的文件)
+
+            if registry.can_post_emoji(asset):
+                send_result = self.client.post_emoji(self.gewechat_app_id, _wxid, asset.md5, asset.size)
+                if send_result.get('ret') == 200:
+                    logging.success(f"已发送表情包: {emoji_name}")
+                    return "success"
+                # 该表情已不在微信表情服务中，之后只以图片方式发送
+                logging.debug(f"post_emoji发送失败，改为发送图片: {send_result}")
+                registry.revoke_emoji(asset.md5)
+
+            # 构建表情包URL，由Query.GET直接从表情包索引返回，无需复制到tmp目录
             callback_url = f"http://{self.config.get('gewe_server_ip')}:1145/v2/api/callback/collect"
-            img_url = callback_url + "?file=" + str(tmp_emoji_path)
+            img_url = callback_url + "?emoji=" + urllib.parse.quote(asset.name)
             print(f"图片URL: {img_url}")
                 
-            # 发送图片
-            send_result = self.client.post_image(
-                self.gewechat_app_id,
-                _wxid,
-                img_url
+            # 发送图片：相同内容已上传过时转发CDN上的图片，否则由gewechat拉取上传
+            send_result = MediaRegistry.get_instance(self.config).send(
+                "image", asset.md5,
+                forward=lambda xml: self.client.forward_image(self.gewechat_app_id, _wxid, xml),
+                upload=lambda: self.client.post_image(self.gewechat_app_id, _wxid, img_url),
+                describe=build_image_xml
             )
             
             print(f"send_result: {send_result}")
             if send_result.get('ret') != 200:
                 logging.error(f"发送表情包图片失败: {send_result}")
                 return "error"
-                
+
             logging.success(f"已发送表情包图片: {emoji_name}")
-            
-            # 清理临时文件
-            try:
-                os.remove(tmp_emoji_path)
-                logging.debug(f"已删除临时表情包文件: {tmp_emoji_path}")
-            except Exception as e:
-                logging.warning(f"删除临时表情包文件失败: {str(e)}")
-                
             return "success"
             
         except Exception as e:
@@ -0,0 +1,216 @@
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# mimetypes不认识的语音格式
+EXTRA_MIME_TYPES = {
+    ".silk": "audio/silk",
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".pcm": "audio/L16",
+}
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class MediaResponse:
+    """文件响应：状态行、响应头和按块输出的响应体"""
+
+    def __init__(self, status, headers, body=(), complete=False):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.complete = complete  # 响应体是否包含到文件末尾（返回完毕即视为文件已被取走）
+
+
+class MediaServer:
+    """
+    tmp目录媒体文件的流式文件服务
+    按块读取文件而不是一次性读入内存，设置Content-Type/Content-Length/ETag，
+    支持HTTP Range与If-None-Match。POSIX系统上缓存少量文件描述符并用os.pread并发读取；
+    Windows上打开的文件无法被删除，因此每次请求单独打开文件。
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, max_handles=32):
+        """
+        Args:
+            max_handles: 最多缓存的文件描述符数量
+        """
+        self.max_handles = max_handles
+        self._use_pread = hasattr(os, "pread")
+        self._handles = OrderedDict()  # path -> _Handle
+        self._lock = threading.Lock()
+
+    def serve(self, path, range_header=None, if_none_match=None):
+        """
+        生成文件响应
+
+        Args:
+            path: 已校验过的文件绝对路径
+            range_header: 请求头 Range
+            if_none_match: 请求头 If-None-Match
+
+        Returns:
+            MediaResponse，文件不存在时返回None
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._evict(path)
+            return None
+
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        return self._respond(stat.st_size, etag, self.guess_type(path), range_header, if_none_match,
+                             lambda start, length: self._read_chunks(path, stat, start, length))
+
+    def serve_bytes(self, data, content_type, etag, range_header=None, if_none_match=None):
+        """
+        生成内存数据的响应（如常驻内存的表情包），同样支持Range与If-None-Match
+
+        Args:
+            data: 文件内容
+            content_type: Content-Type
+            etag: 内容标识（不含引号），如内容的md5
+        """
+        view = memoryview(data)
+        return self._respond(len(data), f'"{etag}"', content_type, range_header, if_none_match,
+                             lambda start, length: self._slice_chunks(view, start, length))
+
+    def _respond(self, size, etag, content_type, range_header, if_none_match, read):
+        headers = [
+            ("Content-Type", content_type),
+            ("Accept-Ranges", "bytes"),
+            ("ETag", etag),
+            ("Cache-Control", "private, max-age=300"),
+        ]
+
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return MediaResponse("304 Not Modified", headers)
+
+        start, end = 0, size - 1
+        status = "200 OK"
+        if range_header:
+            byte_range = self._parse_range(range_header, size)
+            if byte_range is None:
+                headers.append(("Content-Range", f"bytes */{size}"))
+                return MediaResponse("416 Range Not Satisfiable", headers)
+            start, end = byte_range
+            status = "206 Partial Content"
+            headers.append(("Content-Range", f"bytes {start}-{end}/{size}"))
+
+        length = max(0, end - start + 1)
+        headers.append(("Content-Length", str(length)))
+        return MediaResponse(status, headers, read(start, length), complete=end == size - 1)
+
+    @staticmethod
+    def guess_type(path):
+        ext = os.path.splitext(path)[1].lower()
+        return EXTRA_MIME_TYPES.get(ext) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    @staticmethod
+    def _parse_range(range_header, size):
+        """解析单个字节范围，返回(start, end)，无法满足时返回None"""
+        match = _RANGE_PATTERN.match(range_header.strip())
+        if not match or size == 0:
+            return None
+        first, last = match.groups()
+        if first == "":
+            if last == "":
+                return None
+            # bytes=-N 表示最后N个字节
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return None
+        return start, end
+
+    def _slice_chunks(self, view, offset, length):
+        end = offset + length
+        while offset < end:
+            yield bytes(view[offset:min(offset + self.CHUNK_SIZE, end)])
+            offset += self.CHUNK_SIZE
+
+    def _read_chunks(self, path, stat, offset, length):
+        if not self._use_pread:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                while length > 0:
+                    chunk = f.read(min(self.CHUNK_SIZE, length))
+                    if not chunk:
+                        break
+                    length -= len(chunk)
+                    yield chunk
+            return
+
+        handle = self._acquire(path, stat)
+        try:
+            while length > 0:
+                chunk = os.pread(handle.fd, min(self.CHUNK_SIZE, length), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                length -= len(chunk)
+                yield chunk
+        finally:
+            self._release(handle)
+
+    def _acquire(self, path, stat):
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            handle = self._handles.get(path)
+            if handle and handle.signature == signature:
+                self._handles.move_to_end(path)
+            else:
+                if handle:
+                    # 文件已被替换，旧描述符在没有请求使用后关闭
+                    self._retire(self._handles.pop(path))
+                handle = _Handle(os.open(path, os.O_RDONLY), signature)
+                self._handles[path] = handle
+                while len(self._handles) > self.max_handles:
+                    self._retire(self._handles.popitem(last=False)[1])
+            handle.refs += 1
+            return handle
+
+    def _release(self, handle):
+        with self._lock:
+            handle.refs -= 1
+            if handle.retired and handle.refs == 0:
+                handle.close()
+
+    def forget(self, path):
+        """文件被删除后关闭缓存的文件描述符"""
+        self._evict(path)
+
+    def _evict(self, path):
+        with self._lock:
+            handle = self._handles.pop(path, None)
+            if handle:
+                self._retire(handle)
+
+    @staticmethod
+    def _retire(handle):
+        handle.retired = True
+        if handle.refs == 0:
+            handle.close()
+
+
+class _Handle:
+    """带引用计数的文件描述符，被淘汰后等最后一个读取者结束再关闭"""
+
+    def __init__(self, fd, signature):
+        self.fd = fd
+        self.signature = signature
+        self.refs = 0
+        self.retired = False
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
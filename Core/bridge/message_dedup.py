@@ -0,0 +1,222 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from Core.Logger import Logger
+
+logger = Logger()
+
+
+class MessageDeduplicator:
+    """
+    回调消息去重
+    gewechat在回调处理较慢时会重复投递同一条消息，这里以 Data.NewMsgId 为键记录最近处理过的消息，
+    重复的回调在构造消息对象之前直接丢弃，不会再次调用LLM和回复。
+    check时消息ID先标记为处理中（并发的重复投递同样被丢弃），处理完成（已入队或确认无需处理）后commit，
+    处理过程中出错时release，gewechat重试时仍会处理这条消息。
+    记录只保留window秒且最多max_entries条；内存中保存一份用于判断，已提交的记录由后台线程批量写入SQLite（WAL模式），
+    重启后从数据库载入仍在时间窗口内的记录。
+    """
+
+    _instances = []
+    _instances_lock = threading.Lock()
+
+    FLUSH_INTERVAL = 1  # 批量写入数据库的间隔（秒）
+    PRUNE_INTERVAL = 60  # 清理数据库中过期记录的最小间隔（秒）
+
+    def __init__(self, db_path="./data/msg_dedup.db", window=600, max_entries=10000):
+        """
+        Args:
+            db_path: 数据库文件路径，为None时只在内存中去重
+            window: 去重时间窗口（秒）
+            max_entries: 最多记录的消息数量
+        """
+        self.db_path = os.path.abspath(db_path) if db_path else None
+        self.window = window
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # 数据库连接只由写入方使用，不与判断重复共用锁
+        self._seen = OrderedDict()  # msg_id -> 首次收到的时间
+        self._pending = {}  # 处理中的msg_id -> 收到的时间
+        self._unsaved = []  # 已提交、尚未写入数据库的 (msg_id, 收到的时间)
+        self._last_prune = 0.0
+        self._conn = None
+        self._stop = threading.Event()
+        self.checked = 0
+        self.duplicates = 0
+        self.released = 0
+
+        if self.db_path:
+            try:
+                self._open()
+            except sqlite3.Error as e:
+                logger.error(f"打开消息去重数据库失败，仅在内存中去重: {self.db_path}, {e}")
+                self._conn = None
+        if self._conn is not None:
+            threading.Thread(target=self._flush_loop, name="msg-dedup-flush", daemon=True).start()
+            with self._instances_lock:
+                if not MessageDeduplicator._instances:
+                    atexit.register(MessageDeduplicator.stop_all)
+                MessageDeduplicator._instances.append(self)
+
+    @classmethod
+    def stop_all(cls):
+        """停止所有实例并写入剩余的记录（关闭程序前调用）"""
+        with cls._instances_lock:
+            instances = list(cls._instances)
+        for instance in instances:
+            instance.stop()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        根据项目配置创建
+
+        配置项: msg_dedup_db_path（为空时不持久化）、msg_dedup_window、msg_dedup_max_entries
+        """
+        return cls(db_path=config.get("msg_dedup_db_path", "./data/msg_dedup.db"),
+                   window=config.get("msg_dedup_window", 600),
+                   max_entries=config.get("msg_dedup_max_entries", 10000))
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_messages (
+                msg_id TEXT PRIMARY KEY,
+                received_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_messages_received_at ON seen_messages (received_at)")
+        # 载入时间窗口内最近的记录
+        rows = self._conn.execute(
+            "SELECT msg_id, received_at FROM seen_messages WHERE received_at > ? "
+            "ORDER BY received_at DESC LIMIT ?",
+            (time.time() - self.window, self.max_entries)
+        ).fetchall()
+        for msg_id, received_at in reversed(rows):
+            self._seen[msg_id] = received_at
+        logger.info(f"消息去重记录已载入: {len(self._seen)} 条")
+
+    @staticmethod
+    def _msg_id(data):
+        msg = data.get('Data') if isinstance(data, dict) else None
+        if not msg or 'NewMsgId' not in msg:
+            return None
+        return str(msg['NewMsgId'])
+
+    def check(self, data):
+        """
+        检查回调消息是否重复，不重复时标记为处理中
+
+        Args:
+            data: 回调的JSON字典
+
+        Returns:
+            bool: 是重复消息（已处理过或正在处理）时返回True
+        """
+        msg_id = self._msg_id(data)
+        return msg_id is not None and self.seen(msg_id)
+
+    def seen(self, msg_id):
+        """
+        判断消息ID是否在时间窗口内出现过或正在处理，都没有时标记为处理中（判断和标记是原子的）
+
+        Returns:
+            bool: 出现过时返回True
+        """
+        msg_id = str(msg_id)
+        now = time.time()
+        with self._lock:
+            self.checked += 1
+            self._expire(now)
+            if msg_id in self._seen or msg_id in self._pending:
+                self.duplicates += 1
+                return True
+            self._pending[msg_id] = now
+            return False
+
+    def commit(self, data):
+        """消息处理完成（已入队或确认无需处理），记录为已处理"""
+        msg_id = self._msg_id(data)
+        if msg_id is None:
+            return
+        with self._lock:
+            received_at = self._pending.pop(msg_id, None)
+            if received_at is None:
+                return
+            self._seen[msg_id] = received_at
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            if self._conn is not None:
+                self._unsaved.append((msg_id, received_at))
+
+    def release(self, data):
+        """消息处理失败，撤销处理中的标记，gewechat重新投递时会再次处理"""
+        msg_id = self._msg_id(data)
+        if msg_id is None:
+            return
+        with self._lock:
+            if self._pending.pop(msg_id, None) is not None:
+                self.released += 1
+
+    def _expire(self, now):
+        """移除内存中超出时间窗口的记录（按收到时间有序，从最旧的开始）"""
+        deadline = now - self.window
+        while self._seen:
+            msg_id, received_at = next(iter(self._seen.items()))
+            if received_at > deadline:
+                break
+            self._seen.popitem(last=False)
+
+    def flush(self):
+        """将已提交的记录写入数据库（在后台线程中调用，不占用回调线程）"""
+        with self._lock:
+            rows, self._unsaved = self._unsaved, []
+        if not rows or self._conn is None:
+            return
+        with self._db_lock:
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO seen_messages (msg_id, received_at) VALUES (?, ?)",
+                                       rows)
+                now = time.time()
+                if now - self._last_prune > self.PRUNE_INTERVAL:
+                    self._prune(now)
+            except sqlite3.Error as e:
+                logger.error(f"写入消息去重记录失败: {e}")
+
+    def stop(self):
+        """停止后台写入并写入剩余的记录"""
+        self._stop.set()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.FLUSH_INTERVAL):
+            self.flush()
+
+    def _prune(self, now):
+        """清理数据库中超出时间窗口或数量上限的记录"""
+        self._last_prune = now
+        self._conn.execute("DELETE FROM seen_messages WHERE received_at <= ?", (now - self.window,))
+        self._conn.execute(
+            "DELETE FROM seen_messages WHERE msg_id NOT IN "
+            "(SELECT msg_id FROM seen_messages ORDER BY received_at DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        """获取去重统计"""
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "duplicates": self.duplicates,
+                "released": self.released,
+                "entries": len(self._seen),
+                "pending": len(self._pending),
+                "persistent": self._conn is not None,
+            }
@@ -0,0 +1,150 @@
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+# 非用户账号（公众号、腾讯游戏、微信团队等）
+NON_USER_ACCOUNTS = ("Tencent-Games", "weixin")
+# MsgSource中表示非用户消息的标签
+# 示例:<msgsource>\n\t<tips>3</tips>\n\t<bizmsg>\n\t\t<bizmsgshowtype>0</bizmsgshowtype>\n\t\t<bizmsgfromuser><![CDATA[weixin]]></bizmsgfromuser>\n\t</bizmsg>
+NON_USER_INDICATORS = (
+    "<tips>3</tips>",
+    "<bizmsgshowtype>",
+    "</bizmsgshowtype>",
+    "<bizmsgfromuser>",
+    "</bizmsgfromuser>"
+)
+# GeWeChatMessage能解析的消息类型
+SUPPORTED_MSG_TYPES = {1, 3, 34, 47, 49, 51, 10002}
+# 私聊中会被回复的消息类型（49可能是引用消息，解析后按文本处理）
+PRIVATE_REPLY_MSG_TYPES = {1, 34, 49}
+
+
+def is_non_user_message(msg_source, from_user_id):
+    """
+    检查消息是否来自非用户账号（如公众号、腾讯游戏、微信团队等）
+
+    Note:
+        通过以下方式判断是否为非用户消息：
+        1. 检查发送者ID是否为特殊账号或以特定前缀开头
+        2. 检查MsgSource中是否包含特定标签
+    """
+    if from_user_id in NON_USER_ACCOUNTS or from_user_id.startswith("gh_"):
+        return True
+    return any(indicator in msg_source for indicator in NON_USER_INDICATORS)
+
+
+def parse_msg_source(msg_source):
+    """解析MsgSource的XML，为空或解析失败时返回None"""
+    if not msg_source:
+        return None
+    try:
+        return ET.fromstring(msg_source)
+    except ET.ParseError:
+        return None
+
+
+def is_at_user(msg_source_root, push_content, to_user_id):
+    """
+    判断群聊消息是否@了to_user_id
+
+    Note:
+        优先从MsgSource的atuserlist（如 ",wxid_xxx,wxid_xxx"）中逐个匹配wxid；
+        MsgSource解析失败或没有atuserlist时，才根据PushContent中的提示判断
+
+    Args:
+        msg_source_root: parse_msg_source解析出的MsgSource根节点，可以为None
+        push_content: 消息的PushContent
+        to_user_id: 机器人的wxid
+    """
+    if msg_source_root is not None:
+        atuserlist_elem = msg_source_root.find('atuserlist')
+        if atuserlist_elem is not None:
+            atuserlist = atuserlist_elem.text or ""
+            return to_user_id in (user.strip() for user in atuserlist.split(","))
+    return '在群聊中@了你' in (push_content or '')
+
+
+class MessageFilter:
+    """
+    回调消息预分类
+    在构造GeWeChatMessage之前，只根据原始JSON字段判断消息是否需要处理，
+    不读配置文件、不调用gewechat接口，只有可能@了机器人的群聊消息才解析MsgSource的XML。被丢弃的消息按原因计数。
+    判断是保守的：只丢弃完整解析后也一定会被忽略的消息。
+    """
+
+    INVALID = "invalid"  # 缺少Data/NewMsgId等必要字段
+    NON_USER = "non_user"  # 公众号等非用户账号
+    STATUS_SYNC = "status_sync"  # MsgType 51 客户端状态同步
+    UNSUPPORTED = "unsupported_type"  # 无法解析的消息类型
+    SELF = "self"  # 自己发送的消息
+    EXPIRED = "expired"  # 过期的历史消息
+    GROUP_NOT_AT = "group_not_at"  # 没有@机器人的群聊消息
+    PRIVATE_UNHANDLED = "private_unhandled"  # 不回复的私聊消息类型（图片、表情等）
+
+    def __init__(self, max_age=60 * 5):
+        """
+        Args:
+            max_age: 消息的最大时效（秒），更早的消息视为历史消息
+        """
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._passed = 0
+        self._dropped = {}
+
+    def classify(self, data):
+        """
+        对原始回调消息预分类
+
+        Args:
+            data: 回调的JSON字典
+
+        Returns:
+            str: 丢弃原因，需要继续处理时返回None
+        """
+        reason = self._classify(data)
+        with self._lock:
+            if reason is None:
+                self._passed += 1
+            else:
+                self._dropped[reason] = self._dropped.get(reason, 0) + 1
+        return reason
+
+    def stats(self):
+        """获取分类统计"""
+        with self._lock:
+            return {"passed": self._passed, "dropped": dict(self._dropped)}
+
+    def _classify(self, data):
+        msg = data.get('Data') if isinstance(data, dict) else None
+        if not msg or 'NewMsgId' not in msg:
+            return self.INVALID
+        from_user_id = (msg.get('FromUserName') or {}).get('string', '')
+        msg_source = msg.get('MsgSource') or ''
+        msg_type = msg.get('MsgType')
+
+        if is_non_user_message(msg_source, from_user_id):
+            return self.NON_USER
+        if msg_type == 51:
+            return self.STATUS_SYNC
+        if msg_type not in SUPPORTED_MSG_TYPES:
+            return self.UNSUPPORTED
+        # 群系统消息（10002）需要完整解析以更新群成员缓存
+        if msg_type == 10002:
+            return None
+        if data.get('Wxid') == from_user_id:
+            return self.SELF
+        if int(msg.get('CreateTime') or 0) < int(time.time()) - self.max_age:
+            return self.EXPIRED
+
+        if "@chatroom" in from_user_id:
+            # 被@时MsgSource的atuserlist中包含机器人的wxid，或PushContent中有提示；与GeWeChatMessage.is_at的判断一致
+            to_user_id = (msg.get('ToUserName') or {}).get('string', '')
+            push_content = msg.get('PushContent') or ''
+            # MsgSource中完全没有出现机器人wxid且没有提示时一定没有被@，不需要解析XML
+            if to_user_id not in msg_source and '在群聊中@了你' not in push_content:
+                return self.GROUP_NOT_AT
+            if not is_at_user(parse_msg_source(msg_source), push_content, to_user_id):
+                return self.GROUP_NOT_AT
+        elif msg_type not in PRIVATE_REPLY_MSG_TYPES:
+            return self.PRIVATE_UNHANDLED
+        return None
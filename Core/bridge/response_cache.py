@@ -0,0 +1,312 @@
+import abc
+import math
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import requests
+
+from Core.Logger import Logger
+from Core.ttl_cache import TTLCache
+
+try:
+    import numpy as np
+except ImportError:  # 没有numpy时用纯Python计算相似度
+    np = None
+
+logger = Logger()
+
+# 只缓存不依赖临时文件的片段：语音片段指向会被回收的tmp文件或上游的临时链接
+CACHEABLE_TYPES = ("text", "emoji")
+
+
+def normalize_text(text):
+    """归一化消息文本：全半角统一、转小写，只保留文字和数字（去掉空白、标点和表情符号）"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(ch for ch in text if ch.isalnum())
+
+
+class Embedder(abc.ABC):
+    """文本向量化接口"""
+
+    @abc.abstractmethod
+    def embed(self, text):
+        """
+        Returns:
+            list[float]，失败时返回None
+        """
+
+
+class OpenAIEmbedder(Embedder):
+    """OpenAI兼容的 /embeddings 接口"""
+
+    def __init__(self, api_base, api_key, model="text-embedding-3-small", timeout=5):
+        self.url = api_base.rstrip("/") + "/embeddings"
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.model = model
+        self.timeout = timeout
+
+    def embed(self, text):
+        try:
+            response = requests.post(self.url, headers=self.headers, json={"model": self.model, "input": text},
+                                     timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"文本向量化失败: {e}")
+            return None
+        if response.status_code != 200:
+            logger.warning(f"文本向量化失败: 状态码 {response.status_code}, 响应内容: {response.text}")
+            return None
+        try:
+            return response.json()["data"][0]["embedding"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            # 语义层是可选的，响应格式不对时只跳过语义层，不影响正常回复
+            logger.warning(f"文本向量化响应格式错误: {e}, 响应内容: {response.text[:200]}")
+            return None
+
+
+def create_embedder(config):
+    """
+    根据配置创建向量化后端
+
+    配置项:
+        response_cache_embedding: openai / none，默认none（只使用精确匹配）
+        response_cache_embedding_api_base / response_cache_embedding_api_key / response_cache_embedding_model
+    """
+    backend = config.get("response_cache_embedding", "none")
+    if backend == "openai":
+        return OpenAIEmbedder(config.get("response_cache_embedding_api_base", "https://api.openai.com/v1"),
+                              config.get("response_cache_embedding_api_key"),
+                              config.get("response_cache_embedding_model", "text-embedding-3-small"))
+    if backend != "none":
+        logger.warning(f"未知的向量化后端: {backend}")
+    return None
+
+
+class VectorIndex:
+    """
+    本地向量索引：按命名空间保存单位向量，暴力计算余弦相似度
+    每个命名空间最多max_entries条，超出时淘汰最早写入的向量
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._spaces = {}  # namespace -> OrderedDict(key -> 单位向量)
+        self._matrices = {}  # namespace -> (keys, numpy矩阵)，写入或删除后重建
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector):
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def add(self, namespace, key, vector):
+        with self._lock:
+            space = self._spaces.setdefault(namespace, OrderedDict())
+            space[key] = self._unit(vector)
+            space.move_to_end(key)
+            while len(space) > self.max_entries:
+                space.popitem(last=False)
+            self._matrices.pop(namespace, None)
+
+    def remove(self, namespace, key):
+        with self._lock:
+            space = self._spaces.get(namespace)
+            if space and space.pop(key, None) is not None:
+                self._matrices.pop(namespace, None)
+
+    def search(self, namespace, vector, threshold):
+        """
+        查找最相似的向量
+
+        Returns:
+            (key, 相似度)，没有达到threshold的向量时返回(None, 最高相似度)
+        """
+        query = self._unit(vector)
+        with self._lock:
+            space = self._spaces.get(namespace)
+            if not space:
+                return None, 0.0
+            if np is not None:
+                cached = self._matrices.get(namespace)
+                if cached is None:
+                    cached = self._matrices[namespace] = (list(space), np.array(list(space.values())))
+                keys, matrix = cached
+                scores = matrix @ np.array(query)
+                best = int(scores.argmax())
+                key, score = keys[best], float(scores[best])
+            else:
+                key, score = max(((key, sum(a * b for a, b in zip(stored, query))) for key, stored in space.items()),
+                                 key=lambda item: item[1])
+        return (key, score) if score >= threshold else (None, score)
+
+    def clear(self, namespace=None):
+        with self._lock:
+            if namespace is None:
+                self._spaces.clear()
+                self._matrices.clear()
+            else:
+                self._spaces.pop(namespace, None)
+                self._matrices.pop(namespace, None)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(space) for space in self._spaces.values())
+
+
+class CacheLookup:
+    """一次查询的结果，未命中时可直接用于写入，避免重复向量化"""
+
+    __slots__ = ("namespace", "key", "segments", "tier", "vector", "similarity")
+
+    def __init__(self, namespace, key):
+        self.namespace = namespace
+        self.key = key
+        self.segments = None
+        self.tier = None  # exact / semantic
+        self.vector = None
+        self.similarity = None
+
+    @property
+    def hit(self):
+        return self.segments is not None
+
+
+class ResponseCache:
+    """
+    智能体回复缓存
+    以归一化后的消息文本为键（精确层），配置了向量化后端时再按语义相似度查找（语义层）。
+    每个智能体一个命名空间，条目按TTL过期、按LRU淘汰；缓存的是handle_response格式的回复片段，
+    命中后按原样逐个发送。只缓存短消息和只含文本/表情的回复。
+
+    配置项: response_cache_enabled、response_cache_ttl、response_cache_max_entries、response_cache_max_chars、
+           response_cache_similarity、response_cache_bypass_stateful，以及create_embedder的配置项
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_entries=1000, ttl=3600, max_chars=100, similarity=0.92, embedder=None):
+        """
+        Args:
+            max_entries: 最多缓存的回复数（所有智能体共用）
+            ttl: 回复的缓存时间（秒）
+            max_chars: 超过该长度的消息不查询也不缓存
+            similarity: 语义层命中所需的最低余弦相似度
+            embedder: 向量化后端，为None时只使用精确层
+        """
+        self.max_chars = max_chars
+        self.similarity = similarity
+        self.embedder = embedder
+        self._answers = TTLCache(maxsize=max_entries, ttl=ttl)  # (namespace, 归一化文本) -> 回复片段
+        self._index = VectorIndex(max_entries) if embedder else None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+
+    @classmethod
+    def get_instance(cls, config):
+        """
+        获取全局回复缓存，未开启（response_cache_enabled）时返回None，相关配置变化时重建
+        """
+        if not config.get("response_cache_enabled", False):
+            with cls._instance_lock:
+                cls._instance = None
+            return None
+        options = {
+            "max_entries": config.get("response_cache_max_entries", 1000),
+            "ttl": config.get("response_cache_ttl", 3600),
+            "max_chars": config.get("response_cache_max_chars", 100),
+            "similarity": config.get("response_cache_similarity", 0.92),
+        }
+        signature = (tuple(options.values()), config.get("response_cache_embedding", "none"),
+                     config.get("response_cache_embedding_api_base"), config.get("response_cache_embedding_api_key"),
+                     config.get("response_cache_embedding_model"))
+        with cls._instance_lock:
+            if cls._instance is None or cls._instance._signature != signature:
+                cls._instance = cls(embedder=create_embedder(config), **options)
+                cls._instance._signature = signature
+            return cls._instance
+
+    def lookup(self, namespace, text):
+        """
+        查询缓存的回复
+
+        Args:
+            namespace: 智能体命名空间
+            text: 用户消息
+
+        Returns:
+            CacheLookup，消息不适合缓存（过长或归一化后为空）时返回None
+        """
+        if len(text) > self.max_chars:
+            return None
+        key = normalize_text(text)
+        if not key:
+            return None
+
+        lookup = CacheLookup(namespace, key)
+        lookup.segments = self._answers.get((namespace, key))
+        if lookup.hit:
+            lookup.tier = "exact"
+            with self._lock:
+                self.exact_hits += 1
+            return lookup
+
+        if self.embedder is not None:
+            lookup.vector = self.embedder.embed(text)
+            if lookup.vector is not None:
+                similar, lookup.similarity = self._index.search(namespace, lookup.vector, self.similarity)
+                if similar is not None:
+                    lookup.segments = self._answers.get((namespace, similar))
+                    if lookup.hit:
+                        lookup.tier = "semantic"
+                        with self._lock:
+                            self.semantic_hits += 1
+                        return lookup
+                    # 回复已过期或被淘汰
+                    self._index.remove(namespace, similar)
+
+        with self._lock:
+            self.misses += 1
+        return lookup
+
+    def store(self, lookup, segments):
+        """
+        缓存本次查询对应的回复，包含不可缓存的片段时跳过
+
+        Args:
+            lookup: 未命中的CacheLookup
+            segments: handle_response格式的回复片段
+        """
+        if not segments or any(segment.get("type") not in CACHEABLE_TYPES for segment in segments):
+            with self._lock:
+                self.skipped += 1
+            return False
+        self._answers.set((lookup.namespace, lookup.key), [dict(segment) for segment in segments])
+        if self._index is not None and lookup.vector is not None:
+            self._index.add(lookup.namespace, lookup.key, lookup.vector)
+        with self._lock:
+            self.stores += 1
+        return True
+
+    def clear(self):
+        """清空缓存"""
+        self._answers.clear()
+        if self._index is not None:
+            self._index.clear()
+
+    def stats(self):
+        """获取命中统计"""
+        with self._lock:
+            stats = {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "skipped": self.skipped,
+            }
+        stats["answers"] = self._answers.stats()
+        stats["vectors"] = len(self._index) if self._index is not None else 0
+        return stats
@@ -0,0 +1,84 @@
+import os
+import re
+
+_MARKDOWN_LINK = re.compile(r'\[.*?\]\((.*?)\)', re.DOTALL)
+
+
+def build_segments(tag, content, voice_base_url=None):
+    """
+    将解析出的单个标签片段转换为handle_response格式的回复内容
+
+    Args:
+        tag: 标签名（text/voice/emoji）
+        content: 标签内的原始内容
+        voice_base_url: 语音地址前缀，如 http://dify服务器。传入时语音片段按Markdown链接解析出相对URL并拼接前缀，
+                        为None时语音片段的内容本身就是完整URL
+
+    Returns:
+        list: 回复内容列表
+    """
+    if tag == 'text':
+        return [{'type': 'text', 'content': content.strip()}]
+    if tag == 'voice':
+        if voice_base_url is None:
+            return [{'type': 'voice', 'content': content.strip()}]
+        return [{'type': 'voice', 'content': f"{voice_base_url}{voice_url}"}
+                for voice_url in _MARKDOWN_LINK.findall(content)]
+    if tag == 'emoji':
+        emoji_name = os.path.splitext(os.path.basename(content.strip()))[0]
+        return [{'type': 'emoji', 'content': emoji_name}]
+    return []
+
+
+class SegmentParser:
+    """
+    流式回复的增量标签解析器
+    智能体的回复由 <text>、<voice>、<emoji> 片段组成，逐块喂入流式内容，
+    每当某个片段的闭合标签到达时立即返回该片段，无需等待整个回复生成完毕。
+    标签之外的内容会被忽略（与一次性正则解析的行为一致）。
+    """
+
+    TAGS = ("text", "voice", "emoji")
+
+    def __init__(self, tags=TAGS):
+        self.tags = tuple(tags)
+        self._buffer = ""
+        # 为可能被截断在两个chunk之间的开始标签保留的尾部长度
+        self._keep = max(len(f"<{tag}>") for tag in self.tags) - 1
+
+    def feed(self, chunk):
+        """
+        喂入一段流式内容
+
+        Args:
+            chunk: 新到达的文本
+
+        Returns:
+            list: 已完整闭合的片段 [(tag, content), ...]，按出现顺序排列
+        """
+        if chunk:
+            self._buffer += chunk
+        segments = []
+        while True:
+            start, tag = self._find_open_tag()
+            if tag is None:
+                # 没有开始标签，只保留可能是半个开始标签的尾部
+                self._buffer = self._buffer[-self._keep:] if self._keep else ""
+                break
+            open_tag, close_tag = f"<{tag}>", f"</{tag}>"
+            end = self._buffer.find(close_tag, start + len(open_tag))
+            if end == -1:
+                # 片段尚未闭合，丢弃开始标签之前的无关内容，等待后续chunk
+                self._buffer = self._buffer[start:]
+                break
+            segments.append((tag, self._buffer[start + len(open_tag):end]))
+            self._buffer = self._buffer[end + len(close_tag):]
+        return segments
+
+    def _find_open_tag(self):
+        start, found = -1, None
+        for tag in self.tags:
+            index = self._buffer.find(f"<{tag}>")
+            if index != -1 and (start == -1 or index < start):
+                start, found = index, tag
+        return start, found
@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import deque
+
+from Core.Logger import Logger
+logger = Logger()
+
+
+class QueueFullError(Exception):
+    """队列已满且背压策略为reject时抛出"""
+
+
+class ShardedExecutor:
+    """
+    按会话排队的执行器
+    每个key（other_user_id）一个有界FIFO队列，有任务的会话轮流交给共享的工作线程池执行：
+    同一会话的消息严格串行，不同会话互不阻塞——某个会话的LLM调用很慢只会拖慢它自己，
+    某个会话刷屏时背压策略也只作用于它自己的队列，不会丢弃其他会话的消息。
+    所有会话排队的任务总数另有max_pending上限，超出时同样按背压策略处理（丢弃全局最早的任务或拒绝）。
+    """
+
+    POLICY_DROP_OLDEST = "drop_oldest"  # 队列满时丢弃最早入队的任务
+    POLICY_REJECT = "reject"  # 队列满时拒绝新任务
+
+    def __init__(self, workers=4, key_maxsize=50, max_pending=100, policy=POLICY_DROP_OLDEST, name="Shard"):
+        """
+        初始化执行器
+
+        Args:
+            workers: 工作线程数量
+            key_maxsize: 每个会话的队列长度上限（不含正在执行的任务）
+            max_pending: 所有会话排队任务总数的上限（不含正在执行的任务）
+            policy: 会话队列满时的背压策略，drop_oldest 或 reject
+            name: 工作线程名称前缀
+        """
+        if policy not in (self.POLICY_DROP_OLDEST, self.POLICY_REJECT):
+            raise ValueError(f"无效的背压策略: {policy}")
+        self.workers = max(1, int(workers))
+        self.key_maxsize = max(1, int(key_maxsize))
+        self.max_pending = max(1, int(max_pending))
+        self.policy = policy
+        self.name = name
+
+        self._queues = {}  # key -> deque[(func, args, kwargs, enqueued_at)]
+        self._ready = deque()  # 有排队任务且没有在执行的key，按变为就绪的先后轮转
+        self._active = set()
+        self._pending = 0  # 所有会话排队的任务总数
+        self._cond = threading.Condition()
+        self._stopped = False
+
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._rejected = 0
+        self._total_wait_ms = 0.0
+        self._max_wait_ms = 0.0
+
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"会话执行器已启动: {self.workers} 个工作线程, 每个会话队列上限 {self.key_maxsize}, "
+                    f"总排队上限 {self.max_pending}")
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        提交任务到key对应的会话队列
+
+        Raises:
+            QueueFullError: 会话队列或总排队数已满且策略为reject
+        """
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError(f"{self.name} 已停止")
+            queue = self._queues.get(key)
+            if queue is not None and len(queue) >= self.key_maxsize:
+                if self.policy == self.POLICY_REJECT:
+                    self._rejected += 1
+                    raise QueueFullError(f"{self.name} 会话 {key} 的队列已满 ({self.key_maxsize})")
+                self._drop(key)
+                logger.warning(f"[{self.name}] 会话队列已满，丢弃该会话最早的任务: key={key}")
+            elif self._pending >= self.max_pending:
+                if self.policy == self.POLICY_REJECT:
+                    self._rejected += 1
+                    raise QueueFullError(f"{self.name} 排队任务总数已满 ({self.max_pending})")
+                # 丢弃所有会话中最早入队的任务
+                oldest = min(self._queues, key=lambda k: self._queues[k][0][3])
+                self._drop(oldest)
+                logger.warning(f"[{self.name}] 排队任务总数已满，丢弃最早的任务: key={oldest}")
+
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque()
+                if key not in self._active:
+                    self._ready.append(key)
+            queue.append((func, args, kwargs, time.time()))
+            self._pending += 1
+            self._submitted += 1
+            self._cond.notify()
+
+    def _drop(self, key):
+        """丢弃key队列中最早的任务（调用方持有锁），队列空了就移除该会话"""
+        queue = self._queues[key]
+        queue.popleft()
+        self._pending -= 1
+        self._dropped += 1
+        if not queue:
+            del self._queues[key]
+            if key in self._ready:
+                self._ready.remove(key)
+
+    def depth(self, key=None):
+        """
+        返回排队任务数量
+
+        Args:
+            key: 指定时只返回该会话的队列深度，否则返回所有会话之和
+        """
+        with self._cond:
+            if key is not None:
+                queue = self._queues.get(key)
+                return len(queue) if queue else 0
+            return self._pending
+
+    def stats(self):
+        """
+        获取执行器统计
+
+        Returns:
+            dict: 排队深度、排队中的会话数、吞吐、丢弃计数与等待耗时
+        """
+        with self._cond:
+            deepest = max(self._queues.items(), key=lambda item: len(item[1]), default=(None, ()))
+            return {
+                "workers": self.workers,
+                "policy": self.policy,
+                "depth": self._pending,
+                "max_pending": self.max_pending,
+                "conversations": len(self._queues),
+                "active": len(self._active),
+                "submitted": self._submitted,
+                "processed": self._processed,
+                "failed": self._failed,
+                "dropped": self._dropped,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait_ms / self._processed, 2) if self._processed else 0.0,
+                "max_wait_ms": round(self._max_wait_ms, 2),
+                "deepest_key": deepest[0],
+                "deepest_depth": len(deepest[1]),
+            }
+
+    def stop(self, wait=True, timeout=None):
+        """停止执行器，已入队的任务会继续执行完"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join(timeout)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    if self._stopped and not self._queues:
+                        return
+                    self._cond.wait()
+                key = self._ready.popleft()
+                queue = self._queues[key]
+                func, args, kwargs, enqueued_at = queue.popleft()
+                self._pending -= 1
+                if not queue:
+                    del self._queues[key]
+                self._active.add(key)
+
+            wait_ms = (time.time() - enqueued_at) * 1000
+            if wait_ms > 1000:
+                logger.debug(f"[{self.name}] 任务排队 {wait_ms:.0f}ms: key={key}")
+            failed = False
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                failed = True
+                logger.error(f"[{self.name}] 消息处理过程中出现错误: {str(e)}")
+            finally:
+                with self._cond:
+                    self._active.discard(key)
+                    # 该会话还有排队任务时重新排到就绪队列末尾，让其他会话轮到执行
+                    if key in self._queues:
+                        self._ready.append(key)
+                        self._cond.notify()
+                    self._processed += 1
+                    self._total_wait_ms += wait_ms
+                    self._max_wait_ms = max(self._max_wait_ms, wait_ms)
+                    if failed:
+                        self._failed += 1
+                    if self._stopped and not self._queues:
+                        self._cond.notify_all()
@@ -0,0 +1,361 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from Core.Logger import Logger
+
+logger = Logger()
+
+TMP_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
+
+
+class TempArtifact:
+    """tmp目录中的一个临时文件"""
+
+    __slots__ = ("path", "job", "refs", "size", "created_at", "expires_at", "await_serve", "served_at", "deadline")
+
+    def __init__(self, path, job, refs, created_at, expires_at, await_serve):
+        self.path = path
+        self.job = job
+        self.refs = refs
+        self.size = 0
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.await_serve = await_serve  # 是否要等gewechat取走文件后才能删除
+        self.served_at = None
+        self.deadline = None  # 计划删除的时间，被引用时为None
+
+
+class TempJob:
+    """
+    一次任务（如一次混音、一次语音生成）创建的临时文件
+    退出作用域时释放本任务持有的引用；任务出错时不再等待文件被取走，直接删除。
+    """
+
+    def __init__(self, manager, name):
+        self.manager = manager
+        self.name = name
+        self.paths = []
+
+    def path(self, suffix="", prefix="", await_serve=False, ttl=None):
+        """在tmp目录中分配一个不会与其他任务冲突的文件路径，任务结束前不会被删除"""
+        path = self.manager.new_path(suffix=suffix, prefix=prefix, job=self.name, await_serve=await_serve, ttl=ttl)
+        self.paths.append(path)
+        return path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for path in self.paths:
+            if exc_type is not None:
+                self.manager.discard(path)
+            else:
+                self.manager.release(path)
+        return False
+
+
+class TempFileManager:
+    """
+    tmp目录临时文件的生命周期管理
+    每个临时文件登记引用计数：任务持有引用期间不会被删除；需要由gewechat拉取的文件（await_serve）
+    在Query.GET完整返回后确认"已取走"，再过served_grace秒删除，未被取走的文件到ttl后删除。
+    待删除的文件按删除时间放在小根堆中，由后台线程回收，清理开销只与到期的文件数有关，不再遍历整个目录；
+    文件总大小超过配额时，从最早登记的未被引用文件开始淘汰。
+    tmp下的子目录（如silk_cache）不由本类管理。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, root=TMP_ROOT, ttl=3600, served_grace=60, quota_bytes=512 * 1024 * 1024, reap_interval=30):
+        """
+        Args:
+            root: tmp目录
+            ttl: 临时文件最长保留时间（秒）
+            served_grace: 文件被取走后再保留的时间（秒），应对gewechat的重试
+            quota_bytes: tmp目录中临时文件的总大小上限（字节）
+            reap_interval: 后台回收的最大间隔（秒）
+        """
+        self.root = os.path.abspath(root)
+        self.ttl = ttl
+        self.served_grace = served_grace
+        self.quota_bytes = quota_bytes
+        self.reap_interval = reap_interval
+        self._lock = threading.Lock()
+        self._artifacts = OrderedDict()  # path -> TempArtifact，按登记顺序
+        self._deadlines = []  # (删除时间, 序号, path)
+        self._seq = itertools.count()
+        self._bytes = 0
+        self._listeners = []
+        self._stop = threading.Event()
+        self.created = 0
+        self.deleted = 0
+        self.served = 0
+        self.expired = 0
+        self.evicted = 0
+
+        os.makedirs(self.root, exist_ok=True)
+        self._adopt_orphans()
+        self._reaper = threading.Thread(target=self._reap_loop, name="tmp-reaper", daemon=True)
+        self._reaper.start()
+
+    @classmethod
+    def get_instance(cls, config=None):
+        """
+        获取全局唯一的临时文件管理器
+
+        配置项: tmp_file_ttl、tmp_served_grace、tmp_quota_mb、tmp_reap_interval
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                get = config.get if config else (lambda key, default=None: default)
+                cls._instance = cls(ttl=get("tmp_file_ttl", 3600),
+                                    served_grace=get("tmp_served_grace", 60),
+                                    quota_bytes=get("tmp_quota_mb", 512) * 1024 * 1024,
+                                    reap_interval=get("tmp_reap_interval", 30))
+            return cls._instance
+
+    def add_delete_listener(self, listener):
+        """注册文件删除后的回调（参数为文件路径），如关闭媒体服务缓存的文件描述符"""
+        self._listeners.append(listener)
+
+    def job(self, name):
+        """创建任务作用域：with manager.job("merge_voice") as job: path = job.path(".wav")"""
+        return TempJob(self, name)
+
+    def new_path(self, suffix="", prefix="", job=None, await_serve=False, ttl=None):
+        """
+        分配一个唯一的临时文件路径并登记，调用方持有一个引用，用完后调用release
+
+        Args:
+            suffix: 扩展名，如 .wav
+            prefix: 文件名前缀
+            job: 所属任务名称
+            await_serve: 是否需要等gewechat取走后再删除
+            ttl: 本文件的最长保留时间（秒），不传时使用默认ttl
+        """
+        path = os.path.join(self.root, f"{prefix}{uuid.uuid4().hex}{suffix}")
+        self._register(path, job, 1, await_serve, ttl)
+        return path
+
+    def register(self, path, job=None, await_serve=False, ttl=None, hold=False):
+        """
+        登记由其他代码写入tmp目录的文件
+
+        Args:
+            hold: 为True时调用方持有一个引用；为False时文件不被引用，在被取走或到期后删除
+        """
+        path = os.path.abspath(path)
+        if os.path.dirname(path) != self.root:
+            logger.warning(f"只管理tmp目录下的文件: {path}")
+            return path
+        self._register(path, job, 1 if hold else 0, await_serve, ttl)
+        return path
+
+    def acquire(self, path):
+        """增加文件的引用，文件未登记时返回False"""
+        with self._lock:
+            artifact = self._artifacts.get(os.path.abspath(path))
+            if artifact is None:
+                return False
+            artifact.refs += 1
+            artifact.deadline = None
+            self._measure(artifact)
+            return True
+
+    def release(self, path):
+        """释放文件的引用，没有引用后按状态计划删除"""
+        deleted = None
+        with self._lock:
+            artifact = self._artifacts.get(os.path.abspath(path))
+            if artifact is None:
+                return
+            artifact.refs = max(0, artifact.refs - 1)
+            self._measure(artifact)
+            if artifact.refs == 0:
+                deleted = self._schedule(artifact, time.time())
+            over_quota = self._enforce_quota()
+        self._unlink(([deleted] if deleted else []) + over_quota)
+
+    def discard(self, path):
+        """立即删除文件（不论引用与状态），用于任务失败时清理"""
+        with self._lock:
+            artifact = self._pop(os.path.abspath(path))
+        if artifact:
+            self._unlink([artifact])
+
+    def mark_served(self, path):
+        """
+        确认文件已被gewechat完整取走，由Query.GET在返回文件后调用
+
+        Returns:
+            bool: 文件由本类管理时返回True
+        """
+        deleted = None
+        with self._lock:
+            artifact = self._artifacts.get(os.path.abspath(path))
+            if artifact is None:
+                return False
+            if artifact.served_at is None:
+                self.served += 1
+            artifact.served_at = time.time()
+            if artifact.refs == 0:
+                deleted = self._schedule(artifact, artifact.served_at)
+        self._unlink([deleted] if deleted else [])
+        return True
+
+    def reap(self, now=None):
+        """删除到期的文件，返回删除数量"""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, _, path = heapq.heappop(self._deadlines)
+                artifact = self._artifacts.get(path)
+                # 堆中的旧记录（文件已删除、重新被引用或删除时间已改变）直接跳过
+                if artifact is None or artifact.deadline != deadline:
+                    continue
+                if artifact.served_at is None and artifact.await_serve:
+                    self.expired += 1
+                due.append(self._pop(path))
+        self._unlink(due)
+        return len(due)
+
+    def cleanup(self):
+        """删除所有登记的临时文件，程序退出时调用"""
+        self._stop.set()
+        with self._lock:
+            artifacts = list(self._artifacts.values())
+            self._artifacts.clear()
+            self._deadlines.clear()
+            self._bytes = 0
+        self._unlink(artifacts)
+        logger.info(f"已清理 {len(artifacts)} 个临时文件")
+
+    def stats(self):
+        """获取临时文件统计"""
+        with self._lock:
+            return {
+                "files": len(self._artifacts),
+                "bytes": self._bytes,
+                "referenced": sum(1 for artifact in self._artifacts.values() if artifact.refs),
+                "created": self.created,
+                "deleted": self.deleted,
+                "served": self.served,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+    def _register(self, path, job, refs, await_serve, ttl, created_at=None):
+        now = time.time() if created_at is None else created_at
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            old = self._artifacts.pop(path, None)
+            if old:
+                self._bytes -= old.size
+            artifact = self._artifacts[path] = TempArtifact(path, job, refs, now, now + ttl, await_serve)
+            self._measure(artifact)
+            self.created += 1
+            due = self._schedule(artifact, time.time(), released=False) if refs == 0 else None
+            over_quota = self._enforce_quota()
+        self._unlink(([due] if due else []) + over_quota)
+
+    def _schedule(self, artifact, now, released=True):
+        """
+        为不再被引用的文件计划删除时间（调用时持有锁）
+        任务释放的普通文件立即删除；等待被取走或登记时就不被引用的文件保留到ttl。
+
+        Returns:
+            应当立即删除的文件，否则返回None
+        """
+        if artifact.served_at is not None:
+            deadline = min(artifact.served_at + self.served_grace, artifact.expires_at)
+        elif artifact.await_serve or not released:
+            deadline = artifact.expires_at
+        else:
+            deadline = now
+        if deadline <= now:
+            return self._pop(artifact.path)
+        artifact.deadline = deadline
+        heapq.heappush(self._deadlines, (deadline, next(self._seq), artifact.path))
+        return None
+
+    def _measure(self, artifact):
+        """更新文件大小（调用时持有锁）"""
+        try:
+            size = os.path.getsize(artifact.path)
+        except OSError:
+            size = 0
+        self._bytes += size - artifact.size
+        artifact.size = size
+
+    def _enforce_quota(self):
+        """超过配额时从最早登记的未被引用文件开始淘汰（调用时持有锁）"""
+        evicted = []
+        if self._bytes <= self.quota_bytes:
+            return evicted
+        for artifact in list(self._artifacts.values()):
+            if self._bytes <= self.quota_bytes:
+                break
+            if artifact.refs == 0:
+                evicted.append(self._pop(artifact.path))
+                self.evicted += 1
+        if self._bytes > self.quota_bytes:
+            logger.warning(f"临时文件超过配额且均在使用中: {self._bytes} > {self.quota_bytes} 字节")
+        return evicted
+
+    def _pop(self, path):
+        """移除登记（调用时持有锁）"""
+        artifact = self._artifacts.pop(path, None)
+        if artifact:
+            self._bytes -= artifact.size
+            artifact.deadline = None
+        return artifact
+
+    def _unlink(self, artifacts):
+        for artifact in artifacts:
+            try:
+                os.remove(artifact.path)
+                logger.debug(f"已删除临时文件: {artifact.path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"删除临时文件 {artifact.path} 时出错: {e}")
+                continue
+            with self._lock:
+                self.deleted += 1
+            for listener in self._listeners:
+                try:
+                    listener(artifact.path)
+                except Exception as e:
+                    logger.error(f"临时文件删除回调出错: {e}")
+
+    def _adopt_orphans(self):
+        """启动时登记上次运行遗留的文件，按修改时间计算到期时间后回收（只在启动时遍历一次目录）"""
+        count = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                self._register(entry.path, None, 0, True, None, created_at=entry.stat().st_mtime)
+                count += 1
+        if count:
+            logger.info(f"登记了 {count} 个遗留的临时文件")
+
+    def _reap_loop(self):
+        while not self._stop.is_set():
+            with self._lock:
+                next_deadline = self._deadlines[0][0] if self._deadlines else None
+            timeout = self.reap_interval
+            if next_deadline is not None:
+                timeout = min(timeout, max(0.0, next_deadline - time.time()))
+            if self._stop.wait(timeout):
+                break
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"回收临时文件时出错: {e}")
@@ -0,0 +1,134 @@
+import threading
+
+from Core.Logger import Logger
+from Core.ttl_cache import TTLCache
+
+logger = Logger()
+
+# 负缓存标记：查询失败或联系人不存在
+_NOT_FOUND = object()
+
+
+class ContactCache:
+    """
+    联系人/群成员昵称缓存
+    避免每条消息都调用 get_brief_info 和 get_chatroom_member_list：
+    好友/群昵称按wxid缓存，群成员列表按群ID缓存为 {wxid: 展示名} 索引，
+    收到入群/退群等群系统消息(msg_type 10002)时使对应群的成员索引失效。
+    查询失败、联系人不存在或群成员列表中没有的wxid也会缓存negative_ttl秒，避免每条消息都重新请求。
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, client, ttl=600, maxsize=4096, negative_ttl=60):
+        """
+        Args:
+            client: GewechatClient实例
+            ttl: 缓存过期时间（秒）
+            maxsize: 每类缓存的最大条目数
+            negative_ttl: 查询失败或联系人不存在的缓存时间（秒）
+        """
+        self.client = client
+        self.negative_ttl = negative_ttl
+        self._nicknames = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._members = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._absent = TTLCache(maxsize=maxsize, ttl=negative_ttl)  # 群ID -> 不在成员列表中的wxid集合
+
+    @classmethod
+    def get_instance(cls, client):
+        """获取全局唯一的缓存实例"""
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls(client)
+            return cls._instance
+
+    def get_nickname(self, app_id, wxid):
+        """
+        获取好友或群的昵称
+
+        Returns:
+            str: 昵称，获取失败时返回None
+        """
+        nickname = self._nicknames.get(wxid)
+        if nickname is _NOT_FOUND:
+            return None
+        if nickname is not None:
+            return nickname
+
+        try:
+            brief_info_response = self.client.get_brief_info(app_id, [wxid])
+        except Exception as e:
+            logger.warning(f"[gewechat] 获取联系人信息失败: {wxid}, {e}")
+            brief_info_response = {}
+        if brief_info_response.get('ret') == 200 and brief_info_response.get('data'):
+            nickname = brief_info_response['data'][0].get('nickName', '') or ''
+            self._nicknames.set(wxid, nickname)
+            return nickname
+        self._nicknames.set(wxid, _NOT_FOUND, ttl=self.negative_ttl)
+        return None
+
+    def get_member_name(self, app_id, chatroom_id, wxid):
+        """
+        获取群成员的展示名（优先群昵称displayName，其次nickName）
+
+        Returns:
+            str: 展示名，成员不存在或获取失败时返回None
+        """
+        members = self._members.get(chatroom_id)
+        if members is _NOT_FOUND:
+            return None
+        if members is not None and wxid in members:
+            return members[wxid]
+        absent = self._absent.get(chatroom_id)
+        if absent is not None and wxid in absent:
+            return None
+
+        # 缓存未命中或出现新成员时才重新拉取群成员列表
+        fetched = self._fetch_members(app_id, chatroom_id)
+        if fetched is None and members is None:
+            self._members.set(chatroom_id, _NOT_FOUND, ttl=self.negative_ttl)
+            return None
+        members = fetched or members
+        if wxid in members:
+            return members[wxid]
+        # 拉取失败或成员确实不在列表中，短时间内不再为该wxid重新拉取
+        if absent is None:
+            absent = set()
+            self._absent.set(chatroom_id, absent)
+        absent.add(wxid)
+        return None
+
+    def invalidate_chatroom(self, chatroom_id):
+        """使群成员索引和群昵称失效"""
+        self._members.pop(chatroom_id)
+        self._absent.pop(chatroom_id)
+        self._nicknames.pop(chatroom_id)
+        logger.debug(f"[gewechat] 群成员缓存已失效: {chatroom_id}")
+
+    def invalidate(self, wxid):
+        """使好友昵称失效"""
+        self._nicknames.pop(wxid)
+
+    def stats(self):
+        """获取缓存命中统计"""
+        return {
+            "nicknames": self._nicknames.stats(),
+            "members": self._members.stats(),
+            "absent": self._absent.stats(),
+        }
+
+    def _fetch_members(self, app_id, chatroom_id):
+        try:
+            response = self.client.get_chatroom_member_list(app_id, chatroom_id)
+        except Exception as e:
+            logger.warning(f"[gewechat] 获取群成员列表失败: {chatroom_id}, {e}")
+            return None
+        member_list = (response.get('data') or {}).get('memberList', []) if response.get('ret', 0) == 200 else []
+        if not member_list:
+            return None
+        members = {
+            member_info['wxid']: member_info.get('displayName') or member_info.get('nickName') or ''
+            for member_info in member_list
+        }
+        self._members.set(chatroom_id, members)
+        return members
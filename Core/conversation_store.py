@@ -0,0 +1,133 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+from Core.Logger import Logger
+
+logger = Logger()
+
+
+class ConversationStore:
+    """
+    wxid -> conversation_id 对话映射存储
+    数据常驻内存，写入只标记为脏，由后台线程定期（或脏条目数达到阈值时）原子地刷盘：
+    先写临时文件再rename，进程退出时自动刷盘。同一个文件全局只有一个实例，管理器重建时复用。
+    """
+    _stores = {}
+    _stores_lock = threading.Lock()
+    _flusher = None
+
+    FLUSH_INTERVAL = 5.0  # 定期刷盘间隔（秒）
+    MAX_DIRTY = 50  # 脏条目数达到该值时立即刷盘
+
+    def __init__(self, file_path):
+        """
+        Args:
+            file_path: JSON文件路径
+        """
+        self.file_path = os.path.abspath(file_path)
+        self._lock = threading.RLock()
+        self._dirty = 0
+        self._data = self._load()
+
+    @classmethod
+    def open(cls, file_path):
+        """获取文件对应的存储实例，首次调用时启动后台刷盘线程"""
+        path = os.path.abspath(file_path)
+        with cls._stores_lock:
+            store = cls._stores.get(path)
+            if store is None:
+                store = cls._stores[path] = cls(path)
+            if cls._flusher is None:
+                cls._flusher = threading.Thread(target=cls._flush_loop, name="ConversationStoreFlusher", daemon=True)
+                cls._flusher.start()
+                atexit.register(cls.flush_all)
+            return store
+
+    @classmethod
+    def flush_all(cls):
+        """刷新所有存储实例（关闭程序前调用）"""
+        with cls._stores_lock:
+            stores = list(cls._stores.values())
+        for store in stores:
+            store.flush()
+
+    def get(self, wxid):
+        """获取wxid对应的conversation_id，不存在时返回None"""
+        with self._lock:
+            return self._data.get(wxid)
+
+    def set(self, wxid, conversation_id):
+        """设置conversation_id，值未变化时不会触发写盘"""
+        with self._lock:
+            if self._data.get(wxid) == conversation_id:
+                return
+            self._data[wxid] = conversation_id
+            self._dirty += 1
+            flush_now = self._dirty >= self.MAX_DIRTY
+        if flush_now:
+            self.flush()
+
+    def delete(self, wxid):
+        """删除单个对话映射"""
+        with self._lock:
+            if self._data.pop(wxid, None) is not None:
+                self._dirty += 1
+
+    def clear(self):
+        """清空所有对话映射并立即刷盘"""
+        with self._lock:
+            self._data = {}
+            self._dirty += 1
+        self.flush()
+
+    def keys(self):
+        """所有键的快照"""
+        with self._lock:
+            return list(self._data)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def flush(self):
+        """
+        将内存中的数据原子地写入文件（临时文件 + rename）
+
+        Returns:
+            bool: 是否执行了写盘
+        """
+        with self._lock:
+            if not self._dirty:
+                return False
+            snapshot = dict(self._data)
+            dirty = self._dirty
+            tmp_path = f"{self.file_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, indent=4, ensure_ascii=False)
+                os.replace(tmp_path, self.file_path)
+                self._dirty -= dirty
+                logger.debug(f"对话记录已保存: {self.file_path} ({len(snapshot)} 条)")
+                return True
+            except Exception as e:
+                logger.error(f"保存对话记录失败: {self.file_path}, {e}")
+                return False
+
+    def _load(self):
+        if not os.path.exists(self.file_path):
+            return {}
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                return json.load(f) or {}
+        except Exception as e:
+            logger.error(f"加载对话记录失败: {self.file_path}, {e}")
+            return {}
+
+    @classmethod
+    def _flush_loop(cls):
+        while True:
+            time.sleep(cls.FLUSH_INTERVAL)
+            cls.flush_all()
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from cozepy import Coze, TokenAuth
+from cozepy.request import SyncHTTPClient
+
+from Core.Logger import Logger
+
+logger = Logger()
+
+
+class _ClientEntry:
+    """一个SDK客户端及其连接统计"""
+
+    def __init__(self):
+        self.coze = None
+        self.http_client = None
+        self.build_seconds = 0.0
+        self.created_at = time.time()
+        self.hits = 0
+        self.requests = 0
+        self.connections = 0  # 新建的TCP连接数，其余请求复用了连接池中的连接
+        self._lock = threading.Lock()
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections += 1
+
+    def stats(self):
+        with self._lock:
+            requests, connections = self.requests, self.connections
+        return {
+            "hits": self.hits,
+            "requests": requests,
+            "connections": connections,
+            "reused": max(0, requests - connections),
+            "build_ms": round(self.build_seconds * 1000, 2),
+            "age_seconds": round(time.time() - self.created_at),
+        }
+
+
+class CozeClientRegistry:
+    """
+    Coze SDK客户端注册表
+    每个 (token, base_url) 只构造一次 Coze 客户端，多个CozeChatManager与多次对话共享它的HTTP连接池；
+    令牌变化时才构造新的客户端，旧客户端从注册表移除，进行中的请求结束后随管理器一起释放。
+    """
+    _clients = {}  # (token, base_url) -> _ClientEntry
+    _lock = threading.Lock()
+    builds = 0
+    build_seconds = 0.0
+
+    @classmethod
+    def get(cls, token, base_url, timeout):
+        """
+        获取客户端，不存在时构造
+
+        Args:
+            token: API访问令牌
+            base_url: API基础地址
+            timeout: httpx.Timeout，已有客户端的超时与之不同时直接更新
+
+        Returns:
+            Coze
+        """
+        key = (token, base_url)
+        with cls._lock:
+            entry = cls._clients.get(key)
+            if entry is not None:
+                entry.hits += 1
+                if entry.http_client.timeout != timeout:
+                    entry.http_client.timeout = timeout
+                return entry.coze
+
+            started_at = time.perf_counter()
+            entry = _ClientEntry()
+            entry.http_client = SyncHTTPClient(timeout=timeout, event_hooks={"request": [entry.on_request]})
+            entry.coze = Coze(auth=TokenAuth(token=token), base_url=base_url, http_client=entry.http_client)
+            entry.build_seconds = time.perf_counter() - started_at
+
+            # 同一地址的旧令牌客户端不再复用
+            for stale in [stale for stale in cls._clients if stale[1] == base_url]:
+                del cls._clients[stale]
+            cls._clients[key] = entry
+            cls.builds += 1
+            cls.build_seconds += entry.build_seconds
+            logger.info(f"构造Coze客户端: {base_url}，耗时 {entry.build_seconds * 1000:.1f}ms")
+            return entry.coze
+
+    @classmethod
+    def stats(cls):
+        """客户端构造次数、耗时与各客户端的连接复用情况"""
+        with cls._lock:
+            entries = list(cls._clients.items())
+            builds, build_seconds = cls.builds, cls.build_seconds
+        return {
+            "builds": builds,
+            "build_ms": round(build_seconds * 1000, 2),
+            "clients": {base_url: entry.stats() for (_, base_url), entry in entries},
+        }
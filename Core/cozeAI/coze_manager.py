@@ -1,72 +1,68 @@
 import os
-import json
 import sys
 import re
-from cozepy import Coze, TokenAuth, Message, ChatEventType, COZE_CN_BASE_URL
+import time
+import httpx
+from cozepy import Message, ChatEventType, COZE_CN_BASE_URL, CozeAPIError, CozeError
+
+from Core.bridge.segment_parser import SegmentParser, build_segments
+from Core.cozeAI.coze_client_registry import CozeClientRegistry
+from Core.llm_gateway import GatewayError, LLMGateway, UpstreamError
+from Core.session_store import open_session_store
 
 class CozeChatManager:
-    def __init__(self, api_token, base_url=COZE_CN_BASE_URL, config_file="coze_config.json"):
+    def __init__(self, api_token, base_url=COZE_CN_BASE_URL, config_file="coze_config.json", project_config=None):
         """
         初始化 CozeChatManager 类实例。
         :param api_token: Coze 平台的 API 访问令牌，如果未提供，则从环境变量 COZE_API_TOKEN 获取。
         :param base_url: Coze API 的基础 URL，默认为 Coze 官方地址。
         :param config_file: 用于存储用户对话 ID 的配置文件。
+        :param project_config: 项目配置，用于选择会话存储后端，为None时使用JSON文件。
         """
         self.api_token = api_token
 
-        self.coze = Coze(auth=TokenAuth(token=self.api_token), base_url=base_url)
-        self.config_file = config_file
-        self.config = self.load_config()
+        # 请求经LLM网关发出：并发上限、超时、熔断和耗时统计
+        self.gateway = LLMGateway.get("coze", project_config)
+        # SDK默认的读取超时很长，改用网关的连接/读取超时，上游无响应时不会一直占用工作线程
+        # 同一令牌和地址共享一个SDK客户端与连接池，令牌变化时才重新构造
+        self.coze = CozeClientRegistry.get(self.api_token, base_url,
+                                           httpx.Timeout(self.gateway.read_timeout,
+                                                         connect=self.gateway.connect_timeout))
         # 获取当前脚本的目录路径
         script_dir = os.path.dirname(os.path.abspath(__file__))
         sys.path.append(script_dir)
         
         # 构造配置文件的完整路径
         self.config_file = os.path.join(script_dir, config_file)
-        self.config = self.load_config()
-    def load_config(self):
-        """
-        加载配置文件，如果文件不存在则创建一个空的配置。
-        :return: 配置字典。
-        """
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as f:
-                return json.load(f)
-        else:
-            return {}
-
-    def save_config(self):
-        """
-        保存配置文件。
-        """
-        with open(self.config_file, 'w') as f:
-            json.dump(self.config, f, indent=4)
+        # 会话存储（JSON文件或SQLite），以智能体ID区分智能体
+        self.sessions = open_session_store(project_config, self.config_file)
 
-    def get_conversation_id(self, wxid):
+    def get_conversation_id(self, wxid, bot_id=""):
         """
         根据 wxid 获取 conversation_id，如果不存在则返回 None。
         :param wxid: 用户的微信 ID。
+        :param bot_id: 智能体的 ID。
         :return: conversation_id 或 None。
         """
-        return self.config.get(wxid)
+        return self.sessions.get("coze", bot_id, wxid)
 
-    def set_conversation_id(self, wxid, conversation_id):
+    def set_conversation_id(self, wxid, conversation_id, bot_id=""):
         """
-        为 wxid 设置 conversation_id，并保存到配置文件中。
+        为 wxid 设置 conversation_id，并保存到会话存储中。
         :param wxid: 用户的微信 ID。
         :param conversation_id: 对话 ID。
+        :param bot_id: 智能体的 ID。
         """
-        self.config[wxid] = conversation_id
-        self.save_config()
+        self.sessions.set("coze", bot_id, wxid, conversation_id)
         
-    def clear_all_conversations(self):
+    def clear_all_conversations(self, bot_id=None):
         """
-        清除所有对话记录，重置配置文件
+        清除对话记录
+        :param bot_id: 只清除该智能体的对话记录，为None时清除所有Coze对话记录。
         """
         print("正在清除所有Coze对话记录...")
-        self.config = {}
-        self.save_config()
-        print("所有Coze对话记录已清除")
+        count = self.sessions.invalidate("coze", bot_id)
+        print(f"所有Coze对话记录已清除（{count} 条）")
 
     def handle_response(self, response):
         # 假设 response 是一个字典，包含返回的内容
@@ -110,40 +106,103 @@ class CozeChatManager:
         print(f"results:{results}")
         return results
 
-    def chat_with_bot(self, bot_id: str, wxid: str, user_message: str):
+    def chat_with_bot(self, bot_id: str, wxid: str, user_message: str, on_segment=None):
         """
         与智能体进行对话。
         :param bot_id: 智能体的 ID。
         :param wxid: 用户的微信 ID。
         :param user_message: 用户发送的消息。
-        :return: 包含对话 ID 和智能体的回复内容的字典。
+        :param on_segment: 片段回调，传入时每个 </text>、</voice>、</emoji> 闭合即以handle_response格式回调，
+                           无需等待整个回复生成完毕。
+        :return: 包含智能体回复内容、已分发片段数量、是否完整生成和耗时统计的字典；
+                 请求失败时 response 为错误信息。
         """
-        conversation_id = self.get_conversation_id(wxid)
+        conversation_id = self.get_conversation_id(wxid, bot_id)
         if conversation_id:
             print(f"Continuing conversation with ID: {conversation_id}")
         else:
             print("Starting a new conversation.")
 
-        chat_iterator = self.coze.chat.stream(
-            bot_id=bot_id,
-            user_id=wxid,
-            conversation_id=conversation_id,
-            additional_messages=[Message.build_user_question_text(user_message)]
-        )
-
+        started_at = time.time()
+        parser = SegmentParser()
+        segment_timings = []
         response = ""
-        for event in chat_iterator:
+        completed = False
+
+        def consume(deadline):
+            """读取流式回复，只有5xx、429和超时抛出（计入熔断），鉴权、参数等错误作为错误信息返回"""
+            try:
+                chat_iterator = self.coze.chat.stream(
+                    bot_id=bot_id,
+                    user_id=wxid,
+                    conversation_id=conversation_id,
+                    additional_messages=[Message.build_user_question_text(user_message)]
+                )
+                for event in chat_iterator:
+                    # 两次事件之间由读取超时限制，整个回复由总时限限制
+                    deadline.check()
+                    handle_event(event)
+            except CozeAPIError as e:
+                # 响应无法解析时code为HTTP状态码，否则为Coze的业务错误码
+                if e.code == 429 or (e.code is not None and 500 <= e.code < 600):
+                    raise UpstreamError(e.code, e.msg) from e
+                return f"Coze API错误: {e}"
+            except CozeError as e:
+                return f"Coze API错误: {e}"
+            except httpx.TimeoutException:
+                raise
+            except httpx.HTTPError as e:
+                return f"Coze请求异常: {e}"
+
+        def handle_event(event):
+            nonlocal conversation_id, response, completed
             if event.event == ChatEventType.CONVERSATION_CHAT_CREATED or event.event == ChatEventType.CONVERSATION_CHAT_IN_PROGRESS:
-                # 获取对话的 ID
-                conversation_id = event.chat.conversation_id
-                self.set_conversation_id(wxid, conversation_id)
+                # 获取对话的 ID，只在变化时保存
+                if event.chat.conversation_id != conversation_id:
+                    conversation_id = event.chat.conversation_id
+                    self.set_conversation_id(wxid, conversation_id, bot_id)
+            elif event.event == ChatEventType.CONVERSATION_CHAT_COMPLETED:
+                completed = True
             elif event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
                 # 获取增量消息
                 if event.message:
                     response += event.message.content
-
+                    if on_segment is None:
+                        return
+                    for tag, content in parser.feed(event.message.content):
+                        for segment in build_segments(tag, content):
+                            # 记录每个片段相对请求开始的耗时
+                            segment_timings.append(round((time.time() - started_at) * 1000))
+                            on_segment(segment)
+
+        try:
+            # 流式回复在读取过程中就会发送消息，不能对冲
+            error_msg = self.gateway.call(consume)
+        except GatewayError as e:
+            error_msg = f"Coze请求被中止: {e}"
+        except httpx.HTTPError as e:
+            error_msg = f"Coze请求异常: {e}"
+
+        timings = {
+            "first_segment_ms": segment_timings[0] if segment_timings else None,
+            "segment_ms": segment_timings,
+            "total_ms": round((time.time() - started_at) * 1000),
+        }
+        if error_msg:
+            print(error_msg)
+            return {
+                "response": error_msg,
+                "segments": len(segment_timings),
+                "completed": False,
+                "timings": timings
+            }
+        if on_segment is not None:
+            print(f"Coze stream finished: {len(segment_timings)} segments, timings: {timings}")
         return {
-            "response": response
+            "response": response,
+            "segments": len(segment_timings),
+            "completed": completed,
+            "timings": timings
         }
 
 # 示例用法
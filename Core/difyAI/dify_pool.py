@@ -0,0 +1,252 @@
+import threading
+
+import requests
+
+from Core.Logger import Logger
+from Core.llm_gateway import CircuitBreaker, LLMGateway
+from Core.session_store import agent_key
+
+logger = Logger()
+
+
+class DifyBackend:
+    """一个Dify后端（服务器地址 + 应用API Key）"""
+
+    def __init__(self, name, server_ip, api_key, weight=1, gateway=None):
+        self.name = name
+        self.server_ip = server_ip
+        self.api_key = api_key
+        self.weight = max(1, int(weight))
+        self.gateway = gateway
+        # 会话按后端保存：同一wxid在不同后端的对话互不相干，增删其他后端不影响该后端的会话
+        self.agent = agent_key(server_ip, api_key)
+        self.base_url = f"http://{server_ip}/v1" if not server_ip.startswith(('http://', 'https://')) else f"{server_ip}/v1"
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        self.healthy = True
+        self.failures = 0  # 连续失败次数
+        self.outstanding = 0  # 进行中的请求数
+        self.current_weight = 0  # 平滑加权轮询的当前权重
+        self.requests = 0
+        self.last_error = None
+
+    def available(self):
+        """健康且熔断器没有打开"""
+        return self.healthy and (self.gateway is None or self.gateway.breaker.state != CircuitBreaker.OPEN)
+
+
+class DifyBackendPool:
+    """
+    Dify后端池
+    从配置项 dify_backends（[{"name", "server_ip", "api_key", "weight"}, ...]）读取多个后端，
+    未配置时使用 dify_server_ip / dify_api_key 作为唯一后端。
+    按平滑加权轮询（weighted_round_robin）或最少进行中请求（least_outstanding）选择健康的后端；
+    后端连续失败max_failures次后标记为不健康，由后台健康检查（GET /v1/parameters）恢复。
+    每个后端使用独立的LLM网关（并发上限、熔断），配置项沿用 dify_ 前缀。
+
+    配置项: dify_backends、dify_balance、dify_health_interval、dify_backend_max_failures
+    """
+    _current = None
+    _current_lock = threading.Lock()
+
+    WEIGHTED_ROUND_ROBIN = "weighted_round_robin"
+    LEAST_OUTSTANDING = "least_outstanding"
+
+    def __init__(self, backends, strategy=WEIGHTED_ROUND_ROBIN, health_interval=30, max_failures=3,
+                 verify_ssl=False):
+        """
+        Args:
+            backends: DifyBackend列表
+            strategy: 选择策略
+            health_interval: 健康检查间隔（秒），为0时不做主动检查
+            max_failures: 连续失败多少次后标记为不健康
+            verify_ssl: 健康检查是否校验证书
+        """
+        if not backends:
+            raise ValueError("至少需要一个Dify后端")
+        self.backends = backends
+        self._by_name = {backend.name: backend for backend in backends}
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.verify_ssl = verify_ssl
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.failovers = 0
+        # 后端池的标识（如回复缓存的命名空间）使用第一个后端的agent键，单后端时与升级前一致
+        self.agent = backends[0].agent
+        if health_interval and len(backends) > 1:
+            threading.Thread(target=self._health_loop, name="dify-health", daemon=True).start()
+
+    @classmethod
+    def get(cls, config):
+        """获取配置对应的后端池，后端配置变化时重建（旧池停止健康检查）"""
+        entries = cls._entries(config)
+        signature = (tuple((entry["name"], entry["server_ip"], entry["api_key"], entry["weight"]) for entry in entries),
+                     config.get("dify_balance", cls.WEIGHTED_ROUND_ROBIN),
+                     config.get("dify_health_interval", 30),
+                     config.get("dify_backend_max_failures", 3))
+        with cls._current_lock:
+            pool = cls._current
+            if pool is not None and pool._signature == signature:
+                return pool
+            if pool is not None:
+                pool.stop()
+            if len(entries) == 1:
+                # 单后端沿用平台级网关
+                gateways = [LLMGateway.get("dify", config)]
+            else:
+                gateways = [LLMGateway.get(f"dify:{entry['name']}", config, prefix="dify") for entry in entries]
+            backends = [DifyBackend(entry["name"], entry["server_ip"], entry["api_key"], entry["weight"], gateway)
+                        for entry, gateway in zip(entries, gateways)]
+            pool = cls(backends, strategy=signature[1], health_interval=signature[2], max_failures=signature[3],
+                       verify_ssl=config.get("dify_verify_ssl", False))
+            pool._signature = signature
+            cls._current = pool
+            logger.info(f"Dify后端池: {[backend.name for backend in backends]}, 策略: {pool.strategy}")
+            return pool
+
+    @classmethod
+    def agents(cls, config):
+        """配置中各后端会话使用的agent键，用于判断配置变化后哪些后端的会话需要清除"""
+        return {agent_key(entry["server_ip"], entry["api_key"]) for entry in cls._entries(config)}
+
+    @staticmethod
+    def _entries(config):
+        backends = config.get("dify_backends") or []
+        entries = []
+        for index, backend in enumerate(backends):
+            if not backend.get("server_ip") or not backend.get("api_key"):
+                logger.warning(f"忽略缺少server_ip或api_key的Dify后端: {backend.get('name', index)}")
+                continue
+            entries.append({"name": str(backend.get("name") or f"backend{index}"), "server_ip": backend["server_ip"],
+                            "api_key": backend["api_key"], "weight": backend.get("weight", 1)})
+        if not entries:
+            entries.append({"name": "default", "server_ip": config.get("dify_server_ip"),
+                            "api_key": config.get("dify_api_key"), "weight": 1})
+        return entries
+
+    def __len__(self):
+        return len(self.backends)
+
+    def get_backend(self, name):
+        """按名称获取后端，不存在时返回None"""
+        return self._by_name.get(name)
+
+    def route(self, sticky=None, exclude=()):
+        """
+        为请求选择后端：签发会话的后端可用时优先使用（会话粘滞），否则按策略选择
+
+        Args:
+            sticky: 会话所在的后端名称
+            exclude: 本次请求已经失败过的后端名称
+
+        Returns:
+            DifyBackend，所有后端都被排除时返回None
+        """
+        backend = self._by_name.get(sticky)
+        if backend is not None and backend.name not in exclude and backend.available():
+            return backend
+        chosen = self.choose(exclude)
+        if sticky is not None and chosen is not None and chosen.name != sticky:
+            with self._lock:
+                self.failovers += 1
+            logger.warning(f"Dify后端 {sticky} 不可用，会话切换到 {chosen.name}")
+        return chosen
+
+    def choose(self, exclude=()):
+        """按策略从可用后端中选择一个，没有可用后端时退而使用未被排除的后端"""
+        candidates = [backend for backend in self.backends if backend.name not in exclude]
+        if not candidates:
+            return None
+        healthy = [backend for backend in candidates if backend.available()] or candidates
+        with self._lock:
+            if self.strategy == self.LEAST_OUTSTANDING:
+                return min(healthy, key=lambda backend: (backend.outstanding / backend.weight, backend.requests))
+            # 平滑加权轮询：每次所有候选加上自身权重，选当前权重最大者，再减去总权重
+            total = sum(backend.weight for backend in healthy)
+            for backend in healthy:
+                backend.current_weight += backend.weight
+            chosen = max(healthy, key=lambda backend: backend.current_weight)
+            chosen.current_weight -= total
+            return chosen
+
+    def begin(self, backend):
+        """记录请求开始"""
+        with self._lock:
+            backend.outstanding += 1
+            backend.requests += 1
+
+    def end(self, backend, ok, error=None):
+        """
+        记录请求结束，连续失败达到上限时标记为不健康
+
+        Args:
+            ok: 请求是否成功，为None时请求没有到达后端（如被网关在本地拒绝），不影响健康状态
+        """
+        with self._lock:
+            backend.outstanding -= 1
+            if ok is None:
+                return
+            if ok:
+                backend.failures = 0
+                backend.healthy = True
+                return
+            backend.failures += 1
+            backend.last_error = str(error) if error else None
+            if backend.failures >= self.max_failures and backend.healthy:
+                backend.healthy = False
+                logger.warning(f"Dify后端 {backend.name} 连续失败 {backend.failures} 次，标记为不健康")
+
+    def check_health(self):
+        """对所有后端做一次健康检查"""
+        for backend in self.backends:
+            try:
+                response = requests.get(f"{backend.base_url}/parameters", headers=backend.headers,
+                                        verify=self.verify_ssl, timeout=(3, 5))
+                ok = response.status_code == 200
+                error = None if ok else f"状态码 {response.status_code}"
+            except requests.exceptions.RequestException as e:
+                ok, error = False, str(e)
+            with self._lock:
+                if ok and not backend.healthy:
+                    logger.info(f"Dify后端 {backend.name} 已恢复")
+                elif not ok and backend.healthy:
+                    logger.warning(f"Dify后端 {backend.name} 健康检查失败: {error}")
+                backend.healthy = ok
+                if ok:
+                    backend.failures = 0
+                else:
+                    backend.last_error = error
+
+    def stop(self):
+        """停止健康检查"""
+        self._stop.set()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"Dify健康检查出错: {e}")
+
+    def stats(self):
+        """获取后端池统计"""
+        with self._lock:
+            backends = {
+                backend.name: {
+                    "healthy": backend.healthy,
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "weight": backend.weight,
+                    "last_error": backend.last_error,
+                }
+                for backend in self.backends
+            }
+            failovers = self.failovers
+        for backend in self.backends:
+            backends[backend.name]["gateway"] = backend.gateway.stats() if backend.gateway else None
+        return {"strategy": self.strategy, "failovers": failovers, "backends": backends}
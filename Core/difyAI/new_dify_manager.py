@@ -2,6 +2,7 @@ import os
 import json
 import sys
 import re
+import time
 import requests
 
 # 获取项目根目录
@@ -10,6 +11,10 @@ root_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_file_path)))
 sys.path.append(root_dir)
 
 from config import Config
+from Core.bridge.segment_parser import SegmentParser, build_segments
+from Core.difyAI.dify_pool import DifyBackendPool
+from Core.llm_gateway import CircuitOpenError, GatewayBusyError, GatewayError, UpstreamError
+from Core.session_store import open_session_store
 
 
 class NewDifyManager:
@@ -26,46 +31,20 @@ class NewDifyManager:
         self.config_file = os.path.join(current_dir, config_file)
         print(f"配置文件路径: {self.config_file}")
         
-        self.config = self.load_config()
         self.project_config = project_config
-        self.api_key = self.project_config.get("dify_api_key")
-
-        # Dify API 基础URL - 使用http而不是https
-        server_ip = self.project_config.get('dify_server_ip')
-        self.dify_server_ip = server_ip
-        self.base_url = f"http://{server_ip}/v1" if not server_ip.startswith(('http://', 'https://')) else f"{server_ip}/v1"
-        print(f"Dify API URL: {self.base_url}")
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-
-    def load_config(self):
-        """
-        加载配置文件，如果文件不存在则创建一个空的配置。
-        :return: 配置字典。
-        """
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"加载配置文件失败: {e}")
-                return {}
-        else:
-            print(f"配置文件不存在，将创建新文件: {self.config_file}")
-            return {}
-
-    def save_config(self):
-        """
-        保存配置文件。
-        """
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=4, ensure_ascii=False)
-            print(f"配置已保存到: {self.config_file}")
-        except Exception as e:
-            print(f"保存配置文件失败: {e}")
+        # Dify后端池（dify_backends，未配置时为 dify_server_ip + dify_api_key），每个后端的请求经各自的LLM网关发出
+        self.pool = DifyBackendPool.get(self.project_config)
+        primary = self.pool.backends[0]
+        self.api_key = primary.api_key
+        self.dify_server_ip = primary.server_ip
+        self.base_url = primary.base_url
+        print(f"Dify API URL: {[backend.base_url for backend in self.pool.backends]}")
+        self.headers = primary.headers
+        self.gateway = primary.gateway
+        self.verify_ssl = self.project_config.get("dify_verify_ssl", False)
+        # 会话存储（JSON文件或SQLite），会话按签发它的后端（服务器地址+API Key）保存
+        self.sessions = open_session_store(self.project_config, self.config_file)
+        self.agent = self.pool.agent
 
     def get_conversation_id(self, wxid):
         """
@@ -73,25 +52,40 @@ class NewDifyManager:
         :param wxid: 用户的微信 ID。
         :return: conversation_id 或 None。
         """
-        return self.config.get(wxid)
+        return self.get_session(wxid)[0]
+
+    def get_session(self, wxid):
+        """
+        查找 wxid 在各后端中的对话
+        :param wxid: 用户的微信 ID。
+        :return: (conversation_id, 签发该对话的后端)，不存在时均为 None。
+        """
+        for backend in self.pool.backends:
+            conversation_id, backend_name = self.sessions.get_session("dify", backend.agent, wxid)
+            # JSON存储不区分agent，以记录的后端名称为准；旧版本保存的会话没有后端名称，视为第一个后端签发
+            if conversation_id and backend_name in (None, backend.name):
+                return conversation_id, backend
+        return None, None
 
-    def set_conversation_id(self, wxid, conversation_id):
+    def set_conversation_id(self, wxid, conversation_id, backend=None):
         """
-        为 wxid 设置 conversation_id，并保存到配置文件中。
+        为 wxid 设置 conversation_id，并保存到会话存储中。
         :param wxid: 用户的微信 ID。
         :param conversation_id: 对话 ID。
+        :param backend: 签发该对话的后端名称，为None时为第一个后端。
         """
-        self.config[wxid] = conversation_id
-        self.save_config()
+        backend = self.pool.get_backend(backend) or self.pool.backends[0]
+        self.sessions.set("dify", backend.agent, wxid, conversation_id, backend=backend.name)
 
-    def clear_all_conversations(self):
+    def clear_all_conversations(self, agents=None):
         """
-        清除所有对话记录，重置配置文件
+        清除对话记录
+        :param agents: 只清除这些后端agent键下的对话记录，为None时清除所有后端的对话记录。
         """
+        agents = {backend.agent for backend in self.pool.backends} if agents is None else agents
         print("正在清除所有对话记录...")
-        self.config = {}
-        self.save_config()
-        print("所有对话记录已清除")
+        count = sum(self.sessions.invalidate("dify", agent) for agent in agents)
+        print(f"所有对话记录已清除（{count} 条）")
 
     def handle_response(self, response):
         """
@@ -101,6 +95,9 @@ class NewDifyManager:
         """
         results = []
         content = response.get('answer', '')
+        # 语音URL是相对地址，使用给出回复的后端的服务器地址
+        backend = self.pool.get_backend(response.get('backend'))
+        server_ip = backend.server_ip if backend else self.dify_server_ip
         
         # 检查返回的内容类型
         if '<text>' in content:
@@ -121,7 +118,7 @@ class NewDifyManager:
             if voice_contents:
                 for voice_url in voice_contents:
                     # 构建完整的URL
-                    full_url = f"http://{self.dify_server_ip}{voice_url}"
+                    full_url = f"http://{server_ip}{voice_url}"
                     results.append({
                         'type': 'voice',
                         'content': full_url
@@ -142,63 +139,208 @@ class NewDifyManager:
         print(f"results:{results}")
         return results
 
+    def chat_with_bot_stream(self, wxid=None, user_message=None, on_segment=None):
+        """
+        以streaming模式与Dify应用对话，每个片段的闭合标签到达时立即回调on_segment
+        后端请求失败且还没有发出任何片段时，换一个后端开始新对话重试
+        :param wxid: 用户微信ID
+        :param user_message: 用户消息内容
+        :param on_segment: 片段回调，参数为handle_response格式的单个回复内容
+        :return: 包含完整回复、已分发片段数量和是否完整生成的字典
+        """
+        if not wxid or not user_message:
+            raise ValueError("wxid和user_message参数不能为空")
+
+        answer = ""
+        segment_count = 0
+        started_at = time.time()
+        failed = []
+
+        def consume(deadline, backend, payload):
+            nonlocal answer, segment_count
+            # 换后端重试时丢弃上一次尝试中未闭合的文本
+            answer = ""
+            conversation_id = payload.get("conversation_id")
+            completed = False  # 收到message_end才算完整生成，出错或连接提前关闭时为False
+            parser = SegmentParser()
+            with requests.post(f"{backend.base_url}/chat-messages", headers=backend.headers, json=payload,
+                               verify=self.verify_ssl, stream=True, timeout=deadline.timeout()) as response:
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise UpstreamError(response.status_code, response.text)
+                if response.status_code != 200:
+                    error_msg = f"API请求失败: 状态码 {response.status_code}, 响应内容: {response.text}"
+                    print(error_msg)
+                    return {"answer": error_msg, "segments": 0}
+
+                for line in response.iter_lines(decode_unicode=True):
+                    # 两次读取之间由读取超时限制，整个回复由总时限限制
+                    deadline.check()
+                    # SSE格式: data: {...}
+                    if not line or not line.startswith("data:"):
+                        continue
+                    try:
+                        event = json.loads(line[len("data:"):].strip())
+                    except json.JSONDecodeError:
+                        continue
+
+                    event_type = event.get("event")
+                    # 提取并保存conversation_id（只在变化时写入），同时记录签发会话的后端
+                    new_conversation_id = event.get("conversation_id")
+                    if new_conversation_id and new_conversation_id != conversation_id:
+                        conversation_id = new_conversation_id
+                        self.set_conversation_id(wxid, conversation_id, backend=backend.name)
+
+                    if event_type in ("message", "agent_message"):
+                        chunk = event.get("answer", "")
+                        answer += chunk
+                        for tag, content in parser.feed(chunk):
+                            for segment in build_segments(tag, content, voice_base_url=f"http://{backend.server_ip}"):
+                                segment_count += 1
+                                if segment_count == 1:
+                                    print(f"首个片段耗时: {(time.time() - started_at) * 1000:.0f}ms")
+                                if on_segment:
+                                    on_segment(segment)
+                    elif event_type == "message_end":
+                        completed = True
+                    elif event_type == "error":
+                        print(f"流式响应错误: {event}")
+                        break
+
+            print(f"流式响应完成，共 {segment_count} 个片段，总耗时: {(time.time() - started_at) * 1000:.0f}ms")
+            return {"answer": answer, "conversation_id": conversation_id, "segments": segment_count,
+                    "completed": completed, "backend": backend.name}
+
+        while True:
+            backend, conversation_id = self._route(wxid, exclude=failed)
+            payload = self._build_payload(wxid, user_message, "streaming", conversation_id)
+            try:
+                print(f"发送流式请求到: {backend.base_url}/chat-messages（后端 {backend.name}）")
+                # 流式回复在读取过程中就会发送消息，不能对冲
+                return self._call(backend, consume, backend, payload)
+            except GatewayBusyError as e:
+                # 后端本身正常，只是本地并发已满：继续对话时不换后端（换后端会丢失上下文）
+                error_msg = f"请求异常: {str(e)}"
+                print(error_msg)
+                failed.append(backend.name)
+                if conversation_id or len(failed) >= len(self.pool):
+                    return {"answer": error_msg, "segments": segment_count}
+            except (requests.exceptions.RequestException, GatewayError) as e:
+                error_msg = f"请求异常: {str(e)}"
+                print(error_msg)
+                failed.append(backend.name)
+                # 已经发出的片段不能撤回，只在没有任何输出时换后端重试
+                if segment_count or len(failed) >= len(self.pool):
+                    return {"answer": error_msg, "segments": segment_count}
+
     def chat_with_bot(self, wxid=None, user_message=None):
         """
-        与Dify应用进行对话
+        与Dify应用进行对话，后端请求失败时换一个后端开始新对话重试
         :param wxid: 用户微信ID
         :param user_message: 用户消息内容
         :return: 包含回复内容的字典
         """
         if not wxid or not user_message:
             raise ValueError("wxid和user_message参数不能为空")
-            
-        conversation_id = self.get_conversation_id(wxid)
-        endpoint = f"{self.base_url}/chat-messages"
-        
+
+        failed = []
+        while True:
+            backend, conversation_id = self._route(wxid, exclude=failed)
+            payload = self._build_payload(wxid, user_message, "blocking", conversation_id)
+            endpoint = f"{backend.base_url}/chat-messages"
+            try:
+                print(f"发送请求到: {endpoint}（后端 {backend.name}）")
+                print(f"请求参数: {payload}")
+                # 新对话重复发送没有副作用（多出的对话不会被记录），可以对冲；继续对话时对冲会重复提问
+                response = self._call(backend, self._post, backend, payload, hedge=not conversation_id)
+
+                if response.status_code != 200:
+                    error_msg = f"API请求失败: 状态码 {response.status_code}"
+                    try:
+                        error_data = response.json()
+                        error_msg += f", 错误信息: {error_data}"
+                    except:
+                        error_msg += f", 响应内容: {response.text}"
+                    print(error_msg)
+                    return {"answer": error_msg}
+
+                data = response.json()
+                print(f"API响应: {data}")
+
+                # 提取并保存conversation_id，同时记录签发会话的后端
+                if "conversation_id" in data:
+                    self.set_conversation_id(wxid, data["conversation_id"], backend=backend.name)
+                data["backend"] = backend.name
+                data["completed"] = True
+                return data
+            except GatewayBusyError as e:
+                # 后端本身正常，只是本地并发已满：继续对话时不换后端（换后端会丢失上下文）
+                error_msg = f"请求异常: {str(e)}"
+                print(error_msg)
+                failed.append(backend.name)
+                if conversation_id or len(failed) >= len(self.pool):
+                    return {"answer": error_msg}
+            except (requests.exceptions.RequestException, GatewayError) as e:
+                error_msg = f"请求异常: {str(e)}"
+                print(error_msg)
+                failed.append(backend.name)
+                if len(failed) >= len(self.pool):
+                    return {"answer": error_msg}
+            except Exception as e:
+                error_msg = f"未知错误: {str(e)}"
+                print(error_msg)
+                return {"answer": error_msg}
+
+    def _route(self, wxid, exclude=()):
+        """
+        选择本次请求的后端：会话所在的后端可用时继续该会话，否则换到其他后端并开始新对话
+        :return: (后端, conversation_id)
+        """
+        conversation_id, owner = self.get_session(wxid)
+        backend = self.pool.route(owner.name if owner else None, exclude=exclude)
+        if owner is not None and backend is not owner:
+            # 换到其他后端开始新对话，原后端的对话不再使用
+            self.sessions.delete("dify", owner.agent, wxid)
+            conversation_id = None
+        if conversation_id:
+            print(f"继续对话，ID: {conversation_id}")
+        else:
+            print("开始新对话")
+        return backend, conversation_id
+
+    @staticmethod
+    def _build_payload(wxid, user_message, response_mode, conversation_id):
         payload = {
             "inputs": {},
             "query": user_message,
-            "response_mode": "blocking",  # 改为blocking模式
+            "response_mode": response_mode,
             "user": wxid  # 添加用户标识
         }
-        
         if conversation_id:
-            print(f"继续对话，ID: {conversation_id}")
             payload["conversation_id"] = conversation_id
-        else:
-            print("开始新对话")
-            
+        return payload
+
+    def _call(self, backend, func, *args, hedge=False):
+        """经后端的网关发起请求，并记录后端的进行中请求数和失败次数"""
+        self.pool.begin(backend)
         try:
-            print(f"发送请求到: {endpoint}")
-            print(f"请求参数: {payload}")
-            response = requests.post(endpoint, headers=self.headers, json=payload, verify=False)  # 添加verify=False
-            
-            if response.status_code != 200:
-                error_msg = f"API请求失败: 状态码 {response.status_code}"
-                try:
-                    error_data = response.json()
-                    error_msg += f", 错误信息: {error_data}"
-                except:
-                    error_msg += f", 响应内容: {response.text}"
-                print(error_msg)
-                return {"answer": error_msg}
-            
-            data = response.json()
-            print(f"API响应: {data}")
-            
-            # 提取并保存conversation_id
-            if "conversation_id" in data:
-                self.set_conversation_id(wxid, data["conversation_id"])
-                
-            return data
-        except requests.exceptions.RequestException as e:
-            error_msg = f"请求异常: {str(e)}"
-            print(error_msg)
-            return {"answer": error_msg}
+            result = backend.gateway.call(func, *args, hedge=hedge)
+        except (GatewayBusyError, CircuitOpenError):
+            # 网关在本地拒绝了请求，没有到达后端，不计入后端的失败次数
+            self.pool.end(backend, None)
+            raise
         except Exception as e:
-            error_msg = f"未知错误: {str(e)}"
-            print(error_msg)
-            return {"answer": error_msg}
+            self.pool.end(backend, False, e)
+            raise
+        self.pool.end(backend, True)
+        return result
+
+    def _post(self, deadline, backend, payload):
+        """发送阻塞模式请求，5xx与429计入熔断"""
+        response = requests.post(f"{backend.base_url}/chat-messages", headers=backend.headers, json=payload,
+                                 verify=self.verify_ssl, timeout=deadline.timeout())
+        if response.status_code >= 500 or response.status_code == 429:
+            raise UpstreamError(response.status_code, response.text)
+        return response
 
 # 示例用法
 if __name__ == "__main__":
@@ -0,0 +1,202 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from Core.Logger import Logger
+from Core.bridge.media_server import MediaServer
+
+logger = Logger()
+
+EMOJIS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "emojis")
+
+# 同名表情包的扩展名优先级（与原 /get_emoji 接口先找.jpg再找.png一致）
+EMOJI_EXTENSIONS = (".jpg", ".png", ".gif", ".jpeg", ".webp")
+
+
+class EmojiAsset:
+    """表情包索引项"""
+
+    __slots__ = ("name", "path", "md5", "size", "mime", "mtime_ns")
+
+    def __init__(self, name, path, md5, size, mime, mtime_ns):
+        self.name = name
+        self.path = path
+        self.md5 = md5
+        self.size = size
+        self.mime = mime
+        self.mtime_ns = mtime_ns
+
+
+class EmojiRegistry:
+    """
+    表情包索引
+    启动时扫描一次emojis目录，建立 名称 -> (路径, md5, 大小, MIME) 的索引；
+    之后按间隔检查目录变化，只为新增或修改过的文件重新计算md5。
+    最近使用的表情包内容常驻内存，由Query.GET直接返回给gewechat，不再复制到tmp目录。
+    同时记录哪些md5已被确认是gewechat登记过的表情（post_emoji发送成功过），只有这些才以post_emoji方式发送。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, emojis_dir=EMOJIS_DIR, check_interval=5, max_memory_bytes=32 * 1024 * 1024):
+        """
+        Args:
+            emojis_dir: 表情包目录
+            check_interval: 检查目录变化的最小间隔（秒）
+            max_memory_bytes: 常驻内存的表情包内容总大小上限
+        """
+        self.emojis_dir = emojis_dir
+        self.check_interval = check_interval
+        self.max_memory_bytes = max_memory_bytes
+        self._lock = threading.RLock()
+        self._assets = {}  # name -> EmojiAsset
+        self._signature = None
+        self._last_check = 0.0
+        self._hot = OrderedDict()  # md5 -> bytes
+        self._hot_bytes = 0
+        self._emoji_confirmed = set()  # 已确认可以用post_emoji发送的md5
+        self.scans = 0
+        self.memory_hits = 0
+        self.disk_reads = 0
+        self._scan()
+
+    @classmethod
+    def get_instance(cls):
+        """获取全局唯一的表情包索引"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def get(self, name):
+        """按名称获取表情包索引项，不存在时返回None"""
+        self._check()
+        with self._lock:
+            return self._assets.get(name)
+
+    def names(self):
+        """所有表情包名称"""
+        self._check()
+        with self._lock:
+            return sorted(self._assets)
+
+    def read(self, name):
+        """
+        获取表情包内容，优先从内存读取
+
+        Returns:
+            tuple: (EmojiAsset, bytes)，不存在时返回 (None, None)
+        """
+        asset = self.get(name)
+        if asset is None:
+            return None, None
+        with self._lock:
+            data = self._hot.get(asset.md5)
+            if data is not None:
+                self._hot.move_to_end(asset.md5)
+                self.memory_hits += 1
+                return asset, data
+        try:
+            with open(asset.path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            logger.error(f"读取表情包失败: {asset.path}, {e}")
+            return None, None
+        with self._lock:
+            self.disk_reads += 1
+            if len(data) <= self.max_memory_bytes and asset.md5 not in self._hot:
+                self._hot[asset.md5] = data
+                self._hot_bytes += len(data)
+                while self._hot_bytes > self.max_memory_bytes:
+                    self._hot_bytes -= len(self._hot.popitem(last=False)[1])
+        return asset, data
+
+    def can_post_emoji(self, asset):
+        """
+        表情包是否可以用post_emoji（md5+大小）发送
+        本地图片的md5通常不是微信表情，只有确认过的md5才使用post_emoji，其余一律以图片发送
+        """
+        with self._lock:
+            return asset.md5 in self._emoji_confirmed
+
+    def confirm_emoji(self, md5):
+        """记录md5对应的表情已被gewechat登记（post_emoji发送成功）"""
+        with self._lock:
+            self._emoji_confirmed.add(md5)
+
+    def revoke_emoji(self, md5):
+        """post_emoji发送失败，该md5之后改为以图片发送"""
+        with self._lock:
+            self._emoji_confirmed.discard(md5)
+
+    def stats(self):
+        """获取索引统计"""
+        with self._lock:
+            return {
+                "emojis": len(self._assets),
+                "scans": self.scans,
+                "hot": len(self._hot),
+                "hot_bytes": self._hot_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_reads": self.disk_reads,
+                "post_emoji_ready": len(self._emoji_confirmed),
+            }
+
+    def _check(self):
+        now = time.time()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        self._scan()
+
+    def _scan(self):
+        """扫描目录，目录内容未变化时不重建索引"""
+        try:
+            entries = [entry for entry in os.scandir(self.emojis_dir)
+                       if entry.is_file() and os.path.splitext(entry.name)[1].lower() in EMOJI_EXTENSIONS]
+        except FileNotFoundError:
+            entries = []
+        stats = {entry.path: entry.stat() for entry in entries}
+        signature = frozenset((path, stat.st_mtime_ns, stat.st_size) for path, stat in stats.items())
+
+        with self._lock:
+            if signature == self._signature:
+                return
+            old_by_path = {asset.path: asset for asset in self._assets.values()}
+            assets = {}
+            # 按扩展名优先级排序，同名时保留优先级最高的文件
+            for path in sorted(stats, key=lambda p: EMOJI_EXTENSIONS.index(os.path.splitext(p)[1].lower())):
+                name = os.path.splitext(os.path.basename(path))[0]
+                if name in assets:
+                    continue
+                stat = stats[path]
+                old = old_by_path.get(path)
+                if old and old.mtime_ns == stat.st_mtime_ns and old.size == stat.st_size:
+                    assets[name] = old
+                    continue
+                try:
+                    md5 = self._md5(path)
+                except OSError as e:
+                    logger.error(f"读取表情包失败: {path}, {e}")
+                    continue
+                assets[name] = EmojiAsset(name, path, md5, stat.st_size, MediaServer.guess_type(path),
+                                          stat.st_mtime_ns)
+
+            # 内容已不在索引中的内存缓存一并移除
+            md5s = {asset.md5 for asset in assets.values()}
+            for md5 in [md5 for md5 in self._hot if md5 not in md5s]:
+                self._hot_bytes -= len(self._hot.pop(md5))
+            self._assets = assets
+            self._signature = signature
+            self.scans += 1
+            logger.debug(f"表情包索引已更新，共 {len(assets)} 个")
+
+    @staticmethod
+    def _md5(path):
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
@@ -1,4 +1,5 @@
 from gewechat.client import GewechatClient
+from gewechat.util import http_util
 from Core.Logger import Logger
 
 logging = Logger()
@@ -23,6 +24,8 @@ class ClientFactory:
         if cls._client_instance is None:
             base_url = f"http://{config.get('gewe_server_ip')}:2531/v2/api"
             token = config.get('gewechat_token')
+            # 所有gewechat接口共用一个长连接池
+            http_util.configure(pool_size=config.get('gewechat_pool_size', http_util.POOL_SIZE))
             cls._client_instance = GewechatClient(base_url, token)
             logging.info(f"已创建GewechatClient实例，base_url: {base_url}")
         
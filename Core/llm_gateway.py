@@ -0,0 +1,389 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from Core.Logger import Logger
+
+logger = Logger()
+
+
+class GatewayError(Exception):
+    """LLM网关拒绝或中止请求时抛出"""
+
+
+class CircuitOpenError(GatewayError):
+    """熔断器处于打开状态，请求被快速拒绝"""
+
+
+class GatewayBusyError(GatewayError):
+    """等待并发名额超时"""
+
+
+class DeadlineExceeded(GatewayError):
+    """请求超过总时限"""
+
+
+class UpstreamError(GatewayError):
+    """上游返回了应计入熔断的错误（5xx、429等）"""
+
+    def __init__(self, status_code, message=""):
+        super().__init__(f"上游错误: 状态码 {status_code}, {message}")
+        self.status_code = status_code
+
+
+class Deadline:
+    """单个请求的时限，流式读取时在每个事件之间检查"""
+
+    def __init__(self, connect_timeout, read_timeout, total_timeout):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.expires_at = time.time() + total_timeout if total_timeout else None
+
+    def remaining(self):
+        """剩余时间（秒），没有总时限时返回None"""
+        return None if self.expires_at is None else max(0.0, self.expires_at - time.time())
+
+    def check(self):
+        """超过总时限时抛出DeadlineExceeded"""
+        if self.expires_at is not None and time.time() >= self.expires_at:
+            raise DeadlineExceeded("请求超过总时限")
+
+    def timeout(self):
+        """requests使用的 (连接超时, 读取超时)，读取超时不超过剩余的总时限"""
+        remaining = self.remaining()
+        read_timeout = self.read_timeout if remaining is None else min(self.read_timeout, remaining)
+        return self.connect_timeout, max(0.001, read_timeout)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    连续失败failure_threshold次后打开，打开期间直接拒绝请求；reset_timeout秒后进入半开状态，
+    只放行一个探测请求，探测成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self):
+        """是否放行请求，半开状态下只放行一个探测请求"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("熔断器已关闭")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opens += 1
+                    logger.warning(f"熔断器已打开，{self.reset_timeout}秒后探测")
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self._probing = False
+
+    def release_probe(self):
+        """探测请求没有得出结果（如被调用方取消）时，允许下一次探测"""
+        with self._lock:
+            self._probing = False
+
+
+class LatencyStats:
+    """最近若干次请求耗时的分位数统计"""
+
+    def __init__(self, window=1024):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+
+    def count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        return self._pick(samples, p)
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0, "p50": None, "p95": None, "p99": None}
+        return {"count": len(samples), "p50": round(self._pick(samples, 50)), "p95": round(self._pick(samples, 95)),
+                "p99": round(self._pick(samples, 99))}
+
+    @staticmethod
+    def _pick(samples, p):
+        """最近秩法取已排序样本的分位数"""
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, max(0, int(round(p / 100.0 * len(samples))) - 1))]
+
+
+class LLMGateway:
+    """
+    LLM平台调用网关，Dify与Coze的请求都经过这里
+    每个平台一个实例，提供：并发上限（信号量）、连接/读取/总时限、带半开探测的熔断器、
+    对冲请求（第一个请求迟迟没有结果时再发一个，取先返回的结果）以及在途请求数和p50/p95/p99耗时统计。
+
+    配置项（平台前缀优先，如 dify_max_concurrency，其次为 llm_ 前缀的通用配置）:
+        max_concurrency、acquire_timeout、connect_timeout、read_timeout、total_timeout、
+        breaker_failures、breaker_reset、hedge_after（秒，为0时不对冲；为auto时取最近耗时的p95）
+    """
+    _gateways = {}
+    _gateways_lock = threading.Lock()
+
+    HEDGE_MIN_SAMPLES = 20  # hedge_after为auto时，至少有这么多样本才开始对冲
+
+    def __init__(self, platform, max_concurrency=8, acquire_timeout=30, connect_timeout=5, read_timeout=60,
+                 total_timeout=120, breaker_failures=5, breaker_reset=30, hedge_after=0):
+        """
+        Args:
+            platform: 平台名称（dify/coze）
+            max_concurrency: 同时进行的请求数上限
+            acquire_timeout: 等待并发名额的最长时间（秒）
+            connect_timeout: 连接超时（秒）
+            read_timeout: 两次读取之间的最长等待（秒）
+            total_timeout: 单个请求的总时限（秒）
+            breaker_failures: 连续失败多少次后熔断
+            breaker_reset: 熔断后多久进入半开状态（秒）
+            hedge_after: 对冲延迟（秒），0表示不对冲，auto表示使用最近耗时的p95
+        """
+        self.platform = platform
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyStats()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.configure(max_concurrency=max_concurrency, acquire_timeout=acquire_timeout,
+                       connect_timeout=connect_timeout, read_timeout=read_timeout, total_timeout=total_timeout,
+                       breaker_failures=breaker_failures, breaker_reset=breaker_reset, hedge_after=hedge_after)
+
+    @classmethod
+    def get(cls, platform, config=None, prefix=None):
+        """
+        获取平台对应的网关，传入config时按配置更新参数
+
+        Args:
+            platform: 网关名称，如 dify、coze，同一平台的多个后端可以使用 dify:backend 这样的名称
+            prefix: 读取配置时使用的前缀，默认与platform相同
+        """
+        with cls._gateways_lock:
+            gateway = cls._gateways.get(platform)
+            if gateway is None:
+                gateway = cls._gateways[platform] = cls(platform)
+        if config is not None:
+            gateway.configure(**cls._options(prefix or platform, config))
+        return gateway
+
+    @classmethod
+    def all_stats(cls):
+        """所有平台的网关统计"""
+        with cls._gateways_lock:
+            gateways = list(cls._gateways.values())
+        return {gateway.platform: gateway.stats() for gateway in gateways}
+
+    @staticmethod
+    def _options(prefix, config):
+        defaults = {"max_concurrency": 8, "acquire_timeout": 30, "connect_timeout": 5, "read_timeout": 60,
+                    "total_timeout": 120, "breaker_failures": 5, "breaker_reset": 30, "hedge_after": 0}
+        return {name: config.get(f"{prefix}_{name}", config.get(f"llm_{name}", default))
+                for name, default in defaults.items()}
+
+    def configure(self, max_concurrency, acquire_timeout, connect_timeout, read_timeout, total_timeout,
+                  breaker_failures, breaker_reset, hedge_after):
+        """更新网关参数，并发上限变化时新请求使用新的信号量"""
+        with self._lock:
+            max_concurrency = max(1, int(max_concurrency))
+            if getattr(self, "max_concurrency", None) != max_concurrency:
+                self.max_concurrency = max_concurrency
+                self._semaphore = threading.BoundedSemaphore(max_concurrency)
+            self.acquire_timeout = acquire_timeout
+            self.connect_timeout = connect_timeout
+            self.read_timeout = read_timeout
+            self.total_timeout = total_timeout
+            self.hedge_after = hedge_after
+            self.breaker.failure_threshold = breaker_failures
+            self.breaker.reset_timeout = breaker_reset
+
+    def deadline(self):
+        """为新请求创建时限"""
+        return Deadline(self.connect_timeout, self.read_timeout, self.total_timeout)
+
+    def call(self, func, *args, hedge=False, **kwargs):
+        """
+        经网关调用上游：func(deadline, *args, **kwargs)
+        func应当用deadline.timeout()作为HTTP超时，流式读取时在事件之间调用deadline.check()；
+        上游错误需要计入熔断时抛出UpstreamError。
+
+        Args:
+            func: 实际发起请求的函数，第一个参数为Deadline
+            hedge: 是否允许对冲。只应对重复执行无副作用的请求开启（如不带conversation_id的阻塞请求），
+                   流式回复会在读取过程中发送消息，不能对冲
+
+        Raises:
+            CircuitOpenError: 熔断中
+            GatewayBusyError: 等待并发名额超时
+            DeadlineExceeded: 超过总时限
+        """
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"{self.platform} 熔断中，请求被拒绝")
+
+        semaphore = self._semaphore
+        if not semaphore.acquire(timeout=self.acquire_timeout):
+            self.breaker.release_probe()
+            with self._lock:
+                self.rejected += 1
+            raise GatewayBusyError(f"{self.platform} 并发请求已满（{self.max_concurrency}）")
+
+        started_at = time.time()
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+        hedge_after = self._hedge_delay() if hedge else None
+        try:
+            if hedge_after:
+                # 名额交给_call_hedged，在对应的请求真正结束后才释放
+                result = self._call_hedged(semaphore, hedge_after, func, args, kwargs)
+            else:
+                result = func(self.deadline(), *args, **kwargs)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        finally:
+            if not hedge_after:
+                semaphore.release()
+            with self._lock:
+                self.in_flight -= 1
+        self.breaker.record_success()
+        self.latency.add((time.time() - started_at) * 1000)
+        return result
+
+    def _record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            if isinstance(error, (DeadlineExceeded, TimeoutError)) or "timeout" in type(error).__name__.lower():
+                self.timeouts += 1
+        self.breaker.record_failure()
+        logger.warning(f"{self.platform} 请求失败: {type(error).__name__}: {error}")
+
+    def _hedge_delay(self):
+        if self.hedge_after == "auto":
+            if self.latency.count() < self.HEDGE_MIN_SAMPLES:
+                return None
+            return self.latency.percentile(95) / 1000.0
+        return self.hedge_after or None
+
+    def _call_hedged(self, semaphore, hedge_after, func, args, kwargs):
+        """
+        先发一个请求，hedge_after秒内没有结果时再发一个，返回先成功的结果
+        每个请求占用一个并发名额（第一个请求使用call中已获取的名额），请求结束时才释放：
+        先返回的结果交给调用方后，另一个请求仍在进行，继续占用名额，保证在途请求数不超过max_concurrency
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency * 2,
+                                                    thread_name_prefix=f"{self.platform}-hedge")
+            executor = self._executor
+        deadline = self.deadline()
+        first = self._submit(executor, semaphore, func, deadline, *args, **kwargs)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+
+        # 对冲请求同样占用并发名额；名额已满时只等第一个请求
+        if not semaphore.acquire(blocking=False):
+            return first.result(timeout=deadline.remaining())
+        with self._lock:
+            self.hedges += 1
+        second = self._submit(executor, semaphore, func, self.deadline(), *args, **kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded("对冲请求均超过总时限")
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @staticmethod
+    def _submit(executor, semaphore, func, *args, **kwargs):
+        """提交一个已占用并发名额的请求，请求结束（成功、失败或被取消）时释放名额"""
+        try:
+            future = executor.submit(func, *args, **kwargs)
+        except Exception:
+            semaphore.release()
+            raise
+        future.add_done_callback(lambda _: semaphore.release())
+        return future
+
+    def stats(self):
+        """获取网关统计"""
+        with self._lock:
+            stats = {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "requests": self.requests,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
+        stats["breaker"] = self.breaker.state
+        stats["latency_ms"] = self.latency.summary()
+        return stats
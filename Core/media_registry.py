@@ -0,0 +1,126 @@
+import threading
+from xml.sax.saxutils import quoteattr
+
+from Core.Logger import Logger
+from Core.ttl_cache import TTLCache
+
+logger = Logger()
+
+
+def build_image_xml(data):
+    """
+    由postImage返回的CDN信息构造forwardImage所需的图片消息XML
+
+    Args:
+        data: postImage响应中的data，包含aesKey、fileId、length、width、height、md5
+
+    Returns:
+        str: 图片消息XML，缺少CDN信息时返回None
+    """
+    if not data or not data.get("aesKey") or not data.get("fileId"):
+        return None
+    aes_key = quoteattr(str(data["aesKey"]))
+    file_id = quoteattr(str(data["fileId"]))
+    length = quoteattr(str(data.get("length") or 0))
+    width = quoteattr(str(data.get("width") or 0))
+    height = quoteattr(str(data.get("height") or 0))
+    md5 = quoteattr(str(data.get("md5") or ""))
+    return (
+        '<?xml version="1.0"?>\n<msg>\n'
+        f'\t<img aeskey={aes_key} encryver="1" cdnthumbaeskey={aes_key} cdnthumburl={file_id} '
+        f'cdnthumblength={length} cdnthumbheight={height} cdnthumbwidth={width} '
+        'cdnmidheight="0" cdnmidwidth="0" cdnhdheight="0" cdnhdwidth="0" '
+        f'cdnmidimgurl={file_id} length={length} md5={md5} />\n'
+        '</msg>'
+    )
+
+
+class MediaRegistry:
+    """
+    已发送媒体的CDN句柄登记表
+    以 (媒体类型, 内容哈希) 为键，记录gewechat发送媒体后返回的CDN信息（转发用的XML）。
+    再次发送相同内容时用forward_image/forward_file转发，gewechat不必再从Query.GET拉取文件。
+    句柄按LRU+TTL淘汰；转发失败（句柄失效）时移除记录，由调用方退回重新上传。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, maxsize=1024, ttl=24 * 3600):
+        """
+        Args:
+            maxsize: 最多记录的句柄数量
+            ttl: 句柄有效期（秒），CDN上的文件过期后转发会失败
+        """
+        self._handles = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.forwards = 0
+        self.uploads = 0
+        self.stale = 0
+
+    @classmethod
+    def get_instance(cls, config=None):
+        """
+        获取全局唯一的登记表
+
+        配置项: media_handle_maxsize、media_handle_ttl
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                get = config.get if config else (lambda key, default=None: default)
+                cls._instance = cls(maxsize=get("media_handle_maxsize", 1024),
+                                    ttl=get("media_handle_ttl", 24 * 3600))
+            return cls._instance
+
+    def get(self, kind, digest):
+        """获取媒体的转发XML，不存在或已过期时返回None"""
+        return self._handles.get((kind, digest))
+
+    def record(self, kind, digest, xml):
+        """记录上传后得到的转发XML"""
+        if xml:
+            self._handles.set((kind, digest), xml)
+
+    def send(self, kind, digest, forward, upload, describe):
+        """
+        发送媒体：有可用句柄时转发，否则上传
+
+        Args:
+            kind: 媒体类型（image/file）
+            digest: 内容哈希
+            forward: 转发函数，参数为XML，返回gewechat响应
+            upload: 上传函数，返回gewechat响应
+            describe: 由上传响应的data构造转发XML的函数
+
+        Returns:
+            dict: gewechat响应
+        """
+        xml = self.get(kind, digest)
+        if xml:
+            try:
+                result = forward(xml)
+            except Exception as e:
+                # post_json在HTTP或网络错误时抛出异常，同样视为句柄失效
+                result = {"error": str(e)}
+            if result.get('ret') == 200:
+                with self._lock:
+                    self.forwards += 1
+                return result
+            # 句柄已失效，移除后重新上传
+            logger.warning(f"媒体句柄已失效，重新上传: {kind}/{digest}, {result}")
+            self._handles.pop((kind, digest))
+            with self._lock:
+                self.stale += 1
+
+        result = upload()
+        if result.get('ret') == 200:
+            with self._lock:
+                self.uploads += 1
+            self.record(kind, digest, describe(result.get('data')))
+        return result
+
+    def stats(self):
+        """获取登记表统计"""
+        with self._lock:
+            stats = {"forwards": self.forwards, "uploads": self.uploads, "stale": self.stale}
+        stats["handles"] = self._handles.stats()
+        return stats
@@ -0,0 +1,276 @@
+import abc
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from Core.Logger import Logger
+from Core.conversation_store import ConversationStore
+
+logger = Logger()
+
+
+def agent_key(*parts):
+    """由智能体的标识信息（如服务器地址、API Key）生成不含敏感信息的agent键"""
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+class SessionStore(abc.ABC):
+    """
+    会话存储接口：以 (platform, agent, wxid) 为键保存 conversation_id
+    platform为智能体平台（dify/coze），agent区分同一平台下的不同智能体，
+    便于在某个智能体的凭证变化时只失效该智能体的会话。
+    """
+
+    def get(self, platform, agent, wxid):
+        """获取未过期的conversation_id，不存在或已过期时返回None"""
+        return self.get_session(platform, agent, wxid)[0]
+
+    @abc.abstractmethod
+    def get_session(self, platform, agent, wxid):
+        """
+        获取未过期的会话
+
+        Returns:
+            tuple: (conversation_id, backend)，backend为签发该会话的后端名称，不存在时均为None
+        """
+
+    @abc.abstractmethod
+    def set(self, platform, agent, wxid, conversation_id, ttl=None, backend=None):
+        """
+        保存conversation_id
+
+        Args:
+            ttl: 本会话的最长存活时间（秒），为None时使用存储的默认值
+            backend: 签发该会话的后端名称（同一智能体部署在多个后端时使用）
+        """
+
+    @abc.abstractmethod
+    def delete(self, platform, agent, wxid):
+        """删除单个会话"""
+
+    @abc.abstractmethod
+    def invalidate(self, platform, agent=None):
+        """
+        失效某个平台（或平台下某个智能体）的所有会话
+
+        Returns:
+            int: 失效的会话数量
+        """
+
+    def purge_expired(self):
+        """清理已过期的会话，返回清理数量"""
+        return 0
+
+    def flush(self):
+        """将缓冲的数据写入磁盘"""
+
+
+class JsonSessionStore(SessionStore):
+    """
+    基于JSON文件的会话存储（兼容原有的 new_dify_config.json / coze_config.json 格式）
+    以 "platform:agent:wxid" 为键，invalidate只清除指定平台/智能体的会话；不支持过期。
+    旧版本只以wxid为键、不知道属于哪个智能体：读取时作为当前会话使用，写入新键时移除，
+    invalidate任何智能体时都一并清除。
+    记录了后端的会话保存为 {"conversation_id": ..., "backend": ...}，否则仍保存为字符串。
+    """
+
+    def __init__(self, file_path):
+        self._store = ConversationStore.open(file_path)
+
+    @staticmethod
+    def _key(platform, agent, wxid):
+        return f"{platform}:{agent or ''}:{wxid}"
+
+    @staticmethod
+    def _is_legacy(key):
+        # wxid和群ID中不含冒号，带冒号的是新格式的键
+        return ":" not in key
+
+    def get_session(self, platform, agent, wxid):
+        value = self._store.get(self._key(platform, agent, wxid))
+        if value is None:
+            value = self._store.get(wxid)
+        if isinstance(value, dict):
+            return value.get("conversation_id"), value.get("backend")
+        return value, None
+
+    def set(self, platform, agent, wxid, conversation_id, ttl=None, backend=None):
+        self._store.set(self._key(platform, agent, wxid),
+                        {"conversation_id": conversation_id, "backend": backend} if backend else conversation_id)
+        self._store.delete(wxid)
+
+    def delete(self, platform, agent, wxid):
+        self._store.delete(self._key(platform, agent, wxid))
+        self._store.delete(wxid)
+
+    def invalidate(self, platform, agent=None):
+        prefix = f"{platform}:" if agent is None else f"{platform}:{agent}:"
+        keys = [key for key in self._store.keys() if key.startswith(prefix) or self._is_legacy(key)]
+        for key in keys:
+            self._store.delete(key)
+        self._store.flush()
+        return len(keys)
+
+    def flush(self):
+        self._store.flush()
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    基于SQLite（WAL模式）的会话存储
+    按 (platform, agent, wxid) 主键索引，查询不需要把全部会话载入内存；
+    支持按创建时间的TTL和按最后使用时间的空闲过期。同一个数据库文件全局只有一个实例。
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    PURGE_INTERVAL = 600  # 清理过期会话的最小间隔（秒）
+
+    def __init__(self, db_path, ttl=None, idle_ttl=None):
+        """
+        Args:
+            db_path: 数据库文件路径
+            ttl: 会话默认最长存活时间（秒），None表示不过期
+            idle_ttl: 会话空闲过期时间（秒），None表示不过期
+        """
+        self.db_path = os.path.abspath(db_path)
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                platform TEXT NOT NULL,
+                agent TEXT NOT NULL,
+                wxid TEXT NOT NULL,
+                conversation_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (platform, agent, wxid)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)")
+        # 旧版本的数据库没有backend列
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+        if "backend" not in columns:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN backend TEXT")
+
+    @classmethod
+    def open(cls, db_path, ttl=None, idle_ttl=None):
+        """获取数据库文件对应的存储实例"""
+        path = os.path.abspath(db_path)
+        with cls._instances_lock:
+            store = cls._instances.get(path)
+            if store is None:
+                store = cls._instances[path] = cls(path, ttl=ttl, idle_ttl=idle_ttl)
+            else:
+                store.ttl, store.idle_ttl = ttl, idle_ttl
+            return store
+
+    def get_session(self, platform, agent, wxid):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT conversation_id, backend, last_used_at, expires_at FROM sessions "
+                "WHERE platform = ? AND agent = ? AND wxid = ?",
+                (platform, agent, wxid)
+            ).fetchone()
+            if row is None:
+                return None, None
+            conversation_id, backend, last_used_at, expires_at = row
+            if (expires_at is not None and expires_at <= now) or \
+                    (self.idle_ttl is not None and last_used_at + self.idle_ttl <= now):
+                self._conn.execute("DELETE FROM sessions WHERE platform = ? AND agent = ? AND wxid = ?",
+                                   (platform, agent, wxid))
+                logger.debug(f"会话已过期: {platform}/{wxid}")
+                return None, None
+            if self.idle_ttl is not None:
+                self._conn.execute("UPDATE sessions SET last_used_at = ? WHERE platform = ? AND agent = ? AND wxid = ?",
+                                   (now, platform, agent, wxid))
+            return conversation_id, backend
+
+    def set(self, platform, agent, wxid, conversation_id, ttl=None, backend=None):
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            # 同一会话重复写入时保留原有的过期时间
+            self._conn.execute("""
+                INSERT INTO sessions (platform, agent, wxid, conversation_id, created_at, last_used_at, expires_at,
+                                      backend)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (platform, agent, wxid) DO UPDATE SET
+                    last_used_at = excluded.last_used_at,
+                    backend = excluded.backend,
+                    created_at = CASE WHEN sessions.conversation_id = excluded.conversation_id
+                                      THEN sessions.created_at ELSE excluded.created_at END,
+                    expires_at = CASE WHEN sessions.conversation_id = excluded.conversation_id
+                                      THEN sessions.expires_at ELSE excluded.expires_at END,
+                    conversation_id = excluded.conversation_id
+            """, (platform, agent, wxid, conversation_id, now, now, expires_at, backend))
+        if now - self._last_purge > self.PURGE_INTERVAL:
+            self.purge_expired()
+
+    def delete(self, platform, agent, wxid):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE platform = ? AND agent = ? AND wxid = ?",
+                               (platform, agent, wxid))
+
+    def invalidate(self, platform, agent=None):
+        with self._lock:
+            if agent is None:
+                cursor = self._conn.execute("DELETE FROM sessions WHERE platform = ?", (platform,))
+            else:
+                cursor = self._conn.execute("DELETE FROM sessions WHERE platform = ? AND agent = ?", (platform, agent))
+            return cursor.rowcount
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            self._last_purge = now
+            count = self._conn.execute("DELETE FROM sessions WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                                       (now,)).rowcount
+            if self.idle_ttl is not None:
+                count += self._conn.execute("DELETE FROM sessions WHERE last_used_at <= ?",
+                                            (now - self.idle_ttl,)).rowcount
+        if count:
+            logger.info(f"已清理 {count} 个过期会话")
+        return count
+
+    def count(self, platform=None):
+        """返回会话数量"""
+        with self._lock:
+            if platform is None:
+                return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM sessions WHERE platform = ?", (platform,)).fetchone()[0]
+
+
+def open_session_store(project_config, json_file):
+    """
+    根据项目配置打开会话存储
+
+    配置项:
+        session_store: json（默认，沿用各平台的JSON文件）或 sqlite
+        session_db_path: SQLite数据库路径，默认 ./data/sessions.db
+        session_ttl / session_idle_ttl: 会话最长存活时间 / 空闲过期时间（秒）
+
+    Args:
+        project_config: 项目配置对象，可以为None
+        json_file: 使用JSON存储时该平台对应的文件
+    """
+    backend = project_config.get("session_store", "json") if project_config else "json"
+    if backend == "sqlite":
+        return SQLiteSessionStore.open(
+            project_config.get("session_db_path", "./data/sessions.db"),
+            ttl=project_config.get("session_ttl"),
+            idle_ttl=project_config.get("session_idle_ttl")
+        )
+    return JsonSessionStore(json_file)
@@ -1,39 +1,18 @@
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from pydub import AudioSegment
-from datetime import datetime
 import os
 import urllib.parse
 import json
 
+from Core.bridge.temp_files import TempFileManager
+from Core.voice.audio_convert import mix_audio
+from Core.voice.transcoder import TranscodeService
+
 # 获取当前文件的绝对路径
 current_file_path = os.path.abspath(__file__)
 # 获取当前文件所在的目录
 current_dir = os.path.dirname(current_file_path)
 bgm_dir = os.path.join(current_dir, r"handleSong\bgm_HP5")
 human_dir = os.path.join(current_dir, r"handleSong\human_last")
-# 获取当前文件所在的tmp目录
-tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(current_file_path))), "tmp")
-
-def mix_audio(audio1_path, audio2_path, output_path):
-    # 加载两个音频文件
-    audio1 = AudioSegment.from_file(audio1_path)
-    audio2 = AudioSegment.from_file(audio2_path)
-
-    # 获取两个音频的时长
-    duration1 = len(audio1)
-    duration2 = len(audio2)
-
-    # 如果时长不同，裁剪较长的音频
-    if duration1 > duration2:
-        audio1 = audio1[:duration2]
-    elif duration2 > duration1:
-        audio2 = audio2[:duration1]
-
-    # 混合两个音频
-    mixed_audio = audio1.overlay(audio2)
-
-    # 保存混合后的音频
-    mixed_audio.export(output_path, format="wav")  # 可以根据需要选择格式
 
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -97,6 +76,8 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             self.end_headers()
             with open(file_path, 'rb') as file:
                 self.wfile.write(file.read())
+            # 混音结果已被取走，通知临时文件管理器稍后删除
+            TempFileManager.get_instance().mark_served(file_path)
 
         if self.path.startswith('/merge_voice'):
             # 解析 URL 中的查询参数
@@ -114,12 +95,11 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             # 在bgm_dir文件夹下寻找对应的bgm
             audio_bgm = os.path.join(bgm_dir, f"{voice_name}.wav")
 
-            # 获取当前时间戳（秒级时间戳）
-            timestamp = datetime.now().timestamp()
-
-            output_path = os.path.join(tmp_dir, f"{timestamp}.wav")
-
-            mix_audio(human_path, audio_bgm, output_path)
+            # 混音结果由临时文件管理器分配不冲突的文件名，被取走或过期后删除
+            with TempFileManager.get_instance().job("merge_voice") as job:
+                output_path = job.path(".wav", await_serve=True)
+                # 混音在转码进程池中执行，不占用请求线程
+                TranscodeService.get_instance().run(mix_audio, human_path, audio_bgm, output_path)
 
             # self._send_response({
             #     "human_path": human_path,
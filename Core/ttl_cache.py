@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    线程安全的 TTL + LRU 缓存
+    超过ttl秒的条目视为过期，条目数超过maxsize时淘汰最久未使用的条目，并统计命中/未命中次数
+    """
+
+    def __init__(self, maxsize=1024, ttl=600):
+        """
+        Args:
+            maxsize: 最大条目数
+            ttl: 默认过期时间（秒），为None时永不过期
+        """
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """获取缓存值，过期或不存在时返回default"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=_MISSING):
+        """
+        写入缓存
+
+        Args:
+            key: 键
+            value: 值
+            ttl: 本条目的过期时间（秒），不传时使用默认ttl
+        """
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """删除并返回缓存值"""
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and (entry[1] is None or entry[1] > time.time())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 条目数、命中/未命中次数、命中率与淘汰次数
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+            }
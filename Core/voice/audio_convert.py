@@ -1,4 +1,9 @@
+import io
 import os
+import sys
+import tempfile
+import time
+import wave
 
 from pydub import AudioSegment
 import subprocess
@@ -66,9 +71,160 @@ def audio_to_silk(audio_path: str, silk_path: str) -> int:
     print("Get duration of the SILK file")
     duration = pilk.get_duration(silk_path)
     return duration
-    
+
+
+SILK_FRAME_MS = 20  # pilk默认每帧20ms
+
+
+def audio_to_silk_bytes(audio, rate: int = 24000):
+    """在内存中将音频转换为SILK，不落盘中间的wav/pcm/silk文件
+    Args:
+        audio: 音频文件路径或音频内容(bytes)
+        rate: 重采样后的采样率
+    Returns:
+        (SILK数据, 时长毫秒)
+    """
+    if isinstance(audio, (bytes, bytearray)):
+        # wav可以不经过ffmpeg直接解析
+        audio_format = "wav" if audio[:4] == b"RIFF" else None
+        segment = AudioSegment.from_file(io.BytesIO(audio), format=audio_format)
+    else:
+        segment = AudioSegment.from_file(audio)
+
+    # 单声道、16bit小端，与导出s16le格式一致
+    pcm = segment.set_channels(1).set_frame_rate(rate).set_sample_width(2).raw_data
+    return pcm_to_silk(pcm, rate)
+
+
+def mix_audio(audio1_path, audio2_path, output_path):
+    """将两段音频裁剪到相同时长后混合，导出为wav"""
+    # 加载两个音频文件
+    audio1 = AudioSegment.from_file(audio1_path)
+    audio2 = AudioSegment.from_file(audio2_path)
+
+    # 获取两个音频的时长
+    duration1 = len(audio1)
+    duration2 = len(audio2)
+
+    # 如果时长不同，裁剪较长的音频
+    if duration1 > duration2:
+        audio1 = audio1[:duration2]
+    elif duration2 > duration1:
+        audio2 = audio2[:duration1]
+
+    # 混合两个音频
+    mixed_audio = audio1.overlay(audio2)
+
+    # 保存混合后的音频
+    mixed_audio.export(output_path, format="wav")  # 可以根据需要选择格式
+
+
+def pcm_to_silk(pcm: bytes, rate: int = 24000):
+    """将16bit单声道PCM编码为腾讯兼容的SILK
+    Returns:
+        (SILK数据, 时长毫秒)，时长按完整帧的采样数计算，与pilk.get_duration一致
+    """
+    frame_samples = rate * SILK_FRAME_MS // 1000
+    duration = (len(pcm) // 2 // frame_samples) * SILK_FRAME_MS
+    return _pilk_in_memory(pilk.encode, pcm, pcm_rate=rate, tencent=True), duration
+
+
+def silk_to_pcm(silk: bytes, rate: int = 16000) -> bytes:
+    """将SILK（含腾讯格式）解码为16bit单声道PCM
+    Args:
+        silk: SILK数据
+        rate: 输出PCM的采样率
+    """
+    return _pilk_in_memory(pilk.decode, silk, pcm_rate=rate)
+
+
+def pcm_to_wav(pcm: bytes, rate: int = 16000) -> bytes:
+    """为16bit单声道PCM加上WAV文件头"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def _pilk_in_memory(func, data: bytes, **kwargs) -> bytes:
+    """在内存中调用pilk的编码/解码函数
+    pilk只接受文件路径且执行时不释放GIL，无法用线程向管道喂数据；
+    Linux上使用memfd匿名内存文件，其他平台退回临时文件。
+    """
+    if hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd"):
+        input_fd = os.memfd_create("pilk_input")
+        output_fd = os.memfd_create("pilk_output")
+        try:
+            os.write(input_fd, data)
+            func(f"/proc/self/fd/{input_fd}", f"/proc/self/fd/{output_fd}", **kwargs)
+            return os.pread(output_fd, os.fstat(output_fd).st_size, 0)
+        finally:
+            os.close(input_fd)
+            os.close(output_fd)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "input")
+        output_path = os.path.join(tmp, "output")
+        with open(input_path, "wb") as f:
+            f.write(data)
+        func(input_path, output_path, **kwargs)
+        with open(output_path, "rb") as f:
+            return f.read()
+
+
+def benchmark(paths, rounds: int = 3):
+    """对比文件转换(audio_to_silk)与内存转换(audio_to_silk_bytes)的耗时
+    Args:
+        paths: 音频文件或包含音频文件的目录
+        rounds: 每个文件重复次数
+    """
+    clips = []
+    for path in paths:
+        if os.path.isdir(path):
+            clips.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if os.path.isfile(os.path.join(path, name)))
+        else:
+            clips.append(path)
+
+    file_total = memory_total = 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        for clip in clips:
+            with open(clip, "rb") as f:
+                data = f.read()
+            file_cost = memory_cost = 0.0
+            for i in range(rounds):
+                # 文件路径：先像handle_voice一样把下载内容写入文件
+                start = time.perf_counter()
+                audio_path = os.path.join(tmp, f"voice_{i}" + os.path.splitext(clip)[1])
+                with open(audio_path, "wb") as f:
+                    f.write(data)
+                file_duration = audio_to_silk(audio_path, audio_path + ".silk")
+                file_cost += time.perf_counter() - start
+
+                start = time.perf_counter()
+                _, memory_duration = audio_to_silk_bytes(data)
+                memory_cost += time.perf_counter() - start
+
+            file_total += file_cost
+            memory_total += memory_cost
+            print(f"{os.path.basename(clip)}: 文件 {file_cost / rounds * 1000:.1f}ms, "
+                  f"内存 {memory_cost / rounds * 1000:.1f}ms, 时长 {file_duration}/{memory_duration}ms")
+
+    if clips:
+        print(f"共 {len(clips)} 个文件: 文件 {file_total / len(clips) / rounds * 1000:.1f}ms/个, "
+              f"内存 {memory_total / len(clips) / rounds * 1000:.1f}ms/个, "
+              f"加速 {file_total / memory_total:.2f}x")
+
+
 if __name__ == "__main__":
     # test_file = r".\test_voice.wav"
     # wav_to_mp3(test_file)
-    print(check_ffmpeg())
+    # python -m Core.voice.audio_convert <音频文件或目录>... 运行转换基准测试
+    if len(sys.argv) > 1:
+        benchmark(sys.argv[1:])
+    else:
+        print(check_ffmpeg())
     
\ No newline at end of file
@@ -9,7 +9,7 @@ root_dir = os.path.abspath(os.path.join(current_dir, "../.."))
 if root_dir not in sys.path:
     sys.path.append(root_dir)
 
-from Core.bridge.temp_dir import TmpDir
+from Core.bridge.temp_files import TempFileManager
 from config import Config
 
 class AudioGen:
@@ -18,16 +18,13 @@ class AudioGen:
         self.config = Config()
         self.voice_url = self.config.get("GPT-SoVITS_url")
         self.language = self.config.get("text_language")
-        self.tmp_dir = TmpDir()
+        self.temp_files = TempFileManager.get_instance(self.config)
 
 
     def generate_voice(self, text):
-        # 获取tmp文件夹路径
-        temp_dir = self.tmp_dir.path()
-        # 生成语音文件名
+        # 生成语音文件名，同一秒内的多个请求也不会互相覆盖
         timestamp = self.get_current_timestamp()
-        relative_voice_file = f"voice_{timestamp}.wav"
-        voice_file = os.path.join(temp_dir, relative_voice_file)
+        voice_file = self.temp_files.new_path(".wav", prefix=f"voice_{timestamp}_", job="audio_gen", await_serve=True)
         # 发送语音请求
         data = {
             'text': text,
@@ -40,13 +37,17 @@ class AudioGen:
                 with open(voice_file, "wb") as f:
                     f.write(response.content)
                 print("语音文件已生成")
+                # 释放引用，文件在被取走或过期后删除
+                self.temp_files.release(voice_file)
                 # 返回绝对路径
                 return os.path.abspath(voice_file)
             else:
                 print(f"语音生成失败，状态码：{response.status_code}")
+                self.temp_files.discard(voice_file)
                 return None
         except Exception as e:
             print(f"语音生成失败，错误信息：{e}")
+            self.temp_files.discard(voice_file)
             return None
             
     @staticmethod
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from Core.Logger import Logger
+
+logger = Logger()
+
+# 缓存放在tmp的子目录中：Query.GET只允许访问tmp目录，而临时文件管理器只管理tmp下的文件、不会删除子目录
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp", "silk_cache"
+)
+
+
+class SilkCache:
+    """
+    按内容哈希寻址的SILK语音缓存
+    以音频字节的sha256为键保存转换后的silk文件和时长，同时记录 语音URL -> 哈希 的映射，
+    重复的语音回复可以跳过下载和编码。缓存总大小超过上限时按最近使用时间淘汰，
+    已交给gewechat、还没有被取走的文件（最长IN_FLIGHT_TTL秒）不会被淘汰；URL映射最多保留max_urls条。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    INDEX_FILE = "index.json"
+    IN_FLIGHT_TTL = 600  # 文件交给gewechat后最多等待多久被取走（秒），超过后允许淘汰
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=200 * 1024 * 1024, max_urls=10000):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存文件总大小上限（字节）
+            max_urls: 最多记录的 URL -> 哈希 映射数量
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_urls = max(1, int(max_urls))
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._entries, urls = self._load_index()
+        self._urls = OrderedDict(urls)  # url -> 哈希，按最近使用排序
+        self._in_flight = {}  # 哈希 -> [等待取走的次数, 过期时间]
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def get_instance(cls, max_bytes=None):
+        """获取全局唯一的缓存实例"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls() if max_bytes is None else cls(max_bytes=max_bytes)
+            return cls._instance
+
+    @classmethod
+    def mark_served(cls, path):
+        """
+        文件已被gewechat完整取走，由Query.GET在返回文件后调用
+
+        Returns:
+            bool: 文件属于SILK缓存时返回True
+        """
+        cache = cls._instance
+        if cache is None or os.path.dirname(os.path.abspath(path)) != os.path.abspath(cache.cache_dir):
+            return False
+        digest = os.path.splitext(os.path.basename(path))[0]
+        with cache._lock:
+            in_flight = cache._in_flight.get(digest)
+            if in_flight is not None:
+                in_flight[0] -= 1
+                if in_flight[0] <= 0:
+                    del cache._in_flight[digest]
+        return True
+
+    @staticmethod
+    def digest(data):
+        """计算音频内容的哈希"""
+        return hashlib.sha256(data).hexdigest()
+
+    def path_for(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.silk")
+
+    def get_by_url(self, url):
+        """
+        按语音URL查找缓存
+
+        Returns:
+            tuple: (silk文件路径, 时长毫秒)，未命中时返回None
+        """
+        with self._lock:
+            digest = self._urls.get(url)
+            if digest:
+                self._urls.move_to_end(url)
+        return self.get(digest) if digest else None
+
+    def get(self, digest):
+        """
+        按内容哈希查找缓存，命中的文件在被gewechat取走前不会被淘汰
+
+        Returns:
+            tuple: (silk文件路径, 时长毫秒)，未命中时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+            path = self.path_for(digest)
+            if entry is None or not os.path.exists(path):
+                if self._entries.pop(digest, None) is not None:
+                    self._prune_urls()
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self._hold(digest)
+            self.hits += 1
+            return path, entry["duration"]
+
+    def remember_url(self, url, digest):
+        """记录URL对应的内容哈希"""
+        with self._lock:
+            if self._urls.get(url) != digest:
+                self._set_url(url, digest)
+                self._save_index()
+
+    def put(self, digest, silk_data, duration, url=None):
+        """
+        将转换好的silk数据写入缓存，返回的文件在被gewechat取走前不会被淘汰
+
+        Args:
+            digest: 源音频内容哈希
+            silk_data: silk数据
+            duration: 语音时长（毫秒）
+            url: 源音频URL
+
+        Returns:
+            tuple: (缓存中的silk文件路径, 时长毫秒)
+        """
+        target = self.path_for(digest)
+        tmp_path = f"{target}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(silk_data)
+        with self._lock:
+            os.replace(tmp_path, target)
+            self._entries[digest] = {
+                "duration": duration,
+                "size": len(silk_data),
+                "last_used": time.time(),
+            }
+            self._hold(digest)
+            if url:
+                self._set_url(url, digest)
+            self._evict()
+            self._save_index()
+        return target, duration
+
+    def stats(self):
+        """获取缓存统计"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry["size"] for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "urls": len(self._urls),
+                "in_flight": len(self._in_flight),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _hold(self, digest):
+        """文件即将交给gewechat，取走前不淘汰（需持有锁）"""
+        in_flight = self._in_flight.setdefault(digest, [0, 0.0])
+        in_flight[0] += 1
+        in_flight[1] = time.time() + self.IN_FLIGHT_TTL
+
+    def _set_url(self, url, digest):
+        """记录URL映射，超出max_urls时移除最久未使用的（需持有锁）"""
+        self._urls[url] = digest
+        self._urls.move_to_end(url)
+        while len(self._urls) > self.max_urls:
+            self._urls.popitem(last=False)
+
+    def _prune_urls(self):
+        """移除指向已不在缓存中的内容的URL映射（需持有锁）"""
+        for url in [url for url, digest in self._urls.items() if digest not in self._entries]:
+            del self._urls[url]
+
+    def _evict(self):
+        total = sum(entry["size"] for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        now = time.time()
+        for digest in [digest for digest, (_, expires_at) in self._in_flight.items() if expires_at <= now]:
+            # 超过IN_FLIGHT_TTL仍未被取走，不再保护
+            del self._in_flight[digest]
+        for digest, entry in sorted(self._entries.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if digest in self._in_flight:
+                continue
+            try:
+                os.remove(self.path_for(digest))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self._entries[digest]
+            logger.debug(f"SILK缓存已淘汰: {digest}")
+        # 移除指向已淘汰内容的URL映射
+        self._prune_urls()
+
+    def _load_index(self):
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            return index.get("entries", {}), index.get("urls", {})
+        except FileNotFoundError:
+            return {}, {}
+        except Exception as e:
+            logger.error(f"加载SILK缓存索引失败: {e}")
+            return {}, {}
+
+    def _save_index(self):
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self._entries, "urls": self._urls}, f, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+        except Exception as e:
+            logger.error(f"保存SILK缓存索引失败: {e}")
@@ -0,0 +1,137 @@
+import abc
+
+import requests
+
+from Core.Logger import Logger
+from Core.difyAI.dify_pool import DifyBackendPool
+from Core.voice.audio_convert import pcm_to_wav
+
+logger = Logger()
+
+
+class SpeechToText(abc.ABC):
+    """语音识别后端接口：输入16bit单声道PCM，返回识别出的文本"""
+
+    @abc.abstractmethod
+    def transcribe(self, pcm, rate, wxid=None):
+        """
+        识别语音
+
+        Args:
+            pcm: 16bit单声道PCM数据
+            rate: 采样率
+            wxid: 发送者微信ID，部分后端需要用户标识
+
+        Returns:
+            str: 识别出的文本，无法识别时返回空字符串
+        """
+
+
+class PlaceholderSpeechToText(SpeechToText):
+    """本地替身后端，不调用任何服务，返回固定文本或语音时长描述，用于测试和未配置识别服务时"""
+
+    def __init__(self, text=None):
+        self.text = text
+
+    def transcribe(self, pcm, rate, wxid=None):
+        if self.text is not None:
+            return self.text
+        return f"[语音 {len(pcm) / 2 / rate:.1f}秒]"
+
+
+class DifySpeechToText(SpeechToText):
+    """
+    Dify应用的语音转文字接口（需要在Dify应用中开启语音转文字功能）
+    后端从Dify后端池（dify_backends，未配置时为 dify_server_ip / dify_api_key）中选择，请求失败时换一个后端重试
+    """
+
+    def __init__(self, config, timeout=30, verify_ssl=False):
+        """
+        Args:
+            config: 项目配置，每次识别时按当前配置获取后端池，后端配置变化后自动生效
+        """
+        self.config = config
+        self.timeout = timeout
+        self.verify_ssl = verify_ssl
+
+    def transcribe(self, pcm, rate, wxid=None):
+        pool = DifyBackendPool.get(self.config)
+        wav = pcm_to_wav(pcm, rate)
+        failed = []
+        while True:
+            backend = pool.choose(exclude=failed)
+            if backend is None:
+                return ""
+            pool.begin(backend)
+            try:
+                response = requests.post(
+                    f"{backend.base_url}/audio-to-text",
+                    headers={"Authorization": backend.headers["Authorization"]},
+                    files={"file": ("voice.wav", wav, "audio/wav")},
+                    data={"user": wxid or "wechat"},
+                    timeout=self.timeout,
+                    verify=self.verify_ssl
+                )
+            except requests.exceptions.RequestException as e:
+                pool.end(backend, False, e)
+                logger.error(f"Dify语音转文字请求失败（后端 {backend.name}）: {e}")
+                failed.append(backend.name)
+                continue
+            pool.end(backend, response.status_code < 500)
+            if response.status_code >= 500 and len(failed) + 1 < len(pool):
+                logger.error(f"Dify语音转文字失败（后端 {backend.name}）: 状态码 {response.status_code}，换一个后端重试")
+                failed.append(backend.name)
+                continue
+            if response.status_code != 200:
+                logger.error(f"Dify语音转文字失败（后端 {backend.name}）: 状态码 {response.status_code}, "
+                             f"响应内容: {response.text}")
+                return ""
+            return response.json().get("text", "")
+
+
+class OpenAISpeechToText(SpeechToText):
+    """OpenAI兼容的 /audio/transcriptions 接口（Whisper等）"""
+
+    def __init__(self, api_base, api_key, model="whisper-1", timeout=30):
+        self.url = api_base.rstrip("/") + "/audio/transcriptions"
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.model = model
+        self.timeout = timeout
+
+    def transcribe(self, pcm, rate, wxid=None):
+        response = requests.post(
+            self.url,
+            headers=self.headers,
+            files={"file": ("voice.wav", pcm_to_wav(pcm, rate), "audio/wav")},
+            data={"model": self.model},
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            logger.error(f"语音转文字失败: 状态码 {response.status_code}, 响应内容: {response.text}")
+            return ""
+        return response.json().get("text", "")
+
+
+def create_speech_to_text(config):
+    """
+    根据配置创建语音识别后端
+
+    配置项:
+        stt_backend: dify / openai / placeholder / none，默认none（语音识别需要显式开启）
+        stt_api_base / stt_api_key / stt_model: openai后端的接口地址、密钥和模型
+        stt_placeholder_text: placeholder后端返回的固定文本
+
+    Returns:
+        SpeechToText，为none时返回None（不处理语音消息）
+    """
+    backend = config.get("stt_backend") or "none"
+    if backend == "dify":
+        return DifySpeechToText(config, verify_ssl=config.get("dify_verify_ssl", False))
+    if backend == "openai":
+        return OpenAISpeechToText(config.get("stt_api_base", "https://api.openai.com/v1"),
+                                  config.get("stt_api_key"), config.get("stt_model", "whisper-1"))
+    if backend == "placeholder":
+        return PlaceholderSpeechToText(config.get("stt_placeholder_text"))
+    if backend != "none":
+        logger.warning(f"未知的语音识别后端: {backend}")
+    return None
@@ -0,0 +1,271 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from Core.Logger import Logger
+from Core.bridge.sharded_executor import QueueFullError
+
+logger = Logger()
+
+
+def _init_worker():
+    """工作进程初始化：只预先导入转码函数所在的模块（pydub/pilk），不加载配置和客户端"""
+    import Core.voice.audio_convert  # noqa: F401
+
+
+def _run_job(func, args, kwargs):
+    """在子进程中执行任务，并记录开始/结束时间用于统计排队和编码耗时"""
+    started_at = time.time()
+    result = func(*args, **kwargs)
+    return result, started_at, time.time()
+
+
+class TranscodeJob:
+    """转码任务句柄"""
+
+    def __init__(self, func, args, kwargs, timeout):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.name = getattr(func, "__name__", str(func))
+        self.submitted_at = time.time()
+        self.deadline = self.submitted_at + timeout if timeout else None
+        self.future = Future()
+        self.queue_ms = None
+        self.encode_ms = None
+        self._service = None
+
+    def result(self):
+        """
+        等待任务结果，超过任务的超时时间时取消任务
+
+        Raises:
+            TimeoutError: 任务超时
+            CancelledError: 任务已被取消
+        """
+        remaining = None if self.deadline is None else max(0.0, self.deadline - time.time())
+        try:
+            return self.future.result(timeout=remaining)
+        except FutureTimeoutError:
+            if self._service.cancel(self, timed_out=True):
+                raise TimeoutError(f"转码任务超时: {self.name}")
+            # 取消时任务恰好完成
+            return self.future.result()
+
+    def cancel(self):
+        """取消任务，返回是否取消成功"""
+        return self._service.cancel(self)
+
+    def done(self):
+        return self.future.done()
+
+
+class TranscodeService:
+    """
+    基于进程池的音频转码服务
+    pydub/ffmpeg/pilk的转码是CPU密集型任务，放在子进程中执行，避免占用回调线程和GIL。
+    等待中的任务保存在有界队列中，只有空闲的工作进程才会领取任务，因此排队的任务可以被真正取消；
+    已经开始执行的任务无法中断，取消或超时后其结果会被丢弃。
+    提交的函数及参数需要可以被pickle，且应定义在导入时没有副作用的模块中（如 Core.voice.audio_convert 的
+    audio_to_silk_bytes、mix_audio），工作进程反序列化任务时会导入函数所在的模块。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, workers=2, max_pending=32, timeout=60):
+        """
+        Args:
+            workers: 工作进程数量
+            max_pending: 等待队列最大长度，队列满时拒绝新任务
+            timeout: 默认任务超时时间（秒），从提交时开始计算，包括排队时间
+        """
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.timeout = timeout
+
+        self._lock = threading.RLock()
+        self._pending = deque()
+        self._running = set()
+        self._pool = None
+        self._stopped = False
+
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._timeouts = 0
+        self._rejected = 0
+        self._metrics = {}  # 任务函数名 -> 排队/编码耗时统计
+
+    @classmethod
+    def get_instance(cls, config=None):
+        """
+        获取全局唯一的转码服务
+
+        配置项: transcode_workers、transcode_queue_size、transcode_timeout
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                get = config.get if config else (lambda key, default=None: default)
+                cls._instance = cls(
+                    workers=get("transcode_workers", 2),
+                    max_pending=get("transcode_queue_size", 32),
+                    timeout=get("transcode_timeout", 60)
+                )
+            return cls._instance
+
+    def submit(self, func, *args, timeout=None, **kwargs):
+        """
+        提交转码任务
+
+        Args:
+            func: 在子进程中执行的函数
+            timeout: 任务超时时间（秒），为None时使用默认值
+
+        Returns:
+            TranscodeJob
+
+        Raises:
+            QueueFullError: 等待队列已满
+        """
+        job = TranscodeJob(func, args, kwargs, self.timeout if timeout is None else timeout)
+        job._service = self
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("转码服务已停止")
+            if len(self._pending) >= self.max_pending:
+                self._rejected += 1
+                raise QueueFullError(f"转码队列已满 ({self.max_pending})")
+            self._submitted += 1
+            self._pending.append(job)
+            self._dispatch()
+        return job
+
+    def run(self, func, *args, timeout=None, **kwargs):
+        """提交任务并等待结果"""
+        return self.submit(func, *args, timeout=timeout, **kwargs).result()
+
+    def cancel(self, job, timed_out=False):
+        """
+        取消任务
+
+        Returns:
+            bool: 任务是否被取消（已完成的任务返回False）
+        """
+        with self._lock:
+            if job.future.done():
+                return job.future.cancelled()
+            if job in self._pending:
+                self._pending.remove(job)
+            if timed_out:
+                self._timeouts += 1
+            else:
+                self._cancelled += 1
+            job.future.cancel()
+            if job in self._running:
+                logger.warning(f"转码任务 {job.name} 已在执行，取消后结果将被丢弃")
+            return True
+
+    def stats(self):
+        """获取转码服务统计"""
+        with self._lock:
+            metrics = {}
+            for name, m in self._metrics.items():
+                metrics[name] = {
+                    "count": m["count"],
+                    "avg_queue_ms": round(m["queue_ms"] / m["count"], 2),
+                    "max_queue_ms": round(m["max_queue_ms"], 2),
+                    "avg_encode_ms": round(m["encode_ms"] / m["count"], 2),
+                    "max_encode_ms": round(m["max_encode_ms"], 2),
+                }
+            return {
+                "workers": self.workers,
+                "pending": len(self._pending),
+                "running": len(self._running),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "timeouts": self._timeouts,
+                "rejected": self._rejected,
+                "jobs": metrics,
+            }
+
+    def shutdown(self, wait=True):
+        """停止服务，取消所有等待中的任务"""
+        with self._lock:
+            self._stopped = True
+            while self._pending:
+                self._pending.popleft().future.cancel()
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _get_pool(self):
+        if self._pool is None:
+            # 使用spawn启动子进程：主进程中有多个线程，fork可能复制到被其他线程持有的锁。
+            # spawn的子进程会以__mp_main__重新导入主程序文件，main.py只在作为主程序运行时才导入项目模块
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker)
+        return self._pool
+
+    def _dispatch(self):
+        """将等待中的任务交给空闲的工作进程（需持有锁）"""
+        while self._pending and len(self._running) < self.workers:
+            job = self._pending.popleft()
+            if job.deadline is not None and time.time() >= job.deadline:
+                # 排队时已超时，不再执行
+                self._timeouts += 1
+                job.future.set_exception(TimeoutError(f"转码任务排队超时: {job.name}"))
+                continue
+            try:
+                pool_future = self._get_pool().submit(_run_job, job.func, job.args, job.kwargs)
+            except RuntimeError as e:
+                # 进程池已损坏（BrokenProcessPool），或正在/已经关闭而不再接受任务（如与shutdown并发时）；
+                # 异常不能抛出到_on_done回调中，否则调用方要一直等到超时
+                if isinstance(e, BrokenProcessPool):
+                    self._pool = None
+                self._failed += 1
+                job.future.set_exception(e)
+                continue
+            self._running.add(job)
+            pool_future.add_done_callback(partial(self._on_done, job))
+
+    def _on_done(self, job, pool_future):
+        with self._lock:
+            self._running.discard(job)
+            try:
+                result, started_at, finished_at = pool_future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    # 工作进程异常退出，下次提交时重建进程池
+                    logger.error(f"转码进程池已损坏，将重建: {e}")
+                    self._pool = None
+                self._failed += 1
+                logger.error(f"转码任务 {job.name} 失败: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self._completed += 1
+                job.queue_ms = (started_at - job.submitted_at) * 1000
+                job.encode_ms = (finished_at - started_at) * 1000
+                self._record(job)
+                if not job.future.done():
+                    job.future.set_result(result)
+            if not self._stopped:
+                self._dispatch()
+
+    def _record(self, job):
+        m = self._metrics.setdefault(job.name, {
+            "count": 0, "queue_ms": 0.0, "max_queue_ms": 0.0, "encode_ms": 0.0, "max_encode_ms": 0.0
+        })
+        m["count"] += 1
+        m["queue_ms"] += job.queue_ms
+        m["max_queue_ms"] = max(m["max_queue_ms"], job.queue_ms)
+        m["encode_ms"] += job.encode_ms
+        m["max_encode_ms"] = max(m["max_encode_ms"], job.encode_ms)
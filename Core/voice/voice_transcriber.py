@@ -0,0 +1,59 @@
+import time
+
+from Core.Logger import Logger
+from Core.ttl_cache import TTLCache
+from Core.voice.audio_convert import silk_to_pcm
+
+logger = Logger()
+
+
+class VoiceTranscriber:
+    """
+    收到的语音消息转文字：SILK在转码进程池中解码为PCM（不落盘），再交给语音识别后端。
+    识别结果按消息的NewMsgId缓存，gewechat重复回调同一条语音时不会重复识别。
+    """
+
+    SAMPLE_RATE = 16000  # 语音识别常用的采样率
+
+    def __init__(self, backend, transcoder, cache_size=512, cache_ttl=3600):
+        """
+        Args:
+            backend: 语音识别后端（SpeechToText）
+            transcoder: 转码服务（TranscodeService）
+            cache_size: 最多缓存的识别结果数量
+            cache_ttl: 识别结果缓存时间（秒）
+        """
+        self.backend = backend
+        self.transcoder = transcoder
+        self._transcripts = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def transcribe(self, msg_id, silk_data, wxid=None):
+        """
+        识别语音消息
+
+        Args:
+            msg_id: 消息的NewMsgId
+            silk_data: 语音的SILK数据
+            wxid: 发送者微信ID
+
+        Returns:
+            str: 识别出的文本
+        """
+        text = self._transcripts.get(msg_id)
+        if text is not None:
+            logger.debug(f"语音识别命中缓存: {msg_id}")
+            return text
+
+        started_at = time.time()
+        pcm = self.transcoder.run(silk_to_pcm, silk_data, self.SAMPLE_RATE)
+        decoded_at = time.time()
+        text = (self.backend.transcribe(pcm, self.SAMPLE_RATE, wxid=wxid) or "").strip()
+        logger.info(f"语音识别完成: {msg_id}, 解码 {(decoded_at - started_at) * 1000:.0f}ms, "
+                    f"识别 {(time.time() - decoded_at) * 1000:.0f}ms, 文本: {text}")
+        if text:
+            self._transcripts.set(msg_id, text)
+        return text
+
+    def stats(self):
+        """识别结果缓存统计"""
+        return self._transcripts.stats()
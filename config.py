@@ -1,7 +1,8 @@
 import json
 import os
+import threading
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 import requests
 
@@ -10,6 +11,10 @@ from Core.factory.client_factory import ClientFactory
 
 logging = Logger()
 
+# 关键配置项，变更后相关组件需要重建
+CRITICAL_KEYS = ['agent_platform', 'dify_server_ip', 'dify_api_key',
+                 'coze_agent_id', 'coze_api_token', 'gewe_server_ip']
+
 
 class Config:
     """
@@ -115,8 +120,7 @@ class Config:
             self.save()
             logging.success(f"设置配置项 {key} = {value} 成功")
             # 如果修改了关键配置，提示需要刷新
-            if key in ['agent_platform', 'dify_server_ip', 'dify_api_key', 
-                      'coze_agent_id', 'coze_api_token', 'gewe_server_ip']:
+            if key in CRITICAL_KEYS:
                 logging.warning("关键配置已更改，其他组件可能需要调用refresh_config()以更新配置")
         else:
             logging.debug(f"配置项 {key} 的值未变化，跳过保存")
@@ -149,25 +153,121 @@ class Config:
         """返回配置数据的字符串表示"""
         return json.dumps(self.data, indent=4, ensure_ascii=False)
 
-    def refresh_config(self) -> None:
+    def refresh_config(self) -> List[str]:
         """
         从文件重新加载配置数据。
         当config.json被其他API或进程修改时，调用此方法可以确保配置数据同步。
+
+        Returns:
+            List[str]: 发生变化的配置项
         """
         old_data = self.data.copy()
         self.load()
         
-        # 检查关键配置是否发生变化
-        changed_keys = []
-        for key in ['agent_platform', 'dify_server_ip', 'dify_api_key', 
-                   'coze_agent_id', 'coze_api_token', 'gewe_server_ip']:
-            if self.data.get(key) != old_data.get(key):
-                changed_keys.append(key)
+        # 检查配置是否发生变化
+        changed_keys = [key for key in set(old_data) | set(self.data) if self.data.get(key) != old_data.get(key)]
+        critical_changed = [key for key in CRITICAL_KEYS if key in changed_keys]
         
-        if changed_keys:
-            logging.warning(f"配置已更新，变更的配置项: {', '.join(changed_keys)}")
+        if critical_changed:
+            logging.warning(f"配置已更新，变更的配置项: {', '.join(critical_changed)}")
             # 如果gewechat_token不存在，重新获取
             if not self.data.get('gewechat_token'):
                 self._get_token()
+        elif changed_keys:
+            logging.debug(f"刷新配置完成，变更的配置项: {', '.join(changed_keys)}")
         else:
-            logging.debug("刷新配置完成，配置未发生变化")
\ No newline at end of file
+            logging.debug("刷新配置完成，配置未发生变化")
+        return changed_keys
+
+
+class ConfigWatcher:
+    """
+    配置文件变更监听器
+    后台线程轮询配置文件的mtime/size，发生变化时通知订阅者；
+    serverapi修改配置后也可以调用invalidate()立即通知，避免每条消息都重新读取config.json
+    """
+    _watchers: Dict[str, "ConfigWatcher"] = {}
+    _watchers_lock = threading.Lock()
+
+    def __init__(self, file_path: str, interval: float = 2.0):
+        """
+        Args:
+            file_path: 配置文件路径
+            interval: 轮询间隔（秒）
+        """
+        self.file_path = os.path.abspath(file_path)
+        self.interval = interval
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._signature = self._stat()
+        self._thread = None
+
+    @classmethod
+    def get(cls, file_path: str = "./config.json") -> "ConfigWatcher":
+        """获取指定配置文件的监听器（每个文件只有一个实例）"""
+        path = os.path.abspath(file_path)
+        with cls._watchers_lock:
+            if path not in cls._watchers:
+                cls._watchers[path] = cls(path)
+            return cls._watchers[path]
+
+    def subscribe(self, callback: Callable[[], None]) -> None:
+        """
+        订阅配置变更，并在首次订阅时启动轮询线程
+
+        Args:
+            callback: 配置文件变更时调用的无参函数
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ConfigWatcher", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, callback: Callable[[], None]) -> None:
+        """取消订阅"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def check(self) -> bool:
+        """
+        检查配置文件是否变化，变化时通知订阅者
+
+        Returns:
+            bool: 是否发生变化
+        """
+        signature = self._stat()
+        with self._lock:
+            if signature == self._signature:
+                return False
+            self._signature = signature
+        self._notify()
+        return True
+
+    def invalidate(self) -> None:
+        """显式通知订阅者配置已变更（如serverapi修改了配置）"""
+        with self._lock:
+            self._signature = self._stat()
+        self._notify()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.file_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _notify(self):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"配置变更回调执行失败: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
@@ -1 +1,2 @@
-from .client import GewechatClient
\ No newline at end of file
+from .client import GewechatClient
+from .async_client import AsyncGewechatClient
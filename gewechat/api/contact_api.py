@@ -1,16 +1,17 @@
 from ..util.http_util import post_json
 
 class ContactApi:
-    def __init__(self, base_url, token):
+    def __init__(self, base_url, token, post_json=post_json):
         self.base_url = base_url
         self.token = token
+        self.post_json = post_json
 
     def fetch_contacts_list(self, app_id):
         """获取通讯录列表"""
         param = {
             "appId": app_id
         }
-        return post_json(self.base_url, "/contacts/fetchContactsList", self.token, param)
+        return self.post_json(self.base_url, "/contacts/fetchContactsList", self.token, param)
 
     def get_brief_info(self, app_id, wxids):
         """获取群/好友简要信息"""
@@ -18,7 +19,7 @@ class ContactApi:
             "appId": app_id,
             "wxids": wxids
         }
-        return post_json(self.base_url, "/contacts/getBriefInfo", self.token, param)
+        return self.post_json(self.base_url, "/contacts/getBriefInfo", self.token, param)
 
     def get_detail_info(self, app_id, wxids):
         """获取群/好友详细信息"""
@@ -26,7 +27,7 @@ class ContactApi:
             "appId": app_id,
             "wxids": wxids
         }
-        return post_json(self.base_url, "/contacts/getDetailInfo", self.token, param)
+        return self.post_json(self.base_url, "/contacts/getDetailInfo", self.token, param)
 
     def search(self, app_id, contacts_info):
         """搜索好友"""
@@ -34,7 +35,7 @@ class ContactApi:
             "appId": app_id,
             "contactsInfo": contacts_info
         }
-        return post_json(self.base_url, "/contacts/search", self.token, param)
+        return self.post_json(self.base_url, "/contacts/search", self.token, param)
 
     def add_contacts(self, app_id, scene, option, v3, v4, content):
         """添加联系人/同意添加好友"""
@@ -46,7 +47,7 @@ class ContactApi:
             "v4": v4,
             "content": content
         }
-        return post_json(self.base_url, "/contacts/addContacts", self.token, param)
+        return self.post_json(self.base_url, "/contacts/addContacts", self.token, param)
 
     def delete_friend(self, app_id, wxid):
         """删除好友"""
@@ -54,7 +55,7 @@ class ContactApi:
             "appId": app_id,
             "wxid": wxid
         }
-        return post_json(self.base_url, "/contacts/deleteFriend", self.token, param)
+        return self.post_json(self.base_url, "/contacts/deleteFriend", self.token, param)
 
     def set_friend_permissions(self, app_id, wxid, only_chat):
         """设置好友仅聊天"""
@@ -63,7 +64,7 @@ class ContactApi:
             "wxid": wxid,
             "onlyChat": only_chat
         }
-        return post_json(self.base_url, "/contacts/setFriendPermissions", self.token, param)
+        return self.post_json(self.base_url, "/contacts/setFriendPermissions", self.token, param)
 
     def set_friend_remark(self, app_id, wxid, remark):
         """设置好友备注"""
@@ -72,7 +73,7 @@ class ContactApi:
             "wxid": wxid,
             "onlyChat": remark
         }
-        return post_json(self.base_url, "/contacts/setFriendRemark", self.token, param)
+        return self.post_json(self.base_url, "/contacts/setFriendRemark", self.token, param)
 
     def get_phone_address_list(self, app_id, phones):
         """获取手机通讯录"""
@@ -80,7 +81,7 @@ class ContactApi:
             "appId": app_id,
             "wxid": phones
         }
-        return post_json(self.base_url, "/contacts/getPhoneAddressList", self.token, param)
+        return self.post_json(self.base_url, "/contacts/getPhoneAddressList", self.token, param)
 
     def upload_phone_address_list(self, app_id, phones, op_type):
         """上传手机通讯录"""
@@ -89,4 +90,4 @@ class ContactApi:
             "wxid": phones,
             "opType": op_type
         }
-        return post_json(self.base_url, "/contacts/uploadPhoneAddressList", self.token, param)
\ No newline at end of file
+        return self.post_json(self.base_url, "/contacts/uploadPhoneAddressList", self.token, param)
\ No newline at end of file
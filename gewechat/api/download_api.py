@@ -1,9 +1,10 @@
 from ..util.http_util import post_json
 
 class DownloadApi:
-    def __init__(self, base_url, token):
+    def __init__(self, base_url, token, post_json=post_json):
         self.base_url = base_url
         self.token = token
+        self.post_json = post_json
 
     def download_image(self, app_id, xml, type):
         """下载图片"""
@@ -12,7 +13,7 @@ class DownloadApi:
             "xml": xml,
             "type": type
         }
-        return post_json(self.base_url, "/message/downloadImage", self.token, param)
+        return self.post_json(self.base_url, "/message/downloadImage", self.token, param)
 
     def download_voice(self, app_id, xml, msg_id):
         """下载语音"""
@@ -21,7 +22,7 @@ class DownloadApi:
             "xml": xml,
             "msgId": msg_id
         }
-        return post_json(self.base_url, "/message/downloadVoice", self.token, param)
+        return self.post_json(self.base_url, "/message/downloadVoice", self.token, param)
 
     def download_video(self, app_id, xml):
         """下载视频"""
@@ -29,7 +30,7 @@ class DownloadApi:
             "appId": app_id,
             "xml": xml
         }
-        return post_json(self.base_url, "/message/downloadVideo", self.token, param)
+        return self.post_json(self.base_url, "/message/downloadVideo", self.token, param)
 
     def download_emoji_md5(self, app_id, emoji_md5):
         """下载emoji"""
@@ -37,7 +38,7 @@ class DownloadApi:
             "appId": app_id,
             "emojiMd5": emoji_md5
         }
-        return post_json(self.base_url, "/message/downloadEmojiMd5", self.token, param)
+        return self.post_json(self.base_url, "/message/downloadEmojiMd5", self.token, param)
 
     def download_cdn(self, app_id, aes_key, file_id, type, total_size, suffix):
         """cdn下载"""
@@ -49,4 +50,4 @@ class DownloadApi:
             "type": type,
             "suffix": suffix
         }
-        return post_json(self.base_url, "/message/downloadCdn", self.token, param)
\ No newline at end of file
+        return self.post_json(self.base_url, "/message/downloadCdn", self.token, param)
\ No newline at end of file
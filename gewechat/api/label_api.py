@@ -1,9 +1,10 @@
 from ..util.http_util import post_json
 
 class LabelApi:
-    def __init__(self, base_url, token):
+    def __init__(self, base_url, token, post_json=post_json):
         self.base_url = base_url
         self.token = token
+        self.post_json = post_json
 
     def add(self, app_id, label_name):
         """添加标签"""
@@ -11,7 +12,7 @@ class LabelApi:
             "appId": app_id,
             "labelName": label_name
         }
-        return post_json(self.base_url, "/label/add", self.token, param)
+        return self.post_json(self.base_url, "/label/add", self.token, param)
 
     def delete(self, app_id, label_ids):
         """删除标签"""
@@ -19,14 +20,14 @@ class LabelApi:
             "appId": app_id,
             "labelIds": label_ids
         }
-        return post_json(self.base_url, "/label/delete", self.token, param)
+        return self.post_json(self.base_url, "/label/delete", self.token, param)
 
     def list(self, app_id):
         """获取标签列表"""
         param = {
             "appId": app_id
         }
-        return post_json(self.base_url, "/label/list", self.token, param)
+        return self.post_json(self.base_url, "/label/list", self.token, param)
 
     def modify_member_list(self, app_id, label_ids, wx_ids):
         """修改标签成员列表"""
@@ -35,4 +36,4 @@ class LabelApi:
             "labelIds": label_ids,
             "wxIds": wx_ids
         }
-        return post_json(self.base_url, "/label/modifyMemberList", self.token, param)
\ No newline at end of file
+        return self.post_json(self.base_url, "/label/modifyMemberList", self.token, param)
\ No newline at end of file
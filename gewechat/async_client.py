@@ -0,0 +1,108 @@
+import asyncio
+
+from .client import GewechatClient
+from .util.async_http_util import async_post_json, close_clients
+from .util.terminal_printer import make_and_print_qr, print_green, print_yellow, print_red
+
+
+class AsyncGewechatClient(GewechatClient):
+    """
+    AsyncGewechatClient 是 GewechatClient 的异步版本，方法与同步客户端一致，但都返回协程。
+    同一事件循环内的所有请求共用一个 httpx 连接池，单个事件循环即可并发驱动大量发送和查询请求。
+
+    使用示例:
+    ```
+    async with AsyncGewechatClient("http://服务ip:2531/v2/api", "your_token_here") as client:
+        await asyncio.gather(
+            client.post_text(app_id, "wxid_a", "Hello"),
+            client.get_brief_info(app_id, ["wxid_b"]),
+        )
+    ```
+    """
+
+    def __init__(self, base_url, token):
+        super().__init__(base_url, token, post_json=async_post_json)
+        self.base_url = base_url
+
+    async def login(self, app_id):
+        """执行完整的登录流程，与 GewechatClient.login 相同，轮询扫码状态时不阻塞事件循环
+
+        Args:
+            app_id: 可选的应用ID，为空时会自动创建新的app_id
+
+        Returns:
+            tuple: (app_id: str, error_msg: str)
+                   成功时 error_msg 为空字符串
+                   失败时 app_id 可能为空字符串，error_msg 包含错误信息
+        """
+        # 1. 检查是否已经登录
+        input_app_id = app_id
+        if input_app_id:
+            check_online_response = await self.check_online(input_app_id)
+            if check_online_response.get('ret') == 200 and check_online_response.get('data'):
+                print_green(f"AppID: {input_app_id} 已在线，无需登录")
+                return input_app_id, ""
+            print_yellow(f"AppID: {input_app_id} 未在线，执行登录流程")
+
+        # 2. 获取初始二维码
+        app_id, uuid = await self._get_and_validate_qr(app_id)
+        if not app_id or not uuid:
+            return "", "获取二维码失败"
+
+        if not input_app_id:
+            print_green(f"AppID: {app_id}, 请保存此app_id，下次登录时继续使用!")
+            print_yellow("\n新设备登录平台，次日凌晨会掉线一次，重新登录时需使用原来的app_id取码，否则新app_id仍然会掉线，登录成功后则可以长期在线")
+
+        make_and_print_qr(f"http://weixin.qq.com/x/{uuid}")
+
+        # 3. 轮询检查登录状态，最多重试100次
+        for _ in range(100):
+            login_status = await self.check_qr(app_id, uuid, "")
+            if login_status.get('ret') != 200:
+                print_red(f"检查登录状态失败: {login_status}")
+                return app_id, f"检查登录状态失败: {login_status}"
+
+            login_data = login_status.get('data', {})
+            # 检查二维码是否过期，提前5秒重新获取
+            if login_data.get('expiredTime', 0) <= 5:
+                print_yellow("二维码即将过期，正在重新获取...")
+                _, uuid = await self._get_and_validate_qr(app_id)
+                if not uuid:
+                    return app_id, "重新获取二维码失败"
+                make_and_print_qr(f"http://weixin.qq.com/x/{uuid}")
+                continue
+
+            if login_data.get('status') == 2:  # 登录成功
+                print_green(f"\n登录成功！用户昵称: {login_data.get('nickName', '未知用户')}")
+                return app_id, ""
+            await asyncio.sleep(5)
+
+        print_yellow("登录超时，请重新尝试")
+        return app_id, "登录超时"
+
+    async def _get_and_validate_qr(self, app_id):
+        """获取并验证二维码数据，失败时返回 (None, None)"""
+        qr_response = await self.get_qr(app_id)
+        if qr_response.get('ret') != 200:
+            print_yellow(f"获取二维码失败:{qr_response}")
+            if (qr_response.get('data') or {}).get('msg') == 'EOF':
+                print_red("--------请关闭VPN后重试--------")
+            return None, None
+
+        qr_data = qr_response.get('data', {})
+        app_id = qr_data.get('appId')
+        uuid = qr_data.get('uuid')
+        if not app_id or not uuid:
+            print_yellow(f"app_id: {app_id}, uuid: {uuid}, 获取app_id或uuid失败")
+            return None, None
+        return app_id, uuid
+
+    async def aclose(self):
+        """关闭当前事件循环中的连接池"""
+        await close_clients(self.base_url)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
@@ -6,6 +6,7 @@ from .api.label_api import LabelApi
 from .api.login_api import LoginApi
 from .api.message_api import MessageApi
 from .api.personal_api import PersonalApi
+from .util.http_util import post_json as sync_post_json
 
 
 class GewechatClient:
@@ -31,15 +32,16 @@ class GewechatClient:
     注意: 在使用任何方法之前，请确保你已经正确初始化了客户端，并且有有效的 base_url 和 token。
     """
 
-    def __init__(self, base_url, token):
-        self._contact_api = ContactApi(base_url, token)
-        self._download_api = DownloadApi(base_url, token)
-        self._favor_api = FavorApi(base_url, token)
-        self._group_api = GroupApi(base_url, token)
-        self._label_api = LabelApi(base_url, token)
-        self._login_api = LoginApi(base_url, token)
-        self._message_api = MessageApi(base_url, token)
-        self._personal_api = PersonalApi(base_url, token)
+    def __init__(self, base_url, token, post_json=sync_post_json):
+        # post_json决定传输方式，各API类只负责组装参数，替换为异步实现即得到AsyncGewechatClient
+        self._contact_api = ContactApi(base_url, token, post_json)
+        self._download_api = DownloadApi(base_url, token, post_json)
+        self._favor_api = FavorApi(base_url, token, post_json)
+        self._group_api = GroupApi(base_url, token, post_json)
+        self._label_api = LabelApi(base_url, token, post_json)
+        self._login_api = LoginApi(base_url, token, post_json)
+        self._message_api = MessageApi(base_url, token, post_json)
+        self._personal_api = PersonalApi(base_url, token, post_json)
 
     def fetch_contacts_list(self, app_id):
         """获取通讯录列表"""
@@ -0,0 +1,75 @@
+import asyncio
+
+from . import http_util
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+    print("import httpx failed, AsyncGewechatClient will not be supported. Try: pip install httpx")
+
+# 异步连接池配置，单个事件循环可以同时驱动上百个请求
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 50
+
+# (base_url, 事件循环) -> httpx.AsyncClient，AsyncClient不能跨事件循环使用
+_clients = {}
+
+
+def get_client(base_url):
+    """获取当前事件循环中base_url对应的共享异步连接池"""
+    if httpx is None:
+        raise RuntimeError("httpx未安装，无法使用异步客户端")
+    key = (base_url, asyncio.get_running_loop())
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(max_connections=MAX_CONNECTIONS,
+                              max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+        client = httpx.AsyncClient(limits=limits)
+        _clients[key] = client
+    return client
+
+
+async def close_clients(base_url=None):
+    """关闭当前事件循环中的连接池，base_url为None时关闭全部"""
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _clients if k[1] is loop and (base_url is None or k[0] == base_url)]:
+        await _clients.pop(key).aclose()
+
+
+async def async_post_json(base_url, route, token, data):
+    headers = {
+        'Content-Type': 'application/json'
+    }
+    if token:
+        headers['X-GEWE-TOKEN'] = token
+
+    url = base_url + route
+    # 超时与重试策略与同步实现保持一致
+    timeout = http_util.ROUTE_TIMEOUTS.get(route, http_util.DEFAULT_TIMEOUT)
+    retries = http_util.MAX_RETRIES if route in http_util.IDEMPOTENT_ROUTES else 0
+
+    attempt = 0
+    while True:
+        try:
+            response = await get_client(base_url).post(url, json=data, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        except httpx.TransportError as e:
+            error = e
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code < 500:
+                print(f"http请求失败, url={url}, exception={e}")
+                raise RuntimeError(str(e))
+            error = e
+        except Exception as e:
+            print(f"http请求失败, url={url}, exception={e}")
+            raise RuntimeError(str(e))
+
+        if attempt >= retries:
+            print(f"http请求失败, url={url}, exception={error}")
+            raise RuntimeError(str(error))
+        attempt += 1
+        delay = http_util.RETRY_BACKOFF * (2 ** (attempt - 1))
+        print(f"http请求失败, {delay}秒后重试({attempt}/{retries}), url={url}, exception={error}")
+        await asyncio.sleep(delay)
@@ -1,4 +1,94 @@
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+# 连接池配置
+POOL_SIZE = 20
+DEFAULT_TIMEOUT = 60
+
+# 按接口设置的超时时间（秒），未列出的接口使用DEFAULT_TIMEOUT
+ROUTE_TIMEOUTS = {
+    "/contacts/getBriefInfo": 10,
+    "/contacts/getDetailInfo": 10,
+    "/contacts/fetchContactsList": 30,
+    "/group/getChatroomInfo": 10,
+    "/group/getChatroomMemberList": 15,
+    "/group/getChatroomMemberDetail": 15,
+    "/login/checkOnline": 10,
+    "/login/checkLogin": 10,
+    "/message/postText": 30,
+    "/message/postEmoji": 30,
+    "/message/downloadImage": 120,
+    "/message/downloadVoice": 120,
+    "/message/downloadVideo": 120,
+    "/message/downloadCdn": 120,
+}
+
+# 只读接口，失败时可以安全重试
+IDEMPOTENT_ROUTES = {
+    "/contacts/fetchContactsList",
+    "/contacts/getBriefInfo",
+    "/contacts/getDetailInfo",
+    "/contacts/search",
+    "/contacts/getPhoneAddressList",
+    "/favor/getContent",
+    "/group/getChatroomInfo",
+    "/group/getChatroomMemberList",
+    "/group/getChatroomMemberDetail",
+    "/group/getChatroomAnnouncement",
+    "/group/getChatroomQrCode",
+    "/label/list",
+    "/login/checkOnline",
+    "/login/checkLogin",
+    "/personal/getProfile",
+    "/personal/getQrCode",
+    "/personal/getSafetyInfo",
+}
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.5  # 第n次重试前等待 RETRY_BACKOFF * 2^(n-1) 秒
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def configure(pool_size=None, default_timeout=None, route_timeouts=None, max_retries=None):
+    """调整连接池大小、超时与重试次数，已创建的连接池会在下次请求时按新配置重建"""
+    global POOL_SIZE, DEFAULT_TIMEOUT, MAX_RETRIES
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if default_timeout is not None:
+        DEFAULT_TIMEOUT = default_timeout
+    if route_timeouts:
+        ROUTE_TIMEOUTS.update(route_timeouts)
+    if max_retries is not None:
+        MAX_RETRIES = max_retries
+    close_sessions()
+
+
+def get_session(base_url):
+    """获取base_url对应的长连接会话，同一个gewechat服务共用一个连接池"""
+    session = _sessions.get(base_url)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(base_url)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _sessions[base_url] = session
+    return session
+
+
+def close_sessions():
+    """关闭所有连接池"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
 
 def post_json(base_url, route, token, data):
     headers = {
@@ -8,17 +98,37 @@ def post_json(base_url, route, token, data):
         headers['X-GEWE-TOKEN'] = token
 
     url = base_url + route
+    timeout = ROUTE_TIMEOUTS.get(route, DEFAULT_TIMEOUT)
+    retries = MAX_RETRIES if route in IDEMPOTENT_ROUTES else 0
+
+    attempt = 0
+    while True:
+        try:
+            response = get_session(base_url).post(url, json=data, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            result = response.json()
+
+            if result.get('ret') == 200:
+                return result
+            else:
+                # raise RuntimeError(response.text)
+                return result
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        except requests.HTTPError as e:
+            # 只有服务端错误才重试
+            if e.response is None or e.response.status_code < 500:
+                print(f"http请求失败, url={url}, exception={e}")
+                raise RuntimeError(str(e))
+            error = e
+        except Exception as e:
+            print(f"http请求失败, url={url}, exception={e}")
+            raise RuntimeError(str(e))
 
-    try:
-        response = requests.post(url, json=data, headers=headers, timeout=60)
-        response.raise_for_status()
-        result = response.json()
-
-        if result.get('ret') == 200:
-            return result
-        else:
-            # raise RuntimeError(response.text)
-            return result
-    except Exception as e:
-        print(f"http请求失败, url={url}, exception={e}")
-        raise RuntimeError(str(e))
+        if attempt >= retries:
+            print(f"http请求失败, url={url}, exception={error}")
+            raise RuntimeError(str(error))
+        attempt += 1
+        delay = RETRY_BACKOFF * (2 ** (attempt - 1))
+        print(f"http请求失败, {delay}秒后重试({attempt}/{retries}), url={url}, exception={error}")
+        time.sleep(delay)
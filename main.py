@@ -9,34 +9,20 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import signal
 import threading
 from Core.Logger import Logger
-from Core.initializer import SystemInitializer, channel
-from Core.bridge.temp_dir import TmpDir
-from Core.song import song_api
+
+# 项目模块在函数中导入：转码进程池以spawn方式启动子进程时会以__mp_main__重新导入本文件，
+# 模块顶层导入Core.initializer会让每个子进程都加载配置、初始化gewechat客户端
 
 
 logger = Logger()
-tmp_dir = TmpDir()
 
 
 def cleanup_tmp_folder():
-    """清理tmp文件夹中的所有文件"""
+    """清理登记过的临时文件（tmp下的子目录，如SILK缓存，不受影响）"""
     logger.info("正在清理tmp文件夹...")
-    tmp_path = tmp_dir.path()
-    
     try:
-        # 获取tmp文件夹中的所有文件
-        files = [f for f in os.listdir(tmp_path) if os.path.isfile(os.path.join(tmp_path, f))]
-        
-        # 删除每个文件
-        for file in files:
-            file_path = os.path.join(tmp_path, file)
-            try:
-                os.remove(file_path)
-                logger.debug(f"已删除临时文件: {file}")
-            except Exception as e:
-                logger.error(f"删除文件 {file} 时出错: {str(e)}")
-        
-        logger.success(f"已清理 {len(files)} 个临时文件")
+        from Core.bridge.temp_files import TempFileManager
+        TempFileManager.get_instance().cleanup()
     except Exception as e:
         logger.error(f"清理tmp文件夹时出错: {str(e)}")
 
@@ -44,6 +30,13 @@ def cleanup_tmp_folder():
 def signal_handler(sig, frame):
     """处理程序终止信号"""
     logger.info("接收到终止信号，正在清理资源...")
+    from Core.bridge.message_dedup import MessageDeduplicator
+    from Core.conversation_store import ConversationStore
+    from Core.voice.transcoder import TranscodeService
+    ConversationStore.flush_all()
+    # 写入最近一次批量写入之后提交的消息ID，重启后gewechat的重试仍会被去重
+    MessageDeduplicator.stop_all()
+    TranscodeService.get_instance().shutdown(wait=False)
     cleanup_tmp_folder()
     sys.exit(0)
 
@@ -51,6 +44,7 @@ def start_song_api_server():
     """启动歌曲API服务器"""
     try:
         logger.info("正在启动歌曲API服务器...")
+        from Core.song import song_api
         song_api.run()
     except Exception as e:
         logger.error(f"歌曲API服务器启动失败: {str(e)}")
@@ -59,6 +53,7 @@ def start_song_api_server():
 def main():
     """主程序入口"""
     logger.info("wxChatBot 正在启动...")
+    from Core.initializer import SystemInitializer
     
     # 注册信号处理程序
     signal.signal(signal.SIGINT, signal_handler)